@@ -14,7 +14,7 @@ from django.core.asgi import get_asgi_application
 
 logger = logging.getLogger(__name__)
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mycloud.settings')
 
-logger.info
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
+logger.info("ASGI application loaded.")
@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Middleware for CORS handling
+    'mycloud_api.throttling.RateLimitHeadersMiddleware',  # RateLimit-* headers of throttled API requests
 ]
 
 # URL configuration
@@ -79,6 +80,9 @@ DATABASES = {
         'PASSWORD': os.getenv('DJANGO_DB_PASSWORD'),
         'HOST': os.getenv('DJANGO_DB_HOST', 'localhost'),
         'PORT': os.getenv('DJANGO_DB_PORT', 5432),
+        # Test databases are created from the models: replaying the historical migrations runs admin and
+        # authtoken's initial migrations before mycloud_api 0004 creates the custom user model they point to
+        'TEST': {'MIGRATE': False},
     }
 }
 
@@ -129,6 +133,114 @@ LOGGING = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# File storage settings
+# Where file content lives: 'mycloud_api.storage.LocalStorage' (MEDIA_ROOT) or
+# 'mycloud_api.storage.S3Storage' (an S3-compatible object store configured below)
+FILE_STORAGE_BACKEND = os.getenv('FILE_STORAGE_BACKEND', 'mycloud_api.storage.LocalStorage')
+STORAGES = {
+    'default': {'BACKEND': FILE_STORAGE_BACKEND},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', 'https://s3.amazonaws.com')
+S3_BUCKET = os.getenv('S3_BUCKET', 'mycloud')
+S3_REGION = os.getenv('S3_REGION', 'us-east-1')
+S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', '')
+S3_ADDRESSING_STYLE = os.getenv('S3_ADDRESSING_STYLE', 'path')  # 'path' (endpoint/bucket/key) or 'virtual' (bucket.endpoint/key)
+S3_POOL_SIZE = int(os.getenv('S3_POOL_SIZE', 32))  # Idle keep-alive connections kept per process
+S3_TIMEOUT = float(os.getenv('S3_TIMEOUT', 30))  # Seconds before a request to the object store times out
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv('S3_MULTIPART_CHUNK_SIZE', 16 * 1024 ** 2))  # Part size; larger files are uploaded in parts
+S3_UPLOAD_CONCURRENCY = int(os.getenv('S3_UPLOAD_CONCURRENCY', 4))  # Parts of one file uploaded at a time
+
+# File download settings
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024))  # Bytes per chunk when streaming from Python
+# Reverse-proxy offload: '' (serve from Python), 'x-accel-redirect' (Nginx) or 'x-sendfile' (Apache/lighttpd)
+DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD', '').lower()
+DOWNLOAD_OFFLOAD_PREFIX = os.getenv('DOWNLOAD_OFFLOAD_PREFIX', '/protected/')  # Nginx internal location aliased to MEDIA_ROOT
+# Seconds shared caches may serve a special link download without revalidating
+SPECIAL_LINK_CACHE_MAX_AGE = int(os.getenv('SPECIAL_LINK_CACHE_MAX_AGE', 5 * 60))
+# Seconds download statistics are held in memory before a bulk write (0 writes on every download)
+DOWNLOAD_STATS_FLUSH_INTERVAL = float(os.getenv('DOWNLOAD_STATS_FLUSH_INTERVAL', 5))
+# Download governor: concurrent streams per user and per special link (0 for no cap), counted in the cache
+DOWNLOAD_MAX_STREAMS_PER_USER = int(os.getenv('DOWNLOAD_MAX_STREAMS_PER_USER', 4))
+DOWNLOAD_MAX_STREAMS_PER_LINK = int(os.getenv('DOWNLOAD_MAX_STREAMS_PER_LINK', 8))
+DOWNLOAD_QUEUE_TIMEOUT = float(os.getenv('DOWNLOAD_QUEUE_TIMEOUT', 5))  # Seconds a download waits for a slot before a 503
+DOWNLOAD_SLOT_LEASE = int(os.getenv('DOWNLOAD_SLOT_LEASE', 5 * 60))  # Seconds a slot outlives a stream that stops refreshing it
+# Bytes per second per stream (also sent to Nginx as X-Accel-Limit-Rate), and shared fairly between
+# the users downloading from one worker process; 0 for no limit. Shaped streams are not sent with sendfile.
+DOWNLOAD_STREAM_RATE = int(os.getenv('DOWNLOAD_STREAM_RATE', 0))
+DOWNLOAD_WORKER_RATE = int(os.getenv('DOWNLOAD_WORKER_RATE', 0))
+
+# Upload handlers hashing files while they stream in (used for blob deduplication)
+FILE_UPLOAD_HANDLERS = [
+    'mycloud_api.uploadhandlers.Sha256MemoryFileUploadHandler',
+    'mycloud_api.uploadhandlers.Sha256TemporaryFileUploadHandler',
+]
+
+# Levels of two-hex-digit subdirectories under each user's directory (0 for one flat directory);
+# run migrate_storage_layout after changing it to move the existing files
+USER_FILES_FANOUT = int(os.getenv('USER_FILES_FANOUT', 2))
+
+# Store identical content once in the SHA-256 keyed blob store
+BLOB_DEDUPLICATION = os.getenv('BLOB_DEDUPLICATION', 'True').lower() == 'true'
+
+# At-rest compression settings
+# Store compressible uploads gzip-compressed; downloads pass the compressed bytes to clients accepting gzip
+AT_REST_COMPRESSION = os.getenv('AT_REST_COMPRESSION', 'False').lower() == 'true'
+COMPRESSION_SAMPLE_SIZE = int(os.getenv('COMPRESSION_SAMPLE_SIZE', 64 * 1024))  # Leading bytes compressed to decide
+COMPRESSION_MAX_RATIO = float(os.getenv('COMPRESSION_MAX_RATIO', 0.8))  # Compress when the sample shrinks to this fraction or less
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 4096))  # Smaller files are stored as they are
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))  # zlib level, 1 (fastest) to 9 (smallest)
+
+# Default per-user storage quota in bytes (0 for none); UserProfile.storage_quota overrides it
+STORAGE_QUOTA = int(os.getenv('STORAGE_QUOTA', 0)) or None
+
+# Cold tier settings
+# tier_files moves files not accessed for COLD_TIER_AFTER days to COLD_STORAGE_ROOT (e.g. a cheaper
+# mount); they move back to MEDIA_ROOT on their next access. Empty to keep every file in MEDIA_ROOT
+COLD_STORAGE_ROOT = os.getenv('COLD_STORAGE_ROOT', '')
+COLD_TIER_AFTER = int(os.getenv('COLD_TIER_AFTER', 90))  # Days without access before a file is moved
+COLD_TIER_BATCH_SIZE = int(os.getenv('COLD_TIER_BATCH_SIZE', 500))  # Files moved per transaction
+COLD_TIER_IO_RATE = int(os.getenv('COLD_TIER_IO_RATE', 50 * 1024 ** 2))  # Bytes per second copied at most (0 for no limit)
+
+# Trash settings
+# Deleted files stay in the trash (and count towards the owner's usage) until purge_trash removes them
+TRASH_RETENTION = int(os.getenv('TRASH_RETENTION', 30))  # Days a file is kept in the trash
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 1000))  # Rows deleted per transaction by purge_trash
+PURGE_WORKERS = int(os.getenv('PURGE_WORKERS', 8))  # Threads removing files from disk
+PURGE_UNLINK_RATE = int(os.getenv('PURGE_UNLINK_RATE', 500))  # Files removed per second at most (0 for no limit)
+
+# Resumable upload session settings
+UPLOAD_SESSION_MAX_SIZE = int(os.getenv('UPLOAD_SESSION_MAX_SIZE', 5 * 1024 ** 3))  # Largest upload accepted through sessions
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))  # Seconds of inactivity before a session expires
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes read from the request body at a time
+
+# Cache settings
+# Local memory (per process, least recently used entries evicted first) unless a shared
+# backend is configured, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache.
+# Throttling, download stream caps and token revocation need a shared backend to hold
+# across workers; the mycloud_api.W001/W002 checks warn when they run on a per-process one
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'mycloud'),
+    }
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))}
+# Seconds a cached file listing is kept; changes to the files invalidate it right away
+FILE_LIST_CACHE_TIMEOUT = int(os.getenv('FILE_LIST_CACHE_TIMEOUT', 5 * 60))
+
+# Image preview settings
+PREVIEW_SIZES = {'small': 160, 'medium': 480, 'large': 1280}  # Fixed preview widths in pixels
+PREVIEW_MAX_WIDTH = 2048  # Largest width accepted for on-demand previews
+PREVIEW_WORKERS = int(os.getenv('PREVIEW_WORKERS', 2))  # Processes rendering previews
+PREVIEW_CACHE_MAX_SIZE = int(os.getenv('PREVIEW_CACHE_MAX_SIZE', 1024 ** 3))  # Bytes of previews kept in MEDIA_ROOT/previews
+PREVIEW_CACHE_MAX_AGE = 24 * 60 * 60  # Seconds clients may reuse a preview without revalidating
+# Render the fixed sizes as soon as an image is uploaded
+PREVIEW_ON_UPLOAD = os.getenv('PREVIEW_ON_UPLOAD', 'True').lower() == 'true'
+
 # Local development site settings
 if DEBUG:
     SITE_URL = 'http://127.0.0.1:8000'
@@ -149,8 +261,29 @@ REST_FRAMEWORK = {
     ),
     'SEARCH_PARAM': 'q',
     'ORDERING_PARAM': 'o',
+    # Token buckets counted in the cache (use a shared CACHE_BACKEND so limits hold across workers)
+    'DEFAULT_THROTTLE_CLASSES': (
+        'mycloud_api.throttling.UserThrottle',  # Per authenticated user
+        'mycloud_api.throttling.AnonThrottle',  # Per client IP of unauthenticated requests
+        'mycloud_api.throttling.ScopedThrottle',  # Per view scope, per user or IP
+    ),
+    # Bursts of N requests refilled at N per period; an empty rate disables the limit
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.getenv('THROTTLE_USER_RATE', '600/minute') or None,
+        'anon': os.getenv('THROTTLE_ANON_RATE', '120/minute') or None,
+        'login': os.getenv('THROTTLE_LOGIN_RATE', '10/minute') or None,
+        'register': os.getenv('THROTTLE_REGISTER_RATE', '5/hour') or None,
+        'listing': os.getenv('THROTTLE_LISTING_RATE', '120/minute') or None,
+    },
+    # Reverse proxies in front of the app: the client IP is read from X-Forwarded-For past them
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# Signed (JWT) access tokens, verified without a database lookup
+SIGNED_TOKEN_ALGORITHM = 'HS256'
+SIGNED_TOKEN_ACCESS_TTL = int(os.getenv('SIGNED_TOKEN_ACCESS_TTL', 5 * 60))  # Seconds
+SIGNED_TOKEN_REFRESH_TTL = int(os.getenv('SIGNED_TOKEN_REFRESH_TTL', 7 * 24 * 60 * 60))  # Seconds
+
 # CORS (Cross-Origin Resource Sharing) settings
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:5173').split(',')
 
@@ -159,6 +292,7 @@ if not CORS_ALLOWED_ORIGINS:
     CORS_ALLOWED_ORIGINS = ["http://localhost:5173"]
 
 CORS_ALLOW_CREDENTIALS = True  # Allow sending cookies and other data
+CORS_EXPOSE_HEADERS = ['Retry-After', 'RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset']
 
 # IP addresses for Django Debug Toolbar usage
 INTERNAL_IPS = [
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .caching import bump_versions
+from .models import UserFile
+
+logger = logging.getLogger(__name__)
+
+# Rows updated per UPDATE statement when flushing
+FLUSH_BATCH_SIZE = 500
+
+
+class DownloadAccounting:
+    """
+    Write-behind accumulator for download statistics. Downloads are counted in
+    memory per process and written with one UPDATE per batch of files every
+    DOWNLOAD_STATS_FLUSH_INTERVAL seconds, instead of a row write per download.
+    Pending counters are flushed on interpreter shutdown; a crash loses at most
+    one interval of statistics. Cached listings of the owners are invalidated
+    after each write.
+    """
+    def __init__(self):
+        self._pending = {}  # file id -> [last_downloaded, download_count, bytes_served, owner id]
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._registered = False
+
+    def record(self, file_id, owner_id, nbytes):
+        now = timezone.now()
+        with self._lock:
+            entry = self._pending.setdefault(file_id, [now, 0, 0, owner_id])
+            entry[0] = max(entry[0], now)
+            entry[1] += 1
+            entry[2] += nbytes
+
+        if settings.DOWNLOAD_STATS_FLUSH_INTERVAL <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def flush(self):
+        """
+        Write all pending counters to the database. Counters that fail to be
+        written are kept for the next flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        items = list(pending.items())
+
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            try:
+                self._write(batch)
+            except DatabaseError as e:
+                logger.error("Error flushing download statistics: %s", str(e))
+                self._restore(items[start:])
+                return
+            bump_versions([entry[3] for _, entry in batch])
+        if items:
+            logger.debug("Flushed download statistics for %s files.", len(items))
+
+    def _write(self, batch):
+        last_downloaded = Case(*[When(pk=pk, then=Value(entry[0])) for pk, entry in batch])
+        # Never moved backwards by a flush from another process holding older downloads
+        last_downloaded = Greatest(Coalesce(F('last_downloaded'), last_downloaded), last_downloaded)
+        download_count = Case(*[When(pk=pk, then=Value(entry[1])) for pk, entry in batch], default=Value(0))
+        bytes_served = Case(*[When(pk=pk, then=Value(entry[2])) for pk, entry in batch], default=Value(0))
+        UserFile.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            last_downloaded=last_downloaded,
+            download_count=F('download_count') + download_count,
+            bytes_served=F('bytes_served') + bytes_served,
+        )
+
+    def _restore(self, items):
+        with self._lock:
+            for pk, (last, count, nbytes, owner_id) in items:
+                entry = self._pending.setdefault(pk, [last, 0, 0, owner_id])
+                entry[0] = max(entry[0], last)
+                entry[1] += count
+                entry[2] += nbytes
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='download-accounting', daemon=True)
+            self._thread.start()
+            if not self._registered:
+                atexit.register(self.shutdown)
+                self._registered = True
+
+    def _run(self):
+        while not self._wakeup.wait(settings.DOWNLOAD_STATS_FLUSH_INTERVAL):
+            self.flush()
+            connection.close()  # The flusher thread owns its own connection
+
+    def shutdown(self):
+        """
+        Stop the flusher thread and write what is still pending.
+        """
+        self._wakeup.set()
+        self.flush()
+
+
+download_accounting = DownloadAccounting()
+
+
+def record_download(request, user_file, response):
+    """
+    Count a download of ``user_file`` served by ``response``. HEAD requests
+    and failed or conditional (304) responses transfer no content and are not counted.
+    """
+    if request.method != 'GET' or response.status_code not in (200, 206):
+        return
+    if response.has_header('X-Accel-Redirect') or response.has_header('X-Sendfile'):
+        nbytes = user_file.size  # The proxy sends the file; assume a full transfer
+    else:
+        nbytes = int(response.get('Content-Length', 0))
+    download_accounting.record(user_file.pk, user_file.owner_id, nbytes)
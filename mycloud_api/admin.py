@@ -6,6 +6,7 @@ from django.contrib.auth import get_user_model
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import path, reverse
 from django.utils.crypto import get_random_string
+from .archives import archive_response
 from .forms import RegistrationForm, ProfileUpdateForm
 from .models import UserFile
 
@@ -22,7 +23,8 @@ class CustomUserAdmin(UserAdmin):
     form = ProfileUpdateForm  # Profile update form
     
     # Fields to display in the user list
-    list_display = ['id', 'username', 'first_name', 'last_name', 'email', 'file_storage_path', 'is_active', 'is_staff', 'is_superuser']
+    list_display = ['id', 'username', 'first_name', 'last_name', 'email', 'file_storage_path', 'storage_used', 'file_count',
+                    'storage_quota', 'is_active', 'is_staff', 'is_superuser']
 
     # Filters for the user list
     list_filter = ['is_staff', 'is_active', 'is_superuser']
@@ -33,8 +35,19 @@ class CustomUserAdmin(UserAdmin):
     # Adding custom field 'file_storage_path' to the user form
     fieldsets = UserAdmin.fieldsets + (
         (None, {'fields': ('file_storage_path',)}),  # Custom field
+        ('Storage', {'fields': ('storage_quota', 'storage_used', 'file_count')}),  # Usage counters and quota
     )
+
+    # Usage counters are maintained with the files
+    readonly_fields = ['storage_used', 'file_count']
     
+    def delete_queryset(self, request, queryset):
+        """
+        Delete users one at a time so that their files are removed set-based (see UserProfile.delete).
+        """
+        for user in queryset:
+            user.delete()
+
     # Fields when adding a new user
     add_fieldsets = UserAdmin.add_fieldsets + (
         (None, {'fields': ('file_storage_path',)}),  # Custom field
@@ -77,12 +90,24 @@ class FileAdmin(admin.ModelAdmin):
     Admin panel for managing user-uploaded files.
     """
     # Displayed fields
-    list_display = ['owner', 'original_filename', 'size', 'upload_date', 'last_downloaded', 'comment', 'file', 'special_link']
+    list_display = ['owner', 'original_filename', 'size', 'stored_size', 'codec', 'upload_date', 'last_downloaded', 'comment',
+                    'file', 'special_link', 'deleted_at']
     # Filters for the file list
-    list_filter = ['owner', 'original_filename']
+    list_filter = ['owner', 'original_filename', 'codec', 'cold', 'deleted_at']
     # Fields to search
     search_fields = ['owner__username', 'original_filename', 'comment']
 
+    def get_queryset(self, request):
+        # Files in the trash are listed too
+        return UserFile.all_objects.all()
+
+    def delete_queryset(self, request, queryset):
+        """
+        Delete the selected files for good with a few set-based statements.
+        """
+        deleted = UserFile.all_objects.delete_files(queryset)
+        logger.info("Admin %s deleted %s files.", request.user.username, deleted)
+
     # Add delete file action with logging
     def delete_model(self, request, obj):
         """
@@ -96,13 +121,11 @@ class FileAdmin(admin.ModelAdmin):
     # Add file download action
     def download_file(self, request, queryset):
         """
-        Add the ability to download files through the admin panel.
+        Download the selected files through the admin panel as one streamed ZIP archive.
         """
-        for file in queryset:
-            # Logic for downloading the file
-            pass  # Here could be the code to provide the file for download
-
-        self.message_user(request, "Files are ready for download.")
+        files = list(queryset.select_related('owner').order_by('owner__username', 'original_filename'))
+        logger.info("Admin %s downloading %s files as an archive.", request.user.username, len(files))
+        return archive_response(files, filename='selected_files.zip', by_owner=True)
     download_file.short_description = "Download selected files"
 
     # Add custom actions in the admin panel
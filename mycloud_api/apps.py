@@ -1,8 +1,19 @@
+import logging
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+logger = logging.getLogger(__name__)
 
 
 class MycloudApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mycloud_api'
 
+    def ready(self):
+        from .search import restore_fts_triggers
+        post_migrate.connect(restore_fts_triggers, sender=self)
 
+        # Registers the system checks; application servers do not run them, so their warnings are logged too
+        from .checks import check_shared_cache
+        for warning in check_shared_cache():
+            logger.warning("%s (%s) %s", warning.msg, warning.id, warning.hint)
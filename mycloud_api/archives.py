@@ -0,0 +1,123 @@
+import os
+import logging
+import zipfile
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from .accounting import download_accounting
+from .compression import open_content
+from .tiering import promote
+
+logger = logging.getLogger(__name__)
+
+# Formats that are already compressed and are stored as-is
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.gz', '.bz2', '.xz', '.7z', '.mp3', '.mp4')
+
+# Earliest timestamp a ZIP entry can carry
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class StreamBuffer:
+    """
+    Write-only, unseekable file object collecting what ZipFile writes until it
+    is drained into the response. ZipFile writes data descriptors after each
+    entry when it cannot seek back, so nothing has to be kept once sent.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive_entries(user_files, by_owner=False):
+    """
+    Describe the archive members for a set of UserFiles as (user file, name in
+    the archive) pairs. With ``by_owner`` each owner gets a folder. The storage
+    is not touched: cold files are promoted as stream_zip() reaches them.
+    """
+    entries = []
+    used = set()
+    for user_file in user_files:
+        name = user_file.original_filename
+        if by_owner:
+            name = f'{user_file.owner.username}/{name}'
+        base, extension = os.path.splitext(name)
+        counter = 1
+        while name in used:  # Names are unique per owner only
+            name = f'{base} ({counter}){extension}'
+            counter += 1
+        used.add(name)
+        entries.append((user_file, name))
+    return entries
+
+
+def zip_entry_info(user_file, name, size):
+    date_time = timezone.localtime(user_file.upload_date).timetuple()[:6] if user_file.upload_date else ZIP_EPOCH
+    info = zipfile.ZipInfo(name, date_time=max(date_time, ZIP_EPOCH))
+    info.compress_type = zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+    info.file_size = size  # Lets ZipFile switch the entry to ZIP64 when it needs to
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def stream_zip(entries, chunk_size):
+    """
+    Generate a ZIP archive of the entries chunk by chunk, promoting and reading
+    each file as it is written, so the first bytes go out before the files
+    further down the list are fetched from cold storage. Memory use does not
+    depend on the size of the archive. Files missing from the storage are left out.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for user_file, name in entries:
+            promote(user_file)
+            try:
+                stored = user_file.file.storage.stat(user_file.file.name)
+                source = open_content(user_file)
+            except FileNotFoundError:
+                logger.warning("File '%s' is missing from the storage and left out of the archive.",
+                               user_file.original_filename)
+                continue
+            with source:
+                size = user_file.size if user_file.codec else stored.size
+                with archive.open(zip_entry_info(user_file, name, size), 'w') as target:
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield buffer.drain()
+            yield buffer.drain()
+            download_accounting.record(user_file.pk, user_file.owner_id, size)
+    yield buffer.drain()  # Central directory
+
+
+def archive_response(user_files, filename='files.zip', by_owner=False):
+    """
+    Stream a ZIP archive of the given UserFiles without building it on disk or in memory.
+    """
+    entries = archive_entries(user_files, by_owner=by_owner)
+    logger.info("Streaming an archive of %s files.", len(entries))
+    response = StreamingHttpResponse(
+        (chunk for chunk in stream_zip(entries, settings.DOWNLOAD_CHUNK_SIZE) if chunk),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Cache-Control'] = 'no-store'
+    return response
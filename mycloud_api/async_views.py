@@ -0,0 +1,151 @@
+import math
+import logging
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed, Throttled, ValidationError
+from rest_framework.request import Request
+from .accounting import record_download
+from .authentication import NoExpirationTokenAuthentication
+from .caching import acached_data, aget_version, listing_etag, listing_scope, not_modified, set_listing_headers
+from .downloads import abuild_download_response, set_cache_control
+from .governor import DownloadsBusy, agoverned_download
+from .models import UserFile
+from .pagination import KeysetPagination
+from .serializers import FileSerializer
+from .throttling import check_throttles
+from .views import FileViewSet, files_for_user
+
+logger = logging.getLogger(__name__)
+
+authenticator = NoExpirationTokenAuthentication()
+
+
+def async_get(view):
+    """
+    Restrict an async view to GET/HEAD requests.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def async_token_required(view):
+    """
+    Authenticate an async view with the API token (signed or stored) and set
+    request.user, answering 403 like the DRF views when it is missing or invalid.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await authenticator.aauthenticate(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=403)
+        if result is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+        request.user, request.auth = result
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def async_throttled(scope=None):
+    """
+    Apply the API throttles to an async view (after authentication), with the
+    rate of ``scope`` on top of the per-user/per-IP ones. The shared buckets
+    are taken in one worker thread rather than one per cache operation.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            wait = await sync_to_async(check_throttles)(request, scope)
+            if wait is not None:
+                exc = Throttled(wait)
+                response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+                response['Retry-After'] = math.ceil(wait)
+                return response
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def busy_response(exc):
+    response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    response['Retry-After'] = exc.wait
+    return response
+
+
+# Async listing of the user's files, paginated like FileViewSet.list
+@async_get
+@async_token_required
+@async_throttled('listing')
+async def list_files(request):
+    logger.debug("Async request for files of user: %s", request.user.username)
+    drf_request = Request(request)
+
+    drf_request.user = request.user
+    view = FileViewSet(request=drf_request, args=(), kwargs={}, format_kwarg=None, action='list')
+
+    async def build():
+        paginator = KeysetPagination()
+        # Filtered, searched and ordered like FileViewSet.list; filters may look up the rows they name
+        files = await sync_to_async(view.filter_queryset)(files_for_user(request.user, request.GET))
+        queryset = paginator.page_queryset(files, drf_request, view)
+        page = paginator.set_results([file async for file in queryset])
+        data = FileSerializer(page, many=True, context={'request': drf_request}).data
+        return paginator.get_paginated_data(data)
+
+    scope = listing_scope(request.user, request.GET)
+    version = await aget_version(scope)
+    etag = listing_etag(scope, version)
+    response = not_modified(request, etag)
+    if response is None:
+        try:
+            response = JsonResponse(await acached_data(request, 'list', scope, version, build))
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=e.status_code, safe=False)
+    return set_listing_headers(response, etag)
+
+
+# Async download of one of the user's files
+@async_get
+@async_token_required
+@async_throttled()
+async def download_file(request, pk):
+    logger.debug("Async request to download file with ID %s.", pk)
+    try:
+        file = await files_for_user(request.user, request.GET).aget(pk=pk)
+    except UserFile.DoesNotExist:
+        raise Http404("File not found.")
+
+    try:
+        response = await agoverned_download(abuild_download_response, request, file, user=request.user)
+    except DownloadsBusy as e:
+        return busy_response(e)
+    response = set_cache_control(response, public=False)
+    await sync_to_async(record_download)(request, file, response)
+    logger.info("File with ID %s successfully downloaded.", pk)
+    return response
+
+
+# Async download of a file by its special link
+@async_get
+@async_throttled()
+async def download_file_by_special_link(request, special_link):
+    logger.debug("Async request to download file by special link: %s", special_link)
+    try:
+        file_instance = await UserFile.objects.aget(special_link=special_link)
+    except UserFile.DoesNotExist:
+        logger.error("File with special link '%s' not found.", special_link)
+        raise Http404("File not found.")
+
+    try:
+        response = await agoverned_download(abuild_download_response, request, file_instance, special_link=special_link)
+    except DownloadsBusy as e:
+        return busy_response(e)
+    response = set_cache_control(response, public=True)
+    await sync_to_async(record_download)(request, file_instance, response)
+    logger.info("File with special link '%s' successfully downloaded.", special_link)
+    return response
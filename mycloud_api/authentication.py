@@ -1,16 +1,62 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.authtoken.models import Token
+import jwt
 import logging
+from .tokens import ACCESS, decode_token, looks_like_signed_token, user_from_claims
 
 logger = logging.getLogger(__name__)
 
 class NoExpirationTokenAuthentication(BaseAuthentication):
     def authenticate(self, request):
+        token = self.get_token(request)
+        if token is None:
+            return None
+
+        # Signed access tokens carry the user and need no database lookup
+        if looks_like_signed_token(token):
+            return (self.get_user_from_signed_token(token), token)
+
+        # Insert your logic here to check and retrieve the user from the token
+        user = self.get_user_from_token(token)
+        if user is None:
+            logger.error("Invalid token: %s", token)
+            raise AuthenticationFailed('Invalid token.')
+
+        return (user, token)  # Return a tuple with the user and token
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of authenticate() for plain Django async views.
+        """
+        token = self.get_token(request)
+        if token is None:
+            return None
+
+        if looks_like_signed_token(token):
+            return (self.get_user_from_signed_token(token), token)
+
+        try:
+            token_instance = await Token.objects.select_related('user').aget(key=token)
+        except Token.DoesNotExist:
+            logger.error("Invalid token: %s", token)
+            raise AuthenticationFailed('Invalid token.')
+        return (token_instance.user, token)
+
+    def get_token(self, request):
+        """
+        Extract the token from the request, or return None when the request
+        carries no credentials.
+        """
         # Exclude token check for the login page
-        if request.path == '/api/auth/login/':  # Specify the path for your login endpoint
-            return None  # No token check needed for the login page
+        if request.path in ('/api/auth/login/', '/api/auth/refresh/', '/api/auth/logout/'):
+            return None  # The login and refresh pages issue tokens; logout checks the tokens it revokes
+        return self.get_header_token(request)
 
+    def get_header_token(self, request):
+        """
+        Extract the token from the Authorization header, or return None when there is none.
+        """
         # Get the authorization header
         auth = self.get_authorization_header(request)
         if not auth:
@@ -18,6 +64,9 @@ class NoExpirationTokenAuthentication(BaseAuthentication):
             return None  # If the header is missing, there's no authentication
 
         token = auth.strip()  # Remove any extra spaces at the beginning and end
+        scheme, _, credentials = token.partition(' ')
+        if credentials and scheme.lower() in ('token', 'bearer'):
+            token = credentials.strip()  # Accept "Token <key>" and "Bearer <key>" as well as the bare key
 
         # Check if the token exists
         if not token:
@@ -26,14 +75,7 @@ class NoExpirationTokenAuthentication(BaseAuthentication):
 
         # Log the token (this helps us understand what is going on)
         logger.debug("Received token: %s", token)
-
-        # Insert your logic here to check and retrieve the user from the token
-        user = self.get_user_from_token(token)
-        if user is None:
-            logger.error("Invalid token: %s", token)
-            raise AuthenticationFailed('Invalid token.')
-
-        return (user, token)  # Return a tuple with the user and token
+        return token
 
     def get_authorization_header(self, request):
         """
@@ -49,9 +91,24 @@ class NoExpirationTokenAuthentication(BaseAuthentication):
         """
         try:
             # Look for the token in the database using DRF's Token model
-            token_instance = Token.objects.get(key=token)
+            token_instance = Token.objects.select_related('user').get(key=token)
             logger.debug("Found user: %s for token: %s", token_instance.user.username, token)
             return token_instance.user  # Return the user associated with the token
         except Token.DoesNotExist:
             logger.error("Token not found: %s", token)
             return None
+
+    def get_user_from_signed_token(self, token):
+        """
+        Verify a signed access token and build the user from its claims.
+        """
+        try:
+            claims = decode_token(token, ACCESS)
+        except jwt.ExpiredSignatureError:
+            raise AuthenticationFailed('Token has expired.')
+        except jwt.InvalidTokenError as e:
+            logger.error("Invalid signed token: %s", str(e))
+            raise AuthenticationFailed('Invalid token.')
+        if not claims.get('is_active', True):
+            raise AuthenticationFailed('User inactive or deleted.')
+        return user_from_claims(claims)
@@ -0,0 +1,92 @@
+import uuid
+import logging
+from django.db import transaction
+from rest_framework import status
+from .caching import bump_versions
+from .models import UserFile
+from .serializers import BatchOperationSerializer, FileSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def apply_batch(user, operations, serializer_context):
+    """
+    Validate and apply delete, rename and comment operations on the user's
+    files in one transaction. Operations on missing or foreign files, and
+    invalid operations, are reported and skipped; the others are applied with
+    one UPDATE moving deleted files to the trash and one bulk UPDATE.
+    Returns one result per operation, in order.
+    """
+    parsed = [BatchOperationSerializer(data=operation if isinstance(operation, dict) else {})
+              for operation in operations]
+    valid = [serializer.validated_data for serializer in parsed if serializer.is_valid()]
+    results = [None] * len(parsed)
+
+    with transaction.atomic():
+        # One query resolves every file the user may change
+        files = UserFile.objects.select_for_update().filter(
+            owner=user, pk__in={operation['id'] for operation in valid}
+        ).in_bulk()
+        # Current holders of every name involved, to check uniqueness without a query per rename
+        new_names = {operation['new_name'] for operation in valid if operation['op'] == 'rename'}
+        names = dict(UserFile.objects.filter(owner=user, original_filename__in=new_names)
+                     .values_list('original_filename', 'pk'))
+        names.update({file.original_filename: pk for pk, file in files.items()})
+
+        deleted, changed, renamed = set(), {}, set()
+        for index, serializer in enumerate(parsed):
+            if serializer.errors:
+                raw = operations[index] if isinstance(operations[index], dict) else {}
+                results[index] = {'id': raw.get('id'), 'op': raw.get('op'),
+                                  'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+                continue
+            operation = serializer.validated_data
+            result = {'id': operation['id'], 'op': operation['op']}
+            results[index] = result
+            file = files.get(operation['id'])
+            if file is None or file.pk in deleted:
+                result.update(status=status.HTTP_404_NOT_FOUND, detail="File not found.")
+                continue
+
+            if operation['op'] == 'delete':
+                deleted.add(file.pk)
+                changed.pop(file.pk, None)
+                renamed.discard(file.pk)
+                names.pop(file.original_filename, None)
+                result['status'] = status.HTTP_204_NO_CONTENT
+            elif operation['op'] == 'rename':
+                holder = names.get(operation['new_name'])
+                if holder is not None and holder != file.pk:
+                    result.update(status=status.HTTP_400_BAD_REQUEST, detail="A file with this name already exists.")
+                    continue
+                names.pop(file.original_filename, None)
+                names[operation['new_name']] = file.pk
+                file.original_filename = operation['new_name']
+                renamed.add(file.pk)
+                changed[file.pk] = file
+                result.update(status=status.HTTP_200_OK, file=file)
+            else:
+                file.comment = operation['comment']
+                changed[file.pk] = file
+                result.update(status=status.HTTP_200_OK, file=file)
+
+        if deleted:
+            UserFile.objects.trash(UserFile.objects.filter(pk__in=deleted))
+        if changed:
+            # Name uniqueness is checked row by row, so a rename into a name freed by
+            # another rename of the batch (a chain or a swap) could meet the old holder
+            # still in place: every renamed file first moves to a unique placeholder
+            if renamed:
+                UserFile.objects.bulk_update(
+                    [UserFile(pk=pk, original_filename=f'.batch-{uuid.uuid4().hex}') for pk in renamed],
+                    ['original_filename']
+                )
+            UserFile.objects.bulk_update(list(changed.values()), ['original_filename', 'comment'])
+            transaction.on_commit(lambda: bump_versions([user.pk]))
+
+    for result in results:
+        if 'file' in result:
+            result['file'] = FileSerializer(result['file'], context=serializer_context).data
+    logger.info("Batch of %s operations applied for user %s: %s deleted, %s changed.",
+                len(parsed), user.pk, len(deleted), len(changed))
+    return results
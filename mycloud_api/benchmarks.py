@@ -0,0 +1,287 @@
+import os
+import sys
+import math
+import time
+import hashlib
+import logging
+import platform
+import tempfile
+import threading
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .models import UserFile, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Scenarios in the order they run: uploads last, so the corpus the others read stays as generated
+SCENARIOS = ('my_files', 'download_file', 'download_file_by_special_link', 'login_user', 'perform_create')
+
+# Scenarios transferring file content, for which the peak RSS is reported
+TRANSFERS = ('download_file', 'download_file_by_special_link', 'perform_create')
+
+# Metrics compared against a baseline, with the direction in which they improve
+METRICS = {
+    'throughput_rps': 'higher',
+    'bytes_per_second': 'higher',
+    'p50_ms': 'lower',
+    'p99_ms': 'lower',
+    'peak_rss_bytes': 'lower',
+}
+
+PASSWORD = 'benchmark-password'
+
+# Seconds between two samples of the resident set size
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile ``q`` (0-100) of sorted ``values``.
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """
+    Samples the resident set size of the process in a background thread while
+    a scenario runs, keeping the peak.
+    """
+    def __init__(self):
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = current_rss()
+            if rss is not None and rss > (self.peak or 0):
+                self.peak = rss
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+class Benchmark:
+    """
+    Measures the throughput and latency of the upload, download, listing and
+    login endpoints through the full request stack (Django test client), on
+    a throwaway test database of the configured engine (SQLite or Postgres)
+    filled with ``users`` synthetic users owning ``files`` files of
+    ``file_size`` random bytes each. Files are written to a temporary
+    MEDIA_ROOT. Throttling, download caps and previews on upload are turned
+    off so they do not skew the numbers.
+    """
+    def __init__(self, users=5, files=50, file_size=64 * 1024, requests=100, warmup=5, scenarios=SCENARIOS,
+                 report=None):
+        self.users = users
+        self.files = files
+        self.file_size = file_size
+        self.requests = requests
+        self.warmup = warmup
+        self.scenarios = [name for name in SCENARIOS if name in scenarios]
+        self.report = report or (lambda message: None)
+
+    def run(self):
+        """
+        Run the scenarios and return the results, ready to be saved as a JSON baseline.
+        """
+        with tempfile.TemporaryDirectory(prefix='mycloud-benchmark-') as media_root, self.environment(media_root):
+            # Tables are created straight from the models, which is quicker than replaying the migrations
+            test_settings = connection.settings_dict.setdefault('TEST', {})
+            migrate, test_settings['MIGRATE'] = test_settings.get('MIGRATE', True), False
+            try:
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            finally:
+                test_settings['MIGRATE'] = migrate
+            try:
+                self.build_corpus()
+                results = {}
+                for name in self.scenarios:
+                    cache.clear()
+                    self.report(f"Running {name} ({self.requests} requests)...")
+                    results[name] = self.measure(name, getattr(self, f'scenario_{name}')())
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        return {'meta': self.meta(), 'results': results}
+
+    def environment(self, media_root):
+        return override_settings(
+            MEDIA_ROOT=media_root,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            PREVIEW_ON_UPLOAD=False,
+            DOWNLOAD_MAX_STREAMS_PER_USER=0,
+            DOWNLOAD_MAX_STREAMS_PER_LINK=0,
+            DOWNLOAD_STREAM_RATE=0,
+            DOWNLOAD_WORKER_RATE=0,
+            STORAGE_QUOTA=None,
+            REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                'DEFAULT_THROTTLE_RATES': {scope: None for scope in settings.REST_FRAMEWORK.get(
+                    'DEFAULT_THROTTLE_RATES', {})},
+            },
+        )
+
+    def meta(self):
+        return {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'platform': sys.platform,
+            'users': self.users,
+            'files': self.files,
+            'file_size': self.file_size,
+            'requests': self.requests,
+        }
+
+    def build_corpus(self):
+        """
+        Create the users, their tokens and their files, with distinct random content.
+        """
+        self.report(f"Creating {self.users} users with {self.files} files of {self.file_size} bytes each...")
+        password = make_password(PASSWORD)  # Hashed once: hashing is what login_user measures
+        self.clients, self.owners, self.file_ids, self.links = [], [], [], []
+        for n in range(self.users):
+            user = UserProfile.objects.create(username=f'benchmark{n}', email=f'benchmark{n}@example.com',
+                                              password=password)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+            self.clients.append(client)
+            for i in range(self.files):
+                data = os.urandom(self.file_size)
+                user_file = UserFile(owner=user, original_filename=f'file{i}.png', size=len(data))
+                user_file.set_content(ContentFile(data, name=f'file{i}.png'), hashlib.sha256(data).hexdigest())
+                user_file.save()
+                self.owners.append(len(self.clients) - 1)
+                self.file_ids.append(user_file.pk)
+                self.links.append(user_file.special_link)
+
+    def measure(self, name, scenario):
+        """
+        Time ``requests`` calls of ``scenario(i)``, after ``warmup`` untimed ones.
+        A scenario returns its response and the status it expects.
+        """
+        for i in range(self.warmup):
+            self.call(scenario, i)
+        latencies, errors, transferred = [], 0, 0
+        with RssSampler() as rss:
+            started = time.perf_counter()
+            for i in range(self.requests):
+                begin = time.perf_counter()
+                ok, size = self.call(scenario, self.warmup + i)
+                latencies.append(time.perf_counter() - begin)
+                errors += not ok
+                transferred += size
+            elapsed = time.perf_counter() - started
+        latencies.sort()
+        result = {
+            'requests': self.requests,
+            'errors': errors,
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(self.requests / elapsed, 2) if elapsed else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        }
+        if name in TRANSFERS:
+            result['bytes_per_second'] = round(transferred / elapsed) if elapsed else None
+            result['peak_rss_bytes'] = rss.peak
+        if errors:
+            logger.warning("Benchmark %s: %s of %s requests failed.", name, errors, self.requests)
+        return result
+
+    def call(self, scenario, i):
+        response, expected, sent = scenario(i)
+        try:
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+        finally:
+            response.close()
+        return response.status_code == expected, max(size, sent)
+
+    def scenario_my_files(self):
+        url = reverse('files-my-files')
+        return lambda i: (self.clients[i % self.users].get(url), 200, 0)
+
+    def scenario_download_file(self):
+        def request(i):
+            n = i % len(self.file_ids)
+            client = self.clients[self.owners[n]]
+            return client.get(reverse('files-download-file', args=[self.file_ids[n]])), 200, 0
+        return request
+
+    def scenario_download_file_by_special_link(self):
+        client = APIClient()
+        return lambda i: (client.get(reverse('download_file', args=[self.links[i % len(self.links)]])), 200, 0)
+
+    def scenario_login_user(self):
+        client = APIClient()
+        url = reverse('login_user')
+        return lambda i: (
+            client.post(url, {'username': f'benchmark{i % self.users}', 'password': PASSWORD}, format='json'), 200, 0
+        )
+
+    def scenario_perform_create(self):
+        url = reverse('files-list')
+
+        def request(i):
+            data = os.urandom(self.file_size)
+            upload = SimpleUploadedFile(f'upload{i}.png', data)
+            response = self.clients[i % self.users].post(
+                url, {'file': upload, 'original_filename': upload.name, 'size': len(data)}, format='multipart'
+            )
+            return response, 201, len(data)
+        return request
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare a run with a baseline. Returns (scenario, metric, baseline value,
+    current value, relative change, regressed) rows, a metric having regressed
+    when it got worse by more than ``threshold`` (a fraction).
+    """
+    rows = []
+    for name, result in current['results'].items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            continue
+        for metric, better in METRICS.items():
+            before, after = reference.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if better == 'higher' else change
+            rows.append((name, metric, before, after, change, worse > threshold))
+    return rows
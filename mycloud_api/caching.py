@@ -0,0 +1,99 @@
+import hashlib
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+logger = logging.getLogger(__name__)
+
+# Scope of listings spanning all users (superuser views)
+ALL_FILES = 'all'
+
+
+def listing_scope(user, query_params):
+    """
+    The set of files a listing depends on: one owner's files, or all files.
+    Mirrors files_for_user().
+    """
+    if user.is_superuser:
+        return query_params.get('user_id', None) or ALL_FILES
+    return user.pk
+
+
+def get_version(scope):
+    from .models import ListingVersion  # The models import bump_versions from here
+    return ListingVersion.objects.current(str(scope))
+
+
+async def aget_version(scope):
+    from .models import ListingVersion
+    return await ListingVersion.objects.acurrent(str(scope))
+
+
+def bump_versions(owner_ids):
+    """
+    Invalidate every cached listing and file of the given owners (and the
+    listings spanning all users). The versions live in the database, so the
+    change is seen by all workers; stale entries are left to expire.
+    """
+    from .models import ListingVersion
+    ListingVersion.objects.bump([str(scope) for scope in {*owner_ids, ALL_FILES}])
+
+
+def listing_etag(scope, version, key=None):
+    """
+    Weak ETag shared by all cached responses of a scope, or with ``key`` by
+    the responses about one object in it; it changes with any change to the
+    files in the scope.
+    """
+    tag = f'{scope}:{version}' if key is None else f'{scope}:{version}:{key}'
+    return 'W/"%s"' % hashlib.sha256(tag.encode()).hexdigest()[:24]
+
+
+def not_modified(request, etag):
+    """
+    Return a 304 response when the client's copy is still current, else None.
+    """
+    return get_conditional_response(request, etag=etag)
+
+
+def set_listing_headers(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)  # Revalidate with If-None-Match on every poll
+    return response
+
+
+def data_key(request, kind, scope, version):
+    # The full URL covers the query parameters and the host used in absolute links
+    digest = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()
+    return f'file_{kind}:{scope}:{version}:{digest}'
+
+
+def cached_data(request, kind, scope, version, build):
+    """
+    Return the response data built by ``build()`` for this request, from the
+    cache while none of the files in ``scope`` have changed. The version must be
+    read before the data so that a concurrent change is never hidden.
+    """
+    key = data_key(request, kind, scope, version)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=settings.FILE_LIST_CACHE_TIMEOUT)
+    else:
+        logger.debug("Serving cached file %s for scope %s.", kind, scope)
+    return data
+
+
+async def acached_data(request, kind, scope, version, build):
+    """
+    Async counterpart of cached_data(); ``build`` is a coroutine function.
+    """
+    key = data_key(request, kind, scope, version)
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, timeout=settings.FILE_LIST_CACHE_TIMEOUT)
+    else:
+        logger.debug("Serving cached file %s for scope %s.", kind, scope)
+    return data
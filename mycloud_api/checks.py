@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+from rest_framework.settings import api_settings
+
+# Cache backends whose entries are private to each worker process
+PER_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+SHARED_CACHE_HINT = "Configure a cache every worker shares, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache."
+
+
+def throttling_enabled():
+    rates = api_settings.DEFAULT_THROTTLE_RATES or {}
+    return bool(api_settings.DEFAULT_THROTTLE_CLASSES) and any(rates.values())
+
+
+def stream_caps_enabled():
+    return bool(settings.DOWNLOAD_MAX_STREAMS_PER_USER or settings.DOWNLOAD_MAX_STREAMS_PER_LINK)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs=None, **kwargs):
+    """
+    Warn when limits counted in the cache run on a per-process cache: with N
+    workers, each keeps its own counters and clients get N times the limit.
+    """
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if not isinstance(cache, PER_PROCESS_CACHES):
+        return []
+    backend = f'{type(cache).__module__}.{type(cache).__name__}'
+    warnings = []
+    if throttling_enabled():
+        warnings.append(Warning(
+            f"API throttling keeps its token buckets in the per-process cache {backend}; "
+            "every worker allows the full rate on its own.",
+            hint=SHARED_CACHE_HINT,
+            id='mycloud_api.W001',
+        ))
+    if stream_caps_enabled():
+        warnings.append(Warning(
+            f"Download stream caps keep their slots in the per-process cache {backend}; "
+            "every worker allows the full number of streams on its own.",
+            hint=SHARED_CACHE_HINT,
+            id='mycloud_api.W002',
+        ))
+    return warnings
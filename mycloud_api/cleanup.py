@@ -0,0 +1,107 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Spaces operations shared by several threads to at most ``rate`` per second
+    (no limit when ``rate`` is 0), so bulk removals leave disk I/O for requests.
+    """
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(self._next, now)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def remove_file(name, limiter=None):
+    """
+    Remove a file, given by its storage name, from the storage. Returns whether it was removed.
+    """
+    if limiter is not None:
+        limiter.wait()
+    try:
+        return default_storage.remove(name)
+    except Exception as e:
+        logger.error(f"Error deleting file '{name}': {str(e)}")
+        return False
+
+
+def remove_files(names, workers=None, rate=None):
+    """
+    Remove files from disk with ``workers`` threads (PURGE_WORKERS by default),
+    at most ``rate`` per second (PURGE_UNLINK_RATE by default).
+    Returns the number of files removed.
+    """
+    workers = workers or settings.PURGE_WORKERS
+    limiter = RateLimiter(settings.PURGE_UNLINK_RATE if rate is None else rate)
+    if workers == 1 or len(names) < 2:
+        return sum(remove_file(name, limiter) for name in names)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='file-removal') as executor:
+        return sum(executor.map(lambda name: remove_file(name, limiter), names))
+
+
+class BackgroundRemover:
+    """
+    Removes files from disk in a background thread, so that deleting many
+    files does not hold up the request. Removals are paced by
+    PURGE_UNLINK_RATE; files still queued when the process exits are removed
+    on shutdown without pacing.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def remove_later(self, names):
+        if not names:
+            return
+        self._queue.put(list(names))
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='file-removal', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        limiter = RateLimiter(settings.PURGE_UNLINK_RATE)
+        while True:
+            names = self._queue.get()
+            if names is None:
+                return
+            removed = sum(remove_file(name, None if self._stopping.is_set() else limiter) for name in names)
+            logger.info("Removed %s deleted files from disk.", removed)
+
+    def shutdown(self):
+        """
+        Remove what is still queued and stop the worker.
+        """
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+background_remover = BackgroundRemover()
@@ -0,0 +1,122 @@
+import zlib
+import logging
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+logger = logging.getLogger(__name__)
+
+# At-rest codecs, named after the HTTP content coding of the stored bytes
+CODEC_GZIP = 'gzip'
+CODEC_CHOICES = [('', 'None'), (CODEC_GZIP, 'gzip')]
+
+# zlib window bits selecting the gzip container
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Bytes of stored data decompressed at a time, bounding memory use per stream
+READ_SIZE = 64 * 1024
+
+
+def choose_codec(content):
+    """
+    Decide how to store an upload by compressing its first
+    COMPRESSION_SAMPLE_SIZE bytes: content shrinking to at most
+    COMPRESSION_MAX_RATIO of its size is stored gzip-compressed.
+    Returns the codec, '' to store the content as it is.
+    """
+    if not settings.AT_REST_COMPRESSION or content.size < settings.COMPRESSION_MIN_SIZE:
+        return ''
+    content.seek(0)
+    sample = content.read(settings.COMPRESSION_SAMPLE_SIZE)
+    content.seek(0)
+    if not sample:
+        return ''
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    logger.debug("Sample of '%s' compresses to %.2f of its size.", content.name, ratio)
+    return CODEC_GZIP if ratio <= settings.COMPRESSION_MAX_RATIO else ''
+
+
+def encode_content(content):
+    """
+    Return the codec, the file to store and its size for an upload. Compressed
+    content is written to a temporary file, chunk by chunk; content that turns
+    out not to shrink is stored as it is.
+    """
+    codec = choose_codec(content)
+    if not codec:
+        return '', content, content.size
+
+    compressor = zlib.compressobj(settings.COMPRESSION_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    encoded = TemporaryUploadedFile(content.name, 'application/gzip', 0, None)
+    for chunk in content.chunks():
+        encoded.write(compressor.compress(chunk))
+    encoded.write(compressor.flush())
+    encoded.flush()
+    encoded.size = encoded.tell()
+    encoded.seek(0)
+    content.seek(0)
+
+    if encoded.size >= content.size:
+        encoded.close()
+        return '', content, content.size
+    logger.info("Compressed '%s' from %s to %s bytes.", content.name, content.size, encoded.size)
+    return codec, encoded, encoded.size
+
+
+class DecodingReader:
+    """
+    File-like object reading the decompressed content of stored gzip data,
+    READ_SIZE bytes of input at a time.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decompressor = zlib.decompressobj(GZIP_WBITS)
+
+    def read(self, size=-1):
+        parts, total = [], 0
+        while size < 0 or total < size:
+            if self.decompressor.eof:
+                break
+            data = self.decompressor.unconsumed_tail or self.fileobj.read(READ_SIZE)
+            if not data:
+                break
+            output = self.decompressor.decompress(data, size - total if size > 0 else READ_SIZE)
+            parts.append(output)
+            total += len(output)
+        return b''.join(parts)
+
+    def close(self):
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_content(user_file):
+    """
+    Open the logical (decompressed) content of a UserFile for reading.
+    """
+    fileobj = user_file.file.storage.open(user_file.file.name, 'rb')
+    return DecodingReader(fileobj) if user_file.codec else fileobj
+
+
+def accepts_encoding(request, codec):
+    """
+    Check whether the request's Accept-Encoding allows ``codec`` (a q-value of 0 refuses it).
+    """
+    accepted = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted.get(codec, accepted.get('*', 0.0)) > 0
@@ -0,0 +1,461 @@
+import os
+import re
+import asyncio
+import uuid
+import logging
+import mimetypes
+from functools import partial
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from .compression import accepts_encoding, open_content
+
+logger = logging.getLogger(__name__)
+
+# Reverse-proxy offload modes (settings.DOWNLOAD_OFFLOAD)
+OFFLOAD_X_ACCEL_REDIRECT = 'x-accel-redirect'  # Nginx
+OFFLOAD_X_SENDFILE = 'x-sendfile'  # Apache mod_xsendfile, lighttpd
+
+# Upper bound on the number of ranges served in one multipart/byteranges response
+MAX_RANGES = 16
+
+RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def guess_content_type(filename):
+    """
+    Guess the Content-Type of a download from its original file name.
+    """
+    content_type, _ = mimetypes.guess_type(filename)
+    return content_type or 'application/octet-stream'
+
+
+def file_validators(user_file, stored, encoding=''):
+    """
+    Return the strong ETag and the Last-Modified value for a stored file.
+    Deduplicated files are named by their SHA-256 digest, which is used as the ETag.
+    The compressed representation of a file (``encoding``) gets its own ETag.
+    """
+    if user_file.blob_id:
+        etag = f'"{os.path.basename(user_file.file.name)}"'
+    else:
+        etag = f'"{stored.size:x}-{stored.mtime_ns:x}"'
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+    return etag, http_date(stored.mtime)
+
+
+def served_encoding(request, user_file):
+    """
+    Return the content coding a download is served with: the stored codec when
+    the client accepts it, so the compressed bytes are sent as they are, and
+    '' for the identity coding (decompressing on the fly if need be).
+    """
+    if user_file.codec and accepts_encoding(request, user_file.codec):
+        return user_file.codec
+    return ''
+
+
+def set_encoding(response, user_file, encoding):
+    """
+    Label the coding of a download; responses for compressed files vary with Accept-Encoding.
+    """
+    if user_file.codec:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    if encoding and response.status_code in (200, 206):
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header into a sorted list of inclusive
+    (start, end) pairs with overlapping ranges merged.
+    Returns None when the header should be ignored (malformed, foreign unit or
+    too many ranges) and an empty list when no range is satisfiable.
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:
+            # Suffix range: the last N bytes of the file
+            start = max(size - int(last), 0)
+            end = size - 1
+            if int(last) == 0:
+                continue
+        if start < size:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_is_fresh(request, etag, last_modified):
+    """
+    Check the If-Range precondition: the Range header is only honoured when the
+    client's validator still matches the current file (strong comparison).
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == parse_http_date_safe(last_modified)
+
+
+def offload_response(user_file, path):
+    """
+    Build an empty response that tells the reverse proxy to send the file itself,
+    so the worker never reads the file content.
+    """
+    response = HttpResponse(content_type=guess_content_type(user_file.original_filename))
+    set_offload_headers(response, user_file.file.name, path)
+    response['Content-Disposition'] = content_disposition_header(True, user_file.original_filename)
+    return response
+
+
+def set_offload_headers(response, name, path):
+    """
+    Point the reverse proxy at a file under MEDIA_ROOT, ``name`` being its
+    path relative to MEDIA_ROOT.
+    """
+    if settings.DOWNLOAD_OFFLOAD == OFFLOAD_X_ACCEL_REDIRECT:
+        prefix = settings.DOWNLOAD_OFFLOAD_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(name.replace(os.sep, "/"))}'
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def stream_response(user_file, stored, byte_range=None):
+    """
+    Build a response that streams the file, or one range of it, in chunks of
+    DOWNLOAD_CHUNK_SIZE bytes. FileResponse exposes the open file to the server,
+    so WSGI servers providing ``wsgi.file_wrapper`` (e.g. Gunicorn) send files
+    on the local disk with zero-copy ``os.sendfile``; ranges of objects in a
+    remote store are fetched with ranged reads.
+    """
+    storage = user_file.file.storage
+    if byte_range is None:
+        response = FileResponse(
+            storage.open(stored.name, 'rb'), as_attachment=True, filename=user_file.original_filename
+        )
+        response['Content-Length'] = stored.size
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            storage.open_range(stored.name, start, end),
+            as_attachment=True,
+            filename=user_file.original_filename,
+            status=206,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stored.size}'
+    response.block_size = settings.DOWNLOAD_CHUNK_SIZE
+    return response
+
+
+def decoded_response(user_file):
+    """
+    Build a response streaming the decompressed content of a compressed file.
+    The decoded representation is not seekable, so it is always sent whole.
+    """
+    response = FileResponse(open_content(user_file), as_attachment=True, filename=user_file.original_filename)
+    response['Content-Length'] = user_file.size
+    response.block_size = settings.DOWNLOAD_CHUNK_SIZE
+    return response
+
+
+class MultipartRanges:
+    """
+    Layout of a ``multipart/byteranges`` body: the part headers preceding each
+    range, the closing delimiter and the resulting Content-Length.
+    """
+    def __init__(self, user_file, size, ranges):
+        self.ranges = ranges
+        self.boundary = uuid.uuid4().hex
+        content_type = guess_content_type(user_file.original_filename)
+        self.part_headers = [
+            (
+                f'--{self.boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode('ascii')
+            for start, end in ranges
+        ]
+        self.closing = f'--{self.boundary}--\r\n'.encode('ascii')
+        self.content_length = len(self.closing) + sum(
+            len(header) + (end - start + 1) + 2 for header, (start, end) in zip(self.part_headers, ranges)
+        )
+
+    def response(self, user_file, streaming_content):
+        response = StreamingHttpResponse(
+            streaming_content, status=206, content_type=f'multipart/byteranges; boundary={self.boundary}'
+        )
+        response['Content-Length'] = self.content_length
+        response['Content-Disposition'] = content_disposition_header(True, user_file.original_filename)
+        return response
+
+
+def read_range(f, chunk_size):
+    """
+    Yield the content of an open range in chunks, closing it at the end.
+    """
+    try:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        f.close()
+
+
+def multipart_ranges_response(user_file, stored, ranges):
+    """
+    Build a ``206 multipart/byteranges`` response streaming several ranges of
+    the file, each preceded by its own part headers.
+    """
+    storage = user_file.file.storage
+    layout = MultipartRanges(user_file, stored.size, ranges)
+
+    def stream():
+        for header, (start, end) in zip(layout.part_headers, ranges):
+            yield header
+            yield from read_range(storage.open_range(stored.name, start, end), settings.DOWNLOAD_CHUNK_SIZE)
+            yield b'\r\n'
+        yield layout.closing
+
+    return layout.response(user_file, stream())
+
+
+def range_not_satisfiable_response(size):
+    """
+    Build the ``416 Range Not Satisfiable`` response for a file of ``size`` bytes.
+    """
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+
+def stat_download(user_file):
+    """
+    Return the StoredObject describing the file behind a UserFile, first
+    moving it back from cold storage if need be.
+    Raises Http404 if the file is missing from the storage.
+    """
+    from .tiering import promote  # Not at import time: preview workers load this module before Django is set up
+    promote(user_file)
+    try:
+        return user_file.file.storage.stat(user_file.file.name)
+    except FileNotFoundError:
+        logger.warning("File '%s' is missing from the storage: %s", user_file.original_filename, user_file.file.name)
+        raise Http404("File not found.")
+
+
+def offload_enabled():
+    return settings.DOWNLOAD_OFFLOAD in (OFFLOAD_X_ACCEL_REDIRECT, OFFLOAD_X_SENDFILE)
+
+
+def offload_path(user_file):
+    """
+    Return the local path the reverse proxy can send the file from, or None
+    when the download is served by Python: offload disabled, a remote storage
+    or a compressed file (proxies neither decode it nor forward Content-Encoding).
+    """
+    if not offload_enabled() or user_file.codec:
+        return None
+    return user_file.file.storage.local_path(user_file.file.name)
+
+
+def requested_ranges(request, size, etag, last_modified):
+    """
+    Return the ranges to serve: None for the whole file, an empty list when the
+    Range header cannot be satisfied.
+    """
+    range_header = request.headers.get('Range')
+    if range_header and request.method in ('GET', 'HEAD') and range_is_fresh(request, etag, last_modified):
+        return parse_range_header(range_header, size)
+    return None
+
+
+def not_modified_response(request, stored, etag, last_modified):
+    """
+    Evaluate If-None-Match/If-Modified-Since (and If-Match/If-Unmodified-Since)
+    against the file. Returns a 304 or 412 response, or None to serve the file.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=int(stored.mtime))
+    if response is not None:
+        logger.debug("Conditional download answered with %s.", response.status_code)
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified, ranges=True):
+    response['Accept-Ranges'] = 'bytes' if ranges else 'none'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return response
+
+
+def set_cache_control(response, public):
+    """
+    Let shared caches keep public (special link) downloads for
+    SPECIAL_LINK_CACHE_MAX_AGE seconds; private downloads may only be kept by
+    the client and are revalidated on every use.
+    """
+    if response.status_code not in (200, 206, 304):
+        return response
+    if public:
+        patch_cache_control(response, public=True, max_age=settings.SPECIAL_LINK_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def build_download_response(request, user_file):
+    """
+    Return the download response for a UserFile without loading it into memory.
+    Honours Range/If-Range with single-range and multipart/byteranges 206 responses,
+    and answers conditional requests with 304 before the file is opened.
+    Compressed files are sent compressed to clients accepting their codec and
+    decompressed on the fly for the others.
+    Raises Http404 if the file is missing from the storage.
+    """
+    stored = stat_download(user_file)
+    encoding = served_encoding(request, user_file)
+    etag, last_modified = file_validators(user_file, stored, encoding)
+    response = not_modified_response(request, stored, etag, last_modified)
+    if response is not None:
+        return set_encoding(response, user_file, encoding)
+
+    path = offload_path(user_file)
+    if path is not None:
+        # The proxy evaluates Range and validators against the file itself
+        logger.debug("Offloading download of '%s' to the reverse proxy.", user_file.original_filename)
+        return offload_response(user_file, path)
+
+    if user_file.codec and not encoding:
+        response = set_validators(decoded_response(user_file), etag, last_modified, ranges=False)
+        return set_encoding(response, user_file, encoding)
+
+    ranges = requested_ranges(request, stored.size, etag, last_modified)
+
+    if ranges is None:
+        response = stream_response(user_file, stored)
+    elif not ranges:
+        response = range_not_satisfiable_response(stored.size)
+    elif len(ranges) == 1:
+        response = stream_response(user_file, stored, ranges[0])
+    else:
+        response = multipart_ranges_response(user_file, stored, ranges)
+    return set_encoding(set_validators(response, etag, last_modified), user_file, encoding)
+
+
+async def aread_file(open_file, chunk_size):
+    """
+    Asynchronously yield the content of the file-like object returned by
+    ``open_file``. Opening goes through sync_to_async, as openers may touch
+    the database; reads are plain file I/O and run in a worker thread, so the
+    event loop never blocks and downloads do not queue behind one another.
+    Each chunk is only read once the server has taken the previous one.
+    """
+    f = await sync_to_async(open_file)()
+    try:
+        while True:
+            data = await asyncio.to_thread(f.read, chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def aread_ranges(storage, name, parts, chunk_size):
+    """
+    Asynchronously yield ranges of a stored file, each framed by optional
+    ``prefix`` and ``suffix`` bytes, given as (prefix, start, end, suffix) tuples.
+    """
+    for prefix, start, end, suffix in parts:
+        if prefix:
+            yield prefix
+        if end >= start:
+            async for data in aread_file(partial(storage.open_range, name, start, end), chunk_size):
+                yield data
+        if suffix:
+            yield suffix
+
+
+async def abuild_download_response(request, user_file):
+    """
+    Async counterpart of build_download_response() for ASGI servers: the same
+    Range and offload handling, with the body produced by an async iterator.
+    """
+    stored = await sync_to_async(stat_download)(user_file)  # May promote a cold file, an ORM write
+    encoding = served_encoding(request, user_file)
+    etag, last_modified = file_validators(user_file, stored, encoding)
+    response = not_modified_response(request, stored, etag, last_modified)
+    if response is not None:
+        return set_encoding(response, user_file, encoding)
+
+    path = offload_path(user_file)
+    if path is not None:
+        logger.debug("Offloading download of '%s' to the reverse proxy.", user_file.original_filename)
+        return offload_response(user_file, path)
+
+    chunk_size = settings.DOWNLOAD_CHUNK_SIZE
+
+    if user_file.codec and not encoding:
+        response = StreamingHttpResponse(
+            aread_file(partial(open_content, user_file), chunk_size),
+            content_type=guess_content_type(user_file.original_filename),
+        )
+        response['Content-Length'] = user_file.size
+        response['Content-Disposition'] = content_disposition_header(True, user_file.original_filename)
+        return set_encoding(set_validators(response, etag, last_modified, ranges=False), user_file, encoding)
+
+    size = stored.size
+    storage = user_file.file.storage
+    ranges = requested_ranges(request, size, etag, last_modified)
+    if ranges is not None and not ranges:
+        response = range_not_satisfiable_response(size)
+    elif ranges is None or len(ranges) == 1:
+        start, end = ranges[0] if ranges else (0, size - 1)
+        response = StreamingHttpResponse(
+            aread_ranges(storage, stored.name, [(b'', start, end, b'')], chunk_size),
+            status=206 if ranges else 200,
+            content_type=guess_content_type(user_file.original_filename),
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Disposition'] = content_disposition_header(True, user_file.original_filename)
+        if ranges:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        layout = MultipartRanges(user_file, size, ranges)
+        parts = [(header, start, end, b'\r\n') for header, (start, end) in zip(layout.part_headers, ranges)]
+        parts[-1] = (*parts[-1][:3], b'\r\n' + layout.closing)
+        response = layout.response(user_file, aread_ranges(storage, stored.name, parts, chunk_size))
+    return set_encoding(set_validators(response, etag, last_modified), user_file, encoding)
@@ -0,0 +1,306 @@
+import math
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import Counter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to get a stream slot while a download waits, doubling up to the maximum
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+# Seconds clients are asked to wait before retrying a download refused for lack of slots
+RETRY_AFTER = 5
+
+
+class DownloadsBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many downloads in progress, retry later.'
+    default_code = 'downloads_busy'
+
+    def __init__(self, wait=RETRY_AFTER):
+        super().__init__()
+        self.wait = wait  # Sent as Retry-After by the DRF exception handler
+
+
+class StreamSlots:
+    """
+    The stream slots a download needs: one of the DOWNLOAD_MAX_STREAMS_PER_USER
+    slots of the user downloading, and one of the DOWNLOAD_MAX_STREAMS_PER_LINK
+    slots of the special link it goes through. Slots are leases in the cache,
+    so caps hold across workers; a lease lasts DOWNLOAD_SLOT_LEASE seconds,
+    refreshed while the stream is sent, so the slots of a crashed worker
+    free themselves.
+    """
+    def __init__(self, user=None, special_link=None):
+        self.limits = []
+        if user is not None and user.is_authenticated and settings.DOWNLOAD_MAX_STREAMS_PER_USER:
+            self.limits.append((f'download_slots:user:{user.pk}', settings.DOWNLOAD_MAX_STREAMS_PER_USER))
+        if special_link and settings.DOWNLOAD_MAX_STREAMS_PER_LINK:
+            self.limits.append((f'download_slots:link:{special_link}', settings.DOWNLOAD_MAX_STREAMS_PER_LINK))
+        # Bandwidth is shared fairly between the users, or the links for anonymous downloads
+        self.owner = f'link:{special_link}' if special_link else f'user:{user.pk}'
+        self.token = uuid.uuid4().hex
+        self.held = []
+        self.refreshed_at = 0
+
+    def try_acquire(self):
+        """
+        Take a free slot of every limit, or none of them. Returns whether it succeeded.
+        """
+        for key, cap in self.limits:
+            names = [f'{key}:{n}' for n in range(cap)]
+            taken = cache.get_many(names)
+            for name in names:
+                if name not in taken and cache.add(name, self.token, settings.DOWNLOAD_SLOT_LEASE):
+                    self.held.append(name)
+                    break
+            else:
+                self.release()
+                return False
+        self.refreshed_at = time.monotonic()
+        return True
+
+    def acquire(self):
+        """
+        Wait up to DOWNLOAD_QUEUE_TIMEOUT seconds for the slots.
+        Raises DownloadsBusy if they are still taken by then.
+        """
+        deadline = time.monotonic() + settings.DOWNLOAD_QUEUE_TIMEOUT
+        delay = POLL_INTERVAL
+        while not self.try_acquire():
+            if time.monotonic() + delay > deadline:
+                logger.warning("No stream slot for %s, download refused.", self.owner)
+                raise DownloadsBusy()
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+    async def aacquire(self):
+        deadline = time.monotonic() + settings.DOWNLOAD_QUEUE_TIMEOUT
+        delay = POLL_INTERVAL
+        while not await sync_to_async(self.try_acquire)():
+            if time.monotonic() + delay > deadline:
+                logger.warning("No stream slot for %s, download refused.", self.owner)
+                raise DownloadsBusy()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+    def refresh_due(self):
+        return bool(self.held) and time.monotonic() - self.refreshed_at > settings.DOWNLOAD_SLOT_LEASE / 3
+
+    def refresh(self):
+        for name in self.held:
+            cache.touch(name, settings.DOWNLOAD_SLOT_LEASE)
+        self.refreshed_at = time.monotonic()
+
+    def release(self, after=0):
+        """
+        Give the slots back, or let them expire in ``after`` seconds (downloads
+        sent by the reverse proxy, which does not report when it is done).
+        """
+        for name in self.held:
+            if after > 0:
+                cache.touch(name, math.ceil(after))
+            elif cache.get(name) == self.token:
+                cache.delete(name)
+        self.held = []
+
+
+class BandwidthShare:
+    """
+    Splits DOWNLOAD_WORKER_RATE bytes per second among the downloads streamed
+    by this process: equally between the users (or special links) downloading,
+    then equally between the streams of each, so that one user opening many
+    streams does not crowd out the others. No stream gets more than
+    DOWNLOAD_STREAM_RATE.
+    """
+    def __init__(self):
+        self.streams = Counter()
+        self._lock = threading.Lock()
+
+    def join(self, owner):
+        with self._lock:
+            self.streams[owner] += 1
+
+    def leave(self, owner):
+        with self._lock:
+            self.streams[owner] -= 1
+            if self.streams[owner] <= 0:
+                del self.streams[owner]
+
+    def rate(self, owner):
+        """
+        Bytes per second a stream of ``owner`` may send now, 0 for no limit.
+        """
+        rates = [settings.DOWNLOAD_STREAM_RATE] if settings.DOWNLOAD_STREAM_RATE else []
+        if settings.DOWNLOAD_WORKER_RATE:
+            with self._lock:
+                owners, streams = len(self.streams) or 1, self.streams[owner] or 1
+            rates.append(settings.DOWNLOAD_WORKER_RATE / owners / streams)
+        return min(rates, default=0)
+
+
+bandwidth = BandwidthShare()
+
+
+class LeaseKeeper:
+    """
+    Refreshes the slot leases of the streams in progress from a background
+    thread, so that the content of a stream never has to pass through a
+    wrapper for its slots to be kept: unshaped files stay with the
+    zero-copy file wrapper. The thread stops when no stream is left.
+    """
+    def __init__(self):
+        self.slots = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def keep(self, slots):
+        with self._lock:
+            self.slots.add(slots)
+            self._wake.set()  # Re-reads DOWNLOAD_SLOT_LEASE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slot-leases', daemon=True)
+                self._thread.start()
+
+    def drop(self, slots):
+        with self._lock:
+            self.slots.discard(slots)
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            self._wake.wait(settings.DOWNLOAD_SLOT_LEASE / 3)
+            with self._lock:
+                if not self.slots:
+                    self._thread = None
+                    return
+                due = [slots for slots in self.slots if slots.refresh_due()]
+            for slots in due:
+                try:
+                    slots.refresh()
+                except Exception as e:
+                    logger.error("Error refreshing the stream slots of %s: %s", slots.owner, e)
+
+
+lease_keeper = LeaseKeeper()
+
+
+def shaping_enabled():
+    return bool(settings.DOWNLOAD_STREAM_RATE or settings.DOWNLOAD_WORKER_RATE)
+
+
+class StreamShaper:
+    """
+    Token bucket, in bytes, applied between the chunk writes of one stream:
+    once a chunk is sent the stream pauses until it is back within its rate,
+    re-read on every chunk as its fair share changes. Up to one second's
+    worth of data may be sent as a burst.
+    """
+    def __init__(self, owner):
+        self.owner = owner
+        self.tokens = None
+        self.checked = time.monotonic()
+
+    def delay(self, size):
+        """
+        Take ``size`` bytes from the bucket; returns the seconds to pause.
+        """
+        rate = bandwidth.rate(self.owner)
+        now = time.monotonic()
+        if not rate:
+            self.tokens, self.checked = None, now
+            return 0
+        tokens = rate if self.tokens is None else self.tokens + (now - self.checked) * rate
+        self.tokens, self.checked = min(tokens, rate) - size, now
+        return -self.tokens / rate if self.tokens < 0 else 0
+
+
+def shape(chunks, slots):
+    shaper = StreamShaper(slots.owner)
+    for chunk in chunks:
+        yield chunk
+        pause = shaper.delay(len(chunk))
+        if pause:
+            time.sleep(pause)
+
+
+async def ashape(chunks, slots):
+    shaper = StreamShaper(slots.owner)
+    async for chunk in chunks:
+        yield chunk
+        pause = shaper.delay(len(chunk))
+        if pause:
+            await asyncio.sleep(pause)
+
+
+def govern(response, slots, user_file):
+    """
+    Put a download response under the governor: its stream is shaped, its
+    slot leases are kept by the lease keeper while it is sent and its slots
+    are given back when the server closes it. Downloads offloaded to Nginx are shaped by the
+    proxy (X-Accel-Limit-Rate) and keep their slots for as long as the
+    transfer should take at that rate. ``user_file`` is None for archives.
+    """
+    if not response.streaming:
+        rate = settings.DOWNLOAD_STREAM_RATE
+        if 'X-Accel-Redirect' in response and rate and user_file is not None:
+            response['X-Accel-Limit-Rate'] = rate
+            slots.release(after=min(user_file.size / rate, settings.DOWNLOAD_SLOT_LEASE))
+        else:
+            slots.release()
+        return response
+
+    bandwidth.join(slots.owner)
+
+    def close():
+        lease_keeper.drop(slots)
+        bandwidth.leave(slots.owner)
+        slots.release()
+
+    if shaping_enabled():
+        # Shaped streams are written chunk by chunk, without the zero-copy file wrapper
+        if response.is_async:
+            response.streaming_content = ashape(response.streaming_content, slots)
+        else:
+            response.streaming_content = shape(response.streaming_content, slots)
+    if slots.held:
+        lease_keeper.keep(slots)
+    response._resource_closers.append(close)
+    return response
+
+
+def governed_download(build, request, user_file, user=None, special_link=None):
+    """
+    Build a download with ``build(request, user_file)`` once it has its stream
+    slots, waiting for them up to DOWNLOAD_QUEUE_TIMEOUT seconds.
+    Raises DownloadsBusy if they stay taken.
+    """
+    slots = StreamSlots(user, special_link)
+    slots.acquire()
+    try:
+        response = build(request, user_file)
+    except BaseException:
+        slots.release()
+        raise
+    return govern(response, slots, user_file)
+
+
+async def agoverned_download(abuild, request, user_file, user=None, special_link=None):
+    slots = StreamSlots(user, special_link)
+    await slots.aacquire()
+    try:
+        response = await abuild(request, user_file)
+    except BaseException:
+        await sync_to_async(slots.release)()
+        raise
+    return await sync_to_async(govern)(response, slots, user_file)
@@ -0,0 +1,60 @@
+import logging
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from mycloud_api.compression import open_content
+from mycloud_api.models import Blob, UserFile
+from mycloud_api.uploadhandlers import content_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Move files stored before deduplication into the content-addressed blob store."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of files to process.")
+
+    def handle(self, *args, **options):
+        if default_storage.local_path('') is None:
+            raise CommandError("The blob backfill only supports files stored on the local disk.")
+
+        files = UserFile.objects.filter(blob__isnull=True, codec='').order_by('pk')  # Blobs are keyed by raw content
+        if options['limit']:
+            files = files[:options['limit']]
+
+        moved = reused = missing = skipped = 0
+        for user_file in files.iterator():
+            name = user_file.file.name
+            try:
+                # Read through the storage, which also finds files moved to cold storage
+                with open_content(user_file) as f:
+                    sha256 = content_sha256(File(f))
+                with open_content(user_file) as f, transaction.atomic():
+                    blob = Blob.objects.acquire(File(f), sha256, user_file.size)
+                    # Only a file still live and unchanged since it was read moves to the blob
+                    updated = UserFile.objects.filter(pk=user_file.pk, blob__isnull=True, file=name).update(
+                        blob=blob, file=blob.file.name, codec=blob.codec, stored_size=blob.stored_size, cold=False
+                    )
+                    if updated != 1:
+                        Blob.objects.release(blob.pk)
+            except FileNotFoundError:
+                logger.warning("File '%s' is missing on disk: %s", user_file.original_filename, name)
+                missing += 1
+                continue
+            if updated != 1:
+                logger.warning("File '%s' changed during the backfill, left as it is: %s", user_file.original_filename, name)
+                skipped += 1
+                continue
+            # The blob holds its own copy now; this drops the fast and the cold copy
+            default_storage.remove(name)
+            if blob.ref_count > 1:
+                reused += 1
+            else:
+                moved += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {moved} new blobs, deduplicated {reused} files, skipped {missing} missing files "
+            f"and {skipped} files changed meanwhile."
+        ))
@@ -0,0 +1,70 @@
+import json
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from mycloud_api.benchmarks import SCENARIOS, Benchmark, compare
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Benchmark uploads, downloads, listings and logins on a throwaway test database; "
+            "save the results as a JSON baseline or compare them with one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help="Synthetic users to create.")
+        parser.add_argument('--files', type=int, default=50, help="Files per user.")
+        parser.add_argument('--file-size', type=int, default=64 * 1024, help="Bytes per file.")
+        parser.add_argument('--requests', type=int, default=100, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests before each scenario.")
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help="Scenario to run (repeatable; default: all).")
+        parser.add_argument('--output', default=None, help="File to write the results to, as a JSON baseline.")
+        parser.add_argument('--compare', default=None, help="JSON baseline to compare the results with.")
+        parser.add_argument('--threshold', type=float, default=10,
+                            help="Percentage by which a metric may get worse before the comparison fails.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['files'] < 1 or options['requests'] < 1:
+            raise CommandError("--users, --files and --requests must be at least 1.")
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read the baseline '{options['compare']}': {e}")
+
+        benchmark = Benchmark(
+            users=options['users'],
+            files=options['files'],
+            file_size=options['file_size'],
+            requests=options['requests'],
+            warmup=options['warmup'],
+            scenarios=options['scenarios'] or SCENARIOS,
+            report=self.stdout.write,
+        )
+        run = benchmark.run()
+
+        for name, result in run['results'].items():
+            line = (f"{name}: {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, "
+                    f"p99 {result['p99_ms']} ms, {result['errors']} errors")
+            if 'bytes_per_second' in result:
+                line += f", {result['bytes_per_second']} B/s, peak RSS {result['peak_rss_bytes']} B"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+        if baseline is None:
+            return
+        rows = compare(baseline, run, options['threshold'] / 100)
+        for name, metric, before, after, change, regressed in rows:
+            line = f"{name} {metric}: {before} -> {after} ({change:+.1%})"
+            self.stdout.write(self.style.ERROR(line + " REGRESSED") if regressed else line)
+        regressions = sum(regressed for *_, regressed in rows)
+        if regressions:
+            logger.warning("Benchmark: %s metrics regressed past %s%%.", regressions, options['threshold'])
+            raise CommandError(f"{regressions} metrics regressed by more than {options['threshold']}%.")
+        self.stdout.write(self.style.SUCCESS(f"No metric regressed by more than {options['threshold']}%."))
@@ -0,0 +1,126 @@
+import os
+import errno
+import shutil
+import logging
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Value, When
+from mycloud_api.caching import bump_versions
+from mycloud_api.cleanup import RateLimiter, remove_file
+from mycloud_api.models import UserFile, user_file_path
+
+logger = logging.getLogger(__name__)
+
+
+def target_name(name):
+    """
+    Storage name of a plain file in the USER_FILES_FANOUT layout, or None if it
+    is not under a user directory.
+    """
+    parts = name.split('/')
+    if len(parts) < 3 or parts[0] != 'user_files':
+        return None
+    return user_file_path(parts[1], parts[-1])
+
+
+def link_file(source, target):
+    """
+    Make ``target`` a second name of ``source``: a hard link, or a copy across file systems.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(source, target)
+
+
+def remove_empty_parents(name):
+    # Directories left empty by a layout with more levels, up to the user's directory
+    directory = os.path.dirname(name)
+    while directory.count('/') > 1:
+        try:
+            os.rmdir(os.path.join(settings.MEDIA_ROOT, directory))
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+class Command(BaseCommand):
+    help = "Move stored user files into the USER_FILES_FANOUT directory layout, in batches, while the site is running."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Files moved per transaction.")
+        parser.add_argument('--rate', type=int, default=0, help="Files moved per second at most (0 for no limit).")
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of files to move.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the files to move.")
+
+    def handle(self, *args, **options):
+        if default_storage.local_path('') is None:
+            raise CommandError("The storage layout only applies to files stored on the local disk.")
+        limiter = RateLimiter(options['rate'])
+        moved = skipped = pending = 0
+        last_pk = 0
+        while options['limit'] is None or moved + pending < options['limit']:
+            rows = list(UserFile.all_objects.filter(blob__isnull=True, pk__gt=last_pk).exclude(file='')
+                        .order_by('pk').values_list('pk', 'file')[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            moves = {pk: (name, target_name(name)) for pk, name in rows}
+            moves = {pk: (name, target) for pk, (name, target) in moves.items() if target and target != name}
+            if options['limit'] is not None:
+                moves = dict(list(moves.items())[:options['limit'] - moved - pending])
+            if options['dry_run']:
+                pending += len(moves)
+                continue
+            if moves:
+                batch_moved, batch_skipped = self.move_batch(moves, limiter)
+                moved += batch_moved
+                skipped += batch_skipped
+
+        if options['dry_run']:
+            self.stdout.write(f"{pending} files to move.")
+            return
+        logger.info("Moved %s files to the new storage layout, skipped %s.", moved, skipped)
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files to the new storage layout, skipped {skipped}."))
+
+    def move_batch(self, moves, limiter):
+        """
+        Link each file under its new name, point the rows at the new names in
+        one UPDATE, then remove the old names. Readers see either name until the
+        commit, and both names hold the same content meanwhile.
+        """
+        linked = {}
+        for pk, (name, target) in moves.items():
+            limiter.wait()
+            try:
+                link_file(os.path.join(settings.MEDIA_ROOT, name), os.path.join(settings.MEDIA_ROOT, target))
+            except FileNotFoundError:
+                logger.warning("File '%s' is missing on disk; left in place.", name)
+                continue
+            linked[pk] = (name, target)
+
+        with transaction.atomic():
+            # Rows deleted or changed since they were read are left alone
+            current = {pk: (name, owner_id) for pk, name, owner_id in
+                       UserFile.all_objects.select_for_update().filter(pk__in=linked).values_list('pk', 'file', 'owner_id')}
+            updated = {pk: names for pk, names in linked.items() if pk in current and current[pk][0] == names[0]}
+            if updated:
+                UserFile.all_objects.filter(pk__in=updated).update(
+                    file=Case(*[When(pk=pk, then=Value(target)) for pk, (_, target) in updated.items()])
+                )
+                owners = {current[pk][1] for pk in updated}
+                transaction.on_commit(lambda: bump_versions(owners))  # Listings show the file URLs
+
+        # Old names once the rows point at the new ones, new names that lost their row
+        for pk, (name, target) in linked.items():
+            stale = name if pk in updated else target
+            remove_file(stale)
+            remove_empty_parents(stale)
+        return len(updated), len(moves) - len(updated)
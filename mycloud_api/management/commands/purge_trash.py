@@ -0,0 +1,41 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from mycloud_api.cleanup import remove_files
+from mycloud_api.models import UserFile
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Delete the files that have been in the trash longer than TRASH_RETENTION days and remove them from disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Retention in days (default: TRASH_RETENTION).")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows deleted per transaction.")
+        parser.add_argument('--workers', type=int, default=None, help="Threads removing files from disk.")
+        parser.add_argument('--rate', type=int, default=None, help="Files removed per second at most (0 for no limit).")
+
+    def handle(self, *args, **options):
+        days = settings.TRASH_RETENTION if options['days'] is None else options['days']
+        batch_size = options['batch_size'] or settings.PURGE_BATCH_SIZE
+        cutoff = timezone.now() - timedelta(days=days)
+        expired = UserFile.all_objects.filter(deleted_at__lte=cutoff)
+
+        deleted = removed = 0
+        while True:
+            # Short transactions keep the locks brief; files are removed once their rows are gone
+            with transaction.atomic():
+                ids = list(expired.order_by('deleted_at', 'id').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                count, names = UserFile.all_objects.purge(expired.filter(pk__in=ids))
+            deleted += count
+            removed += remove_files(names, workers=options['workers'], rate=options['rate'])
+            logger.debug("Purged a batch of %s files from the trash.", count)
+
+        logger.info("Purged %s files from the trash, %s removed from disk.", deleted, removed)
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} files from the trash, {removed} removed from disk."))
@@ -0,0 +1,14 @@
+import logging
+from django.core.management.base import BaseCommand
+from mycloud_api.uploads import purge_expired_sessions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Delete expired resumable upload sessions and their partial files."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_sessions()
+        logger.info("Purged %s expired upload sessions.", deleted)
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired upload sessions."))
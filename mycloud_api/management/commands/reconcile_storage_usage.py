@@ -0,0 +1,29 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from mycloud_api.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user storage usage counters from the stored files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report users whose counters are off.")
+
+    def handle(self, *args, **options):
+        drifted = UserProfile.objects.actual_usage_annotated().exclude(
+            storage_used=F('actual_storage_used'), file_count=F('actual_file_count')
+        )
+        for user in drifted.values('username', 'storage_used', 'actual_storage_used', 'file_count', 'actual_file_count'):
+            self.stdout.write(
+                f"{user['username']}: {user['storage_used']} -> {user['actual_storage_used']} bytes, "
+                f"{user['file_count']} -> {user['actual_file_count']} files"
+            )
+        if options['dry_run']:
+            return
+
+        updated = UserProfile.objects.reconcile_usage(UserProfile.objects.filter(pk__in=drifted.values('pk')))
+        logger.info("Reconciled storage usage of %s users.", updated)
+        self.stdout.write(self.style.SUCCESS(f"Reconciled storage usage of {updated} users."))
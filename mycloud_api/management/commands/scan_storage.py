@@ -0,0 +1,63 @@
+import logging
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from mycloud_api.scanner import MAX_DELETIONS, ScanAborted, StorageScan
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Reconcile the storage tree with the database: report (or repair) orphaned files and rows whose file is gone."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help="Remove orphaned files and delete the files whose content is missing.")
+        parser.add_argument('--min-age', type=int, default=60 * 60,
+                            help="Seconds before a finding may be repaired; newer ones may be operations in progress.")
+        parser.add_argument('--checkpoint', default=None,
+                            help="File recording the progress, to resume an interrupted scan from.")
+        parser.add_argument('--time-limit', type=int, default=None,
+                            help="Seconds after which to stop and checkpoint, for incremental runs.")
+        parser.add_argument('--max-deletions', type=int, default=MAX_DELETIONS,
+                            help="Most files removed, and most rows deleted, by one run before repairs stop.")
+        parser.add_argument('--workers', type=int, default=8, help="Threads listing directories.")
+        parser.add_argument('--quiet', action='store_true', help="Only print the summary.")
+
+    def handle(self, *args, **options):
+        if default_storage.local_path('') is None:
+            raise CommandError("The storage scan walks MEDIA_ROOT and only supports files stored on the local disk.")
+
+        def report(finding, name):
+            if not options['quiet']:
+                self.stdout.write(f"{finding}: {name}")
+
+        scan = StorageScan(
+            repair=options['repair'],
+            min_age=options['min_age'],
+            checkpoint=options['checkpoint'],
+            workers=options['workers'],
+            time_limit=options['time_limit'],
+            report=report,
+            max_deletions=options['max_deletions'],
+        )
+        try:
+            completed = scan.run()
+        except ScanAborted as e:
+            logger.error("Storage scan aborted: %s", str(e))
+            raise CommandError(f"Scan aborted, nothing more was repaired: {e}")
+
+        counts = scan.counts
+        summary = (
+            f"{counts['matched']} files matched, {counts['orphan']} orphaned files, "
+            f"{counts['missing']} missing files, {counts['size_mismatch']} size mismatches, "
+            f"{counts['cold']} files in cold storage"
+        )
+        if options['repair']:
+            summary += f"; removed {counts['orphans_removed']} orphans, deleted {counts['rows_deleted']} files"
+            if scan.repairs_halted:
+                summary += f" (repairs halted at the limit of {options['max_deletions']} deletions)"
+        logger.info("Storage scan %s: %s.", 'completed' if completed else 'paused', summary)
+        if completed:
+            self.stdout.write(self.style.SUCCESS(f"Scan completed: {summary}."))
+        else:
+            self.stdout.write(self.style.WARNING(f"Scan paused after '{scan.position}': {summary}. Run again to resume."))
@@ -0,0 +1,39 @@
+import logging
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from mycloud_api.tiering import ColdTiering, tiering_enabled
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Move the files not accessed for COLD_TIER_AFTER days to COLD_STORAGE_ROOT, in throttled batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Days without access (default: COLD_TIER_AFTER).")
+        parser.add_argument('--batch-size', type=int, default=None, help="Files moved per transaction.")
+        parser.add_argument('--rate', type=int, default=None,
+                            help="Bytes copied per second at most (default: COLD_TIER_IO_RATE, 0 for no limit).")
+        parser.add_argument('--limit', type=int, default=None, help="Maximum number of files to move.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the files to move.")
+
+    def handle(self, *args, **options):
+        if not tiering_enabled(default_storage):
+            raise CommandError("Set COLD_STORAGE_ROOT to move files to cold storage.")
+
+        tiering = ColdTiering(
+            default_storage,
+            days=options['days'],
+            batch_size=options['batch_size'],
+            rate=options['rate'],
+            limit=options['limit'],
+            dry_run=options['dry_run'],
+        )
+        moved = tiering.run()
+        if options['dry_run']:
+            self.stdout.write(f"{moved} files to move to cold storage.")
+            return
+        logger.info("Moved %s files (%s bytes) to cold storage, skipped %s.", moved, tiering.bytes_moved, tiering.skipped)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} files ({tiering.bytes_moved} bytes) to cold storage, skipped {tiering.skipped}."
+        ))
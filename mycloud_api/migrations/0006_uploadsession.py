@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0005_userprofile_is_admin'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='is_admin',
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_filename', models.CharField(max_length=255, verbose_name='Original File Name')),
+                ('comment', models.TextField(blank=True, null=True, verbose_name='File Comment')),
+                ('length', models.BigIntegerField(verbose_name='Upload Length')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Upload Offset')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Expires At')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import mycloud_api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(max_length=500, upload_to=mycloud_api.models.blob_path, verbose_name='Blob Location')),
+                ('size', models.BigIntegerField(verbose_name='Blob Size')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Reference Count')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='user_files', to='mycloud_api.blob', verbose_name='Content Blob'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0007_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'id'], name='userfile_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'upload_date', 'id'], name='userfile_owner_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'original_filename', 'id'], name='userfile_owner_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'size', 'id'], name='userfile_owner_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'last_downloaded', 'id'], name='userfile_owner_downloaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['owner', 'comment', 'id'], name='userfile_owner_comment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(fields=['upload_date', 'id'], name='userfile_uploaded_id_idx'),
+        ),
+    ]
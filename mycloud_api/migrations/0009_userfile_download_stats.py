@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0008_userfile_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='bytes_served',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Bytes Served'),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='download_count',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Download Count'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:37
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import mycloud_api.models
+
+
+def compute_storage_usage(apps, schema_editor):
+    UserProfile = apps.get_model('mycloud_api', 'UserProfile')
+    UserFile = apps.get_model('mycloud_api', 'UserFile')
+    files = UserFile.objects.filter(owner=models.OuterRef('pk')).order_by().values('owner')
+    UserProfile.objects.update(
+        storage_used=Coalesce(
+            models.Subquery(files.annotate(total=models.Sum('size')).values('total')),
+            0, output_field=models.BigIntegerField()
+        ),
+        file_count=Coalesce(
+            models.Subquery(files.annotate(count=models.Count('id')).values('count')),
+            0, output_field=models.BigIntegerField()
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0009_userfile_download_stats'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='userprofile',
+            managers=[
+                ('objects', mycloud_api.models.UserProfileManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='file_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='File Count'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='storage_quota',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Bytes; leave empty to use the default quota.', null=True, verbose_name='Storage Quota'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='storage_used',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Storage Used'),
+        ),
+        migrations.RunPython(compute_storage_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'mycloud_api_userfile_fts'
+
+POSTGRESQL_INDEXES = [
+    ('userfile_name_trgm_idx', 'original_filename'),
+    ('userfile_comment_trgm_idx', 'comment'),
+]
+
+# External-content FTS5 table: it stores only the index, the text stays in mycloud_api_userfile
+SQLITE_FORWARDS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"original_filename, comment, content='mycloud_api_userfile', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON mycloud_api_userfile BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, original_filename, comment) "
+    f"VALUES (new.id, new.original_filename, new.comment); END",
+    f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON mycloud_api_userfile BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_filename, comment) "
+    f"VALUES ('delete', old.id, old.original_filename, old.comment); END",
+    # Only renames and comment changes touch the index, not download counters
+    f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF original_filename, comment ON mycloud_api_userfile BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_filename, comment) "
+    f"VALUES ('delete', old.id, old.original_filename, old.comment); "
+    f"INSERT INTO {FTS_TABLE}(rowid, original_filename, comment) "
+    f"VALUES (new.id, new.original_filename, new.comment); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARDS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, column in POSTGRESQL_INDEXES:
+            # Matches the UPPER(column::text) LIKE UPPER(...) that Django emits for ICONTAINS
+            schema_editor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON mycloud_api_userfile "
+                f"USING gin (UPPER({column}::text) gin_trgm_ops)"
+            )
+    elif connection.vendor == 'sqlite':
+        # FTS5 and its trigram tokenizer need SQLite 3.34+; without them searches fall back to scans
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            options = {row[0] for row in cursor.fetchall()}
+        if 'ENABLE_FTS5' not in options or connection.Database.sqlite_version_info < (3, 34, 0):
+            return
+        for statement in SQLITE_FORWARDS:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for name, _ in POSTGRESQL_INDEXES:
+            schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    elif connection.vendor == 'sqlite':
+        for statement in SQLITE_BACKWARDS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction; it keeps the table writable while building
+    atomic = False
+
+    dependencies = [
+        ('mycloud_api', '0010_userprofile_storage_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
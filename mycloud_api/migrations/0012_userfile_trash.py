@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0011_userfile_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='userfile',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Moved to Trash'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at', 'id'], name='userfile_trash_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userfile',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('owner', 'original_filename'), name='userfile_owner_name_live_uniq'),
+        ),
+    ]
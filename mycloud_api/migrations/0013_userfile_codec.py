@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0012_userfile_trash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='codec',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('gzip', 'gzip')], default='', max_length=16, verbose_name='Stored Codec'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Stored Size'),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='codec',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('gzip', 'gzip')], default='', max_length=16, verbose_name='Stored Codec'),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Stored Size'),
+        ),
+    ]
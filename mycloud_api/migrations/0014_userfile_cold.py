@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0013_userfile_codec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='cold',
+            field=models.BooleanField(default=False, verbose_name='In Cold Storage'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(condition=models.Q(('cold', False)), fields=['last_downloaded', 'id'], name='userfile_hot_access_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfile',
+            index=models.Index(condition=models.Q(('cold', False), ('last_downloaded__isnull', True)), fields=['upload_date', 'id'], name='userfile_hot_unread_idx'),
+        ),
+    ]
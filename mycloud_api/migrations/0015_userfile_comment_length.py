@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:32
+
+from django.db import migrations, models
+import django.db.models.functions.text
+import django.db.models.lookups
+from django.db.models.functions import Length, Substr
+
+
+def truncate_long_comments(apps, schema_editor):
+    # Comments were only capped by the API serializers; bring any longer ones under the new constraint
+    UserFile = apps.get_model('mycloud_api', 'UserFile')
+    UserFile.objects.annotate(comment_length=Length('comment')).filter(comment_length__gt=500).update(
+        comment=Substr('comment', 1, 500)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0014_userfile_cold'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='comment',
+            field=models.TextField(blank=True, max_length=500, null=True, verbose_name='File Comment'),
+        ),
+        migrations.AlterField(
+            model_name='userfile',
+            name='comment',
+            field=models.TextField(blank=True, max_length=500, null=True, verbose_name='File Comment'),
+        ),
+        migrations.RunPython(truncate_long_comments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userfile',
+            constraint=models.CheckConstraint(check=models.Q(('comment__isnull', True), django.db.models.lookups.LessThanOrEqual(django.db.models.functions.text.Length('comment'), 500), _connector='OR'), name='userfile_comment_length'),
+        ),
+    ]
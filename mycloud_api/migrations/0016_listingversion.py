@@ -0,0 +1,20 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud_api', '0015_userfile_comment_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingVersion',
+            fields=[
+                ('scope', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Scope')),
+                ('version', models.BigIntegerField(verbose_name='Version')),
+            ],
+        ),
+    ]
@@ -1,20 +1,105 @@
 import os
+import re
+import time
 import uuid
+import hashlib
 import logging
+from collections import Counter
+from datetime import timedelta
 from django.conf import settings
 from django.utils import timezone
-from django.db import models
-from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_delete
+from django.db import IntegrityError, models, transaction
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.db.models.functions import Coalesce, Greatest, Length
+from django.db.models.lookups import LessThanOrEqual
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .caching import bump_versions
+from .cleanup import background_remover
+from .compression import CODEC_CHOICES, encode_content
 
 logger = logging.getLogger(__name__)
 
+# Rows deleted per DELETE statement by UserFileManager.purge()
+DELETE_BATCH_SIZE = 500
+
+# Longest file comment; keeps (owner, comment, id) entries within the B-tree row size limit of Postgres
+COMMENT_MAX_LENGTH = 500
+
+# Stored names of uploaded files start with a random hex UUID
+STORED_NAME_PREFIX = re.compile(r'[0-9a-f]{32}_')
+
+
+def user_file_path(file_storage_path, stored_name):
+    """
+    Path of a stored file inside its owner's directory, fanned out over
+    USER_FILES_FANOUT levels of subdirectories named by two hex digits of the
+    UUID starting the name (or of a digest of legacy names).
+    """
+    digest = stored_name[:32] if STORED_NAME_PREFIX.match(stored_name) else hashlib.sha256(stored_name.encode()).hexdigest()
+    shards = [digest[2 * level:2 * level + 2] for level in range(settings.USER_FILES_FANOUT)]
+    return os.path.join('user_files', file_storage_path, *shards, stored_name)
+
+
 def user_directory_path(instance, filename):
     """
     Function to generate a file upload path for a directory associated with the user.
     """
-    return os.path.join('user_files', instance.owner.file_storage_path, f'{uuid.uuid4().hex}_{filename}')
+    return user_file_path(instance.owner.file_storage_path, f'{uuid.uuid4().hex}_{filename}')
+
+
+def blob_path(instance, filename):
+    """
+    Function to generate the content-addressed path of a blob, fanned out by
+    the first bytes of its SHA-256 digest.
+    """
+    return os.path.join('blobs', instance.sha256[:2], instance.sha256[2:4], instance.sha256)
+
+
+class UserProfileManager(UserManager):
+    """
+    User manager maintaining the denormalized storage usage counters.
+    """
+    def add_usage(self, user_id, size, count):
+        """
+        Add ``size`` bytes and ``count`` files (negative to subtract) to a user's usage.
+        """
+        return self.filter(pk=user_id).update(
+            storage_used=Greatest(models.F('storage_used') + size, 0),
+            file_count=Greatest(models.F('file_count') + count, 0),
+        )
+
+    def actual_usage(self):
+        """
+        Expressions computing a user's usage from their UserFile rows, trashed
+        files included: they stay on disk until purged.
+        """
+        files = UserFile.all_objects.filter(owner=models.OuterRef('pk')).order_by().values('owner')
+        return {
+            'storage_used': Coalesce(
+                models.Subquery(files.annotate(total=models.Sum('size')).values('total')),
+                0, output_field=models.BigIntegerField()
+            ),
+            'file_count': Coalesce(
+                models.Subquery(files.annotate(count=models.Count('id')).values('count')),
+                0, output_field=models.BigIntegerField()
+            ),
+        }
+
+    def actual_usage_annotated(self):
+        """
+        Users annotated with actual_storage_used and actual_file_count.
+        """
+        usage = self.actual_usage()
+        return self.annotate(actual_storage_used=usage['storage_used'], actual_file_count=usage['file_count'])
+
+    def reconcile_usage(self, users=None):
+        """
+        Recompute the usage counters of ``users`` (default: all) from their files
+        with a single UPDATE. Returns the number of users updated.
+        """
+        users = self.all() if users is None else users
+        return users.update(**self.actual_usage())
 
 
 class UserProfile(AbstractUser):
@@ -26,6 +111,17 @@ class UserProfile(AbstractUser):
         verbose_name='File Storage Path', 
         default=''
     )
+    # Denormalized usage, maintained with the UserFile rows (see add_usage)
+    storage_used = models.PositiveBigIntegerField(default=0, verbose_name='Storage Used')
+    file_count = models.PositiveIntegerField(default=0, verbose_name='File Count')
+    storage_quota = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Storage Quota',
+        help_text='Bytes; leave empty to use the default quota.'
+    )
+
+    objects = UserProfileManager()
 
     def save(self, *args, **kwargs):
         """
@@ -43,6 +139,184 @@ class UserProfile(AbstractUser):
             # Save the user again to persist the generated file_storage_path
             self.save(update_fields=['file_storage_path'])
 
+    def delete(self, *args, **kwargs):
+        """
+        Overridden delete method removing the user's files set-based first, so
+        that the cascade does not load and signal them one by one.
+        """
+        with transaction.atomic():
+            UserFile.all_objects.delete_files(UserFile.all_objects.filter(owner=self))
+            return super().delete(*args, **kwargs)
+
+
+class BlobManager(models.Manager):
+    """
+    Manager implementing reference counting for content-addressed blobs.
+    """
+    def acquire(self, content, sha256, size):
+        """
+        Return the blob holding ``content`` with one more reference. The content
+        is written to disk only if no blob with this digest exists yet.
+        """
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    blob = self.reference(sha256, size)
+                    if blob is not None:
+                        return blob
+
+                    codec, stored, stored_size = encode_content(content)
+                    blob = self.model(sha256=sha256, size=size, codec=codec, stored_size=stored_size, ref_count=1)
+                    try:
+                        blob.file.save(sha256, stored, save=False)
+                    finally:
+                        if stored is not content:
+                            stored.close()
+                    try:
+                        blob.save()
+                    except Exception:
+                        blob.file.storage.delete(blob.file.name)
+                        raise
+                    logger.info(f"Stored new blob {sha256} ({size} bytes).")
+                    return blob
+            except IntegrityError:
+                # The same content was stored concurrently; take a reference to it instead
+                logger.debug(f"Blob {sha256} created concurrently, retrying.")
+        raise IntegrityError(f"Could not acquire blob {sha256}.")
+
+    def reference(self, sha256, size, owner=None):
+        """
+        Take one more reference to an existing blob with this digest and size.
+        With ``owner``, only blobs already referenced by one of the owner's
+        files (trashed ones included) qualify. Returns None if no such content
+        is stored.
+        """
+        with transaction.atomic():
+            blobs = self.select_for_update().filter(sha256=sha256, size=size)
+            if owner is not None:
+                blobs = blobs.filter(pk__in=UserFile.all_objects.filter(owner=owner).values('blob'))
+            blob = blobs.first()
+            if blob is None:
+                return None
+            self.filter(pk=blob.pk).update(ref_count=models.F('ref_count') + 1)
+            blob.ref_count += 1
+            logger.info(f"Reusing blob {sha256} ({blob.ref_count} references).")
+            return blob
+
+    def release(self, blob_id):
+        """
+        Drop one reference to a blob and delete it once nothing points at it.
+        """
+        self.filter(pk=blob_id).update(ref_count=models.F('ref_count') - 1)
+        for blob in self.filter(pk=blob_id, ref_count__lte=0):
+            blob.delete()
+
+    def release_many(self, counts):
+        """
+        Drop several references at once (``counts`` maps blob ids to the number of
+        references dropped) with one UPDATE, and delete the blobs left unreferenced.
+        """
+        if not counts:
+            return
+        dropped = models.Case(*[models.When(pk=pk, then=models.Value(n)) for pk, n in counts.items()],
+                              default=models.Value(0))
+        self.filter(pk__in=counts).update(ref_count=Greatest(models.F('ref_count') - dropped, 0))
+        self.filter(pk__in=counts, ref_count__lte=0).delete()
+
+
+class Blob(models.Model):
+    """
+    Model to store deduplicated file content, keyed by its SHA-256 digest.
+    Several UserFile records can point at one blob; ``ref_count`` tracks them
+    and the blob is removed from disk when the last reference goes away.
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    file = models.FileField(upload_to=blob_path, verbose_name='Blob Location', max_length=500)
+    size = models.BigIntegerField(verbose_name='Blob Size')
+    codec = models.CharField(max_length=16, blank=True, default='', choices=CODEC_CHOICES, verbose_name='Stored Codec')
+    stored_size = models.BigIntegerField(null=True, blank=True, verbose_name='Stored Size')  # Bytes in the storage
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Reference Count')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Created')
+
+    objects = BlobManager()
+
+    def __str__(self):
+        return f"Blob {self.sha256} ({self.ref_count} references)"
+
+
+class UserFileManager(models.Manager):
+    """
+    Manager with set-based trashing, restoring and deletion of files.
+    """
+    def trash(self, files):
+        """
+        Move the files of a queryset to the trash with one UPDATE. They keep
+        their content and storage usage until purged. Returns the number of files trashed.
+        """
+        with transaction.atomic():
+            owners = set(files.filter(deleted_at__isnull=True).values_list('owner_id', flat=True).distinct())
+            trashed = files.filter(deleted_at__isnull=True).update(deleted_at=timezone.now())
+            transaction.on_commit(lambda: bump_versions(owners))
+        logger.info(f"Moved {trashed} files to the trash.")
+        return trashed
+
+    def restore(self, files):
+        """
+        Take the files of a queryset out of the trash. Raises IntegrityError if
+        one of them has the name of a file uploaded since.
+        Returns the number of files restored.
+        """
+        with transaction.atomic():
+            owners = set(files.filter(deleted_at__isnull=False).values_list('owner_id', flat=True).distinct())
+            restored = files.filter(deleted_at__isnull=False).update(deleted_at=None)
+            transaction.on_commit(lambda: bump_versions(owners))
+        logger.info(f"Restored {restored} files from the trash.")
+        return restored
+
+    def purge(self, files):
+        """
+        Delete the rows of a queryset (trashed or not) with a handful of
+        statements per batch instead of per-row signals: one DELETE and one blob
+        reference UPDATE per batch and one usage UPDATE per owner.
+        Returns the number of files deleted and the storage names of the plain
+        files to remove from disk. Must run in a transaction.
+        """
+        rows = list(files.select_for_update().values_list('pk', 'owner_id', 'size', 'blob_id', 'file'))
+        rows_manager = self.model._base_manager.db_manager(self.db)
+        for start in range(0, len(rows), DELETE_BATCH_SIZE):
+            batch = rows[start:start + DELETE_BATCH_SIZE]
+            rows_manager.filter(pk__in=[row[0] for row in batch])._raw_delete(self.db)
+            Blob.objects.release_many(Counter(blob_id for _, _, _, blob_id, _ in batch if blob_id))
+
+        usage = {}
+        for _, owner_id, size, _, _ in rows:
+            used, count = usage.get(owner_id, (0, 0))
+            usage[owner_id] = (used + size, count + 1)
+        for owner_id, (used, count) in usage.items():
+            UserProfile.objects.add_usage(owner_id, -used, -count)
+        transaction.on_commit(lambda: bump_versions(list(usage)))
+        return len(rows), [name for _, _, _, blob_id, name in rows if not blob_id and name]
+
+    def delete_files(self, files):
+        """
+        Delete the files of a queryset for good with purge(). Plain files are
+        removed from disk in the background once the transaction commits.
+        Returns the number of files deleted.
+        """
+        with transaction.atomic():
+            deleted, names = self.purge(files)
+            transaction.on_commit(lambda: background_remover.remove_later(names))
+        logger.info(f"Deleted {deleted} files.")
+        return deleted
+
+
+class LiveUserFileManager(UserFileManager):
+    """
+    Default manager: the files that are not in the trash.
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class UserFile(models.Model):
     """
@@ -59,8 +333,20 @@ class UserFile(models.Model):
         verbose_name='Original File Name'
     )
     file = models.FileField(upload_to=user_directory_path, verbose_name='File Location', max_length=500)
-    comment = models.TextField(blank=True, null=True, verbose_name='File Comment')
+    blob = models.ForeignKey(
+        Blob,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,  # Blobs are released through reference counting only
+        related_name='user_files',
+        verbose_name='Content Blob'
+    )
+    comment = models.TextField(blank=True, null=True, max_length=COMMENT_MAX_LENGTH, verbose_name='File Comment')
     size = models.BigIntegerField(verbose_name='File Size')  # Using BigIntegerField for large files
+    # At-rest compression of the content; size stays the logical size
+    codec = models.CharField(max_length=16, blank=True, default='', choices=CODEC_CHOICES, verbose_name='Stored Codec')
+    stored_size = models.BigIntegerField(null=True, blank=True, verbose_name='Stored Size')
+    cold = models.BooleanField(default=False, verbose_name='In Cold Storage')  # Moved to COLD_STORAGE_ROOT by tier_files
     upload_date = models.DateTimeField(
         auto_now_add=True, 
         db_index=True,  # Index for faster queries by upload date
@@ -71,20 +357,67 @@ class UserFile(models.Model):
         blank=True, 
         verbose_name='Last Downloaded Date'
     )
+    download_count = models.PositiveBigIntegerField(default=0, verbose_name='Download Count')
+    bytes_served = models.PositiveBigIntegerField(default=0, verbose_name='Bytes Served')
     special_link = models.CharField(
         max_length=255, 
         unique=True, 
         editable=False, 
         verbose_name='Unique File Link'
     )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Moved to Trash'
+    )
 
     class Meta:
-        unique_together = ('owner', 'original_filename')  # Enforcing unique file names for each user
+        constraints = [
+            # Enforcing unique file names for each user; trashed files do not hold their name
+            models.UniqueConstraint(
+                fields=['owner', 'original_filename'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='userfile_owner_name_live_uniq'
+            ),
+            # Comments are indexed, so every write path must respect the cap
+            models.CheckConstraint(
+                check=models.Q(comment__isnull=True) | models.Q(LessThanOrEqual(Length('comment'), COMMENT_MAX_LENGTH)),
+                name='userfile_comment_length'
+            ),
+        ]
         indexes = [
             models.Index(fields=['upload_date']),
             models.Index(fields=['owner']),
+            # Composite indexes for keyset pagination over every ordering field
+            models.Index(fields=['owner', 'id'], name='userfile_owner_id_idx'),
+            models.Index(fields=['owner', 'upload_date', 'id'], name='userfile_owner_uploaded_idx'),
+            models.Index(fields=['owner', 'original_filename', 'id'], name='userfile_owner_name_idx'),
+            models.Index(fields=['owner', 'size', 'id'], name='userfile_owner_size_idx'),
+            models.Index(fields=['owner', 'last_downloaded', 'id'], name='userfile_owner_downloaded_idx'),
+            models.Index(fields=['owner', 'comment', 'id'], name='userfile_owner_comment_idx'),
+            models.Index(fields=['upload_date', 'id'], name='userfile_uploaded_id_idx'),  # Superuser listing of all files
+            # Trash listings and purging; live files are left out of the index
+            models.Index(
+                fields=['deleted_at', 'id'],
+                condition=models.Q(deleted_at__isnull=False),
+                name='userfile_trash_idx'
+            ),
+            # Cold tiering candidates: files on the fast volume by last access, or by upload if never downloaded
+            models.Index(
+                fields=['last_downloaded', 'id'],
+                condition=models.Q(cold=False),
+                name='userfile_hot_access_idx'
+            ),
+            models.Index(
+                fields=['upload_date', 'id'],
+                condition=models.Q(cold=False, last_downloaded__isnull=True),
+                name='userfile_hot_unread_idx'
+            ),
         ]
 
+    objects = LiveUserFileManager()  # Files in the trash are hidden everywhere by default
+    all_objects = UserFileManager()
+
     def __str__(self):
         return f"File {self.original_filename} uploaded by {self.owner.username}"
 
@@ -103,6 +436,33 @@ class UserFile(models.Model):
 
         super().save(*args, **kwargs)
 
+    def set_content(self, content, sha256):
+        """
+        Point the file at its content. With BLOB_DEDUPLICATION the content goes
+        into the shared blob store, otherwise into the owner's directory.
+        Compressible content is stored compressed (AT_REST_COMPRESSION).
+        """
+        if settings.BLOB_DEDUPLICATION:
+            self.use_blob(Blob.objects.acquire(content, sha256, self.size))
+            return
+        self.codec, stored, self.stored_size = encode_content(content)
+        if stored is content:
+            self.file = content
+            return
+        try:
+            self.file.save(content.name, stored, save=False)
+        finally:
+            stored.close()
+
+    def use_blob(self, blob):
+        """
+        Point the file at the content of a blob.
+        """
+        self.blob = blob
+        self.file = blob.file.name
+        self.codec = blob.codec
+        self.stored_size = blob.stored_size
+
     def update_last_downloaded(self):
         """
         Updates the 'last_downloaded' field when the file is accessed.
@@ -111,16 +471,175 @@ class UserFile(models.Model):
         self.save(update_fields=['last_downloaded'])  # Save only the updated field
 
 
+class UploadSession(models.Model):
+    """
+    Model to track a resumable upload: chunks are appended to a partial file
+    until the received offset reaches the declared length, then the session
+    is finalized into a UserFile.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    original_filename = models.CharField(
+        max_length=255,
+        verbose_name='Original File Name'
+    )
+    comment = models.TextField(blank=True, null=True, max_length=COMMENT_MAX_LENGTH, verbose_name='File Comment')
+    length = models.BigIntegerField(verbose_name='Upload Length')  # Total size declared by the client
+    offset = models.BigIntegerField(default=0, verbose_name='Upload Offset')  # Bytes received so far
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Created')
+    expires_at = models.DateTimeField(
+        db_index=True,  # Index for purging abandoned sessions
+        verbose_name='Expires At'
+    )
+
+    def __str__(self):
+        return f"Upload of {self.original_filename} by {self.owner.username} ({self.offset}/{self.length})"
+
+    @property
+    def partial_path(self):
+        """
+        Absolute path of the partial file the chunks are appended to.
+        """
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{self.id.hex}.part')
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.length
+
+    def touch(self):
+        """
+        Push the expiry forward after activity on the session.
+        """
+        self.expires_at = timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def new_listing_version():
+    # Clock-based, so a scope whose row is created late still gets a number never used before
+    return time.time_ns()
+
+
+class ListingVersionManager(models.Manager):
+    def current(self, scope):
+        """
+        Return the version of a listing scope, creating it on first use.
+        """
+        version = self.filter(scope=scope).values_list('version', flat=True).first()
+        if version is None:
+            version = self.get_or_create(scope=scope, defaults={'version': new_listing_version()})[0].version
+        return version
+
+    async def acurrent(self, scope):
+        version = await self.filter(scope=scope).values_list('version', flat=True).afirst()
+        if version is None:
+            version = (await self.aget_or_create(scope=scope, defaults={'version': new_listing_version()}))[0].version
+        return version
+
+    def bump(self, scopes):
+        """
+        Move the given scopes to a new version with one UPDATE. Scopes without
+        a row have never been read, so nothing cached depends on them.
+        """
+        self.filter(scope__in=scopes).update(version=models.F('version') + 1)
+
+
+class ListingVersion(models.Model):
+    """
+    Version of the files in a listing scope (an owner, or all files), part of
+    the keys and ETags of cached listings. Kept in the database so that every
+    worker sees a change as soon as it is committed.
+    """
+    scope = models.CharField(max_length=64, primary_key=True, verbose_name='Scope')
+    version = models.BigIntegerField(verbose_name='Version')
+
+    objects = ListingVersionManager()
+
+    def __str__(self):
+        return f"Listing {self.scope} at version {self.version}"
+
+
 @receiver(post_delete, sender=UserFile)
 def delete_file_on_disk(sender, instance, **kwargs):
     """
     Deletes the file from disk when the corresponding record in the database is deleted.
-    This prevents "orphaned" files from remaining on the server.
+    This prevents "orphaned" files from remaining on the server. Deduplicated files
+    only release their blob, which is unlinked with its last reference.
     """
-    if instance.file:
+    if instance.blob_id:
+        Blob.objects.release(instance.blob_id)
+    elif instance.file:
         try:
-            if os.path.isfile(instance.file.path):
-                os.remove(instance.file.path)
+            if instance.file.storage.remove(instance.file.name):
                 logger.info(f"File '{instance.original_filename}' successfully deleted from disk.")
         except Exception as e:
             logger.error(f"Error deleting file '{instance.original_filename}': {str(e)}")
+
+
+@receiver(post_save, sender=UserFile)
+def add_storage_usage(sender, instance, created, **kwargs):
+    """
+    Counts a new file in its owner's usage, in the same transaction as the insert.
+    """
+    if created:
+        UserProfile.objects.add_usage(instance.owner_id, instance.size, 1)
+
+
+@receiver(post_delete, sender=UserFile)
+def subtract_storage_usage(sender, instance, **kwargs):
+    """
+    Removes a deleted file from its owner's usage, in the same transaction as the delete.
+    """
+    UserProfile.objects.add_usage(instance.owner_id, -instance.size, -1)
+
+
+@receiver(post_save, sender=UserFile)
+@receiver(post_delete, sender=UserFile)
+def invalidate_cached_listings(sender, instance, **kwargs):
+    """
+    Invalidates the cached listings and metadata of the file's owner once the
+    change is committed, so that the next request cannot cache the old rows.
+    """
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: bump_versions([owner_id]))
+
+
+@receiver(post_save, sender=UserFile)
+def render_previews_on_upload(sender, instance, created, **kwargs):
+    """
+    Queues the fixed-size previews of a new file once it is committed.
+    """
+    if created and settings.PREVIEW_ON_UPLOAD:
+        from .previews import preview_cache
+        transaction.on_commit(lambda: preview_cache.pregenerate(instance))
+
+
+@receiver(post_delete, sender=Blob)
+def delete_blob_on_disk(sender, instance, **kwargs):
+    """
+    Deletes the blob content from disk, in the background, once the blob row is gone for good.
+    """
+    name = instance.file.name
+    transaction.on_commit(lambda: background_remover.remove_later([name]))
+
+
+@receiver(post_delete, sender=UploadSession)
+def delete_partial_upload(sender, instance, **kwargs):
+    """
+    Deletes the partial file of a finished, cancelled or expired upload session
+    once the delete is committed (a failed finalization keeps it for a retry).
+    """
+    session_id, path = instance.id, instance.partial_path
+
+    def remove():
+        try:
+            os.remove(path)
+            logger.info(f"Partial upload '{session_id}' deleted from disk.")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error deleting partial upload '{session_id}': {str(e)}")
+
+    transaction.on_commit(remove)
@@ -0,0 +1,162 @@
+import json
+import base64
+import binascii
+import datetime
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .search import RANK
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (ordering field, id). Each page continues after
+    the last row of the previous one with an indexable WHERE clause, so the
+    cost of a page does not depend on how deep into the list it is.
+
+    NULLs sort last in ascending and first in descending order, which matches
+    the native B-tree order on PostgreSQL and lets it use the composite indexes.
+    Search results without an explicit ordering are paged by relevance.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    default_ordering = '-upload_date'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_results(list(self.page_queryset(queryset, request, view)))
+
+    def page_queryset(self, queryset, request, view=None):
+        """
+        Return the unevaluated queryset for the requested page (plus one row
+        to detect whether a next page exists).
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.ranked = RANK in queryset.query.annotations
+        self.field, self.descending = self.get_ordering(request, view)
+
+        queryset = queryset.order_by(*self.order_by())
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(*cursor))
+        return queryset[:self.page_size + 1]
+
+    def set_results(self, results):
+        """
+        Record the rows fetched from page_queryset() and return the page.
+        """
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_data(self, data):
+        return {'next': self.get_next_link(), 'results': data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request, view):
+        """
+        Return the (field, descending) pair from the ordering query parameter,
+        restricted to the view's ``ordering_fields``. Ranked search results
+        default to the most relevant first.
+        """
+        allowed = getattr(view, 'ordering_fields', None) or []
+        param = request.query_params.get(settings.REST_FRAMEWORK.get('ORDERING_PARAM', 'ordering'), '')
+        if self.ranked and not param.strip():
+            return RANK, True
+        ordering = param.split(',')[0].strip() or self.default_ordering
+        if ordering.lstrip('-') not in allowed:
+            ordering = self.default_ordering
+        field = self.model._meta.get_field(ordering.lstrip('-'))
+        return field.attname, ordering.startswith('-')
+
+    def order_by(self):
+        if self.field == 'id':
+            return [F('id').desc() if self.descending else F('id').asc()]
+        if self.descending:
+            return [F(self.field).desc(nulls_first=True), F('id').desc()]
+        return [F(self.field).asc(nulls_last=True), F('id').asc()]
+
+    def after(self, value, pk):
+        """
+        Build the condition selecting the rows strictly after (value, pk).
+        """
+        if self.field == 'id':
+            return Q(id__lt=pk) if self.descending else Q(id__gt=pk)
+
+        lookup, pk_lookup = ('lt', 'id__lt') if self.descending else ('gt', 'id__gt')
+        if value is None:
+            # NULLs come first when descending and last when ascending
+            condition = Q(**{f'{self.field}__isnull': True, pk_lookup: pk})
+            if self.descending:
+                condition |= Q(**{f'{self.field}__isnull': False})
+            return condition
+
+        condition = Q(**{f'{self.field}__{lookup}': value}) | Q(**{self.field: value, pk_lookup: pk})
+        if not self.descending:
+            condition |= Q(**{f'{self.field}__isnull': True})
+        return condition
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        position = {'o': f"{'-' if self.descending else ''}{self.field}", 'v': value, 'id': obj.pk}
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        """
+        Return the (value, pk) position encoded in the cursor query parameter,
+        or None on the first page.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if position['o'] != f"{'-' if self.descending else ''}{self.field}":
+                raise ValueError("Cursor belongs to another ordering.")
+            value = position['v']
+            if self.field == RANK:
+                value = float(value)
+            elif value is not None:
+                field = self.model._meta.get_field(self.field)
+                value = field.target_field.to_python(value) if field.is_relation else field.to_python(value)
+            return value, int(position['id'])
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        return None
@@ -11,4 +11,4 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner of the object
-        return obj.owner == request.user
+        return obj.owner_id == request.user.pk
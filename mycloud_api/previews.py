@@ -0,0 +1,303 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from PIL import Image, ImageOps
+from .compression import open_content
+from .downloads import file_validators, offload_enabled, set_offload_headers, stat_download
+
+logger = logging.getLogger(__name__)
+
+# Directory of the derived-asset cache, relative to MEDIA_ROOT
+PREVIEW_DIR = 'previews'
+
+# Requested widths are rounded up to a multiple of this, to bound the number of variants
+PREVIEW_WIDTH_STEP = 32
+
+# Preview formats by source extension: (Pillow format, extension, Content-Type)
+PNG_FORMAT = ('PNG', 'png', 'image/png')
+JPEG_FORMAT = ('JPEG', 'jpg', 'image/jpeg')
+
+# Seconds a client is asked to wait before asking again for a pending preview
+RETRY_AFTER = 1
+
+# Previews are touched at most this often (seconds) to keep their mtime usable for LRU eviction
+TOUCH_INTERVAL = 60 * 60
+
+# Cache size kept after an eviction, as a fraction of PREVIEW_CACHE_MAX_SIZE
+EVICTION_TARGET = 0.9
+
+# Number of failed previews remembered so they are not rendered again
+MAX_FAILED = 10000
+
+Preview = namedtuple('Preview', ['name', 'path', 'etag', 'format', 'content_type'])
+
+
+class PreviewUnavailable(Exception):
+    """
+    The file cannot be rendered as an image preview.
+    """
+
+
+def render_preview(source_path, target_path, width, image_format):
+    """
+    Resize an image to at most ``width`` pixels wide, keeping its aspect ratio,
+    and write it to ``target_path``. Runs in a worker process.
+    Returns the size of the written preview.
+    """
+    with Image.open(source_path) as source:
+        # JPEG sources are decoded at the smallest scale still covering the width
+        source.draft('RGB', (width, max(1, source.height * width // max(source.width, 1))))
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if image_format == 'PNG' else 'RGB')
+        elif image_format == 'JPEG' and image.mode in ('RGBA', 'LA'):
+            image = image.convert('RGB')
+        image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                if image_format == 'JPEG':
+                    image.save(target, image_format, quality=85, optimize=True, progressive=True)
+                else:
+                    image.save(target, image_format, optimize=True)
+            os.replace(temp_path, target_path)  # Readers never see a partial preview
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return os.path.getsize(target_path)
+
+
+def preview_width(query_params):
+    """
+    Return the width requested with ``size`` (a name from PREVIEW_SIZES) or
+    ``width`` (pixels). Raises ValueError if the request is invalid.
+    """
+    size = query_params.get('size')
+    if size is not None:
+        if size not in settings.PREVIEW_SIZES:
+            raise ValueError(f"Unknown preview size. Use one of: {', '.join(settings.PREVIEW_SIZES)}.")
+        return settings.PREVIEW_SIZES[size]
+
+    width = query_params.get('width')
+    if width is None:
+        return next(iter(settings.PREVIEW_SIZES.values()))
+    try:
+        width = int(width)
+    except ValueError:
+        raise ValueError("Width must be an integer.")
+    if not 1 <= width <= settings.PREVIEW_MAX_WIDTH:
+        raise ValueError(f"Width must be between 1 and {settings.PREVIEW_MAX_WIDTH}.")
+    return min(-(-width // PREVIEW_WIDTH_STEP) * PREVIEW_WIDTH_STEP, settings.PREVIEW_MAX_WIDTH)
+
+
+class PreviewCache:
+    """
+    Derived-asset cache of image previews under MEDIA_ROOT/previews. Previews
+    are named by the source content and width, so deduplicated files share
+    them. Rendering runs in a process pool, off the request path; once more
+    than PREVIEW_CACHE_MAX_SIZE bytes are stored, the least recently used
+    previews are evicted.
+    """
+    def __init__(self):
+        self._executor = None
+        self._stager = None  # Threads fetching sources that are not on the local disk
+        self._pending = {}  # preview path -> Future
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._written = 0  # Bytes written since the last eviction check
+        self._evicting = threading.Lock()
+
+    def preview_for(self, user_file, stored, width):
+        etag, _ = file_validators(user_file, stored)
+        # Deduplicated files are keyed by their digest alone; others also by their name
+        source = etag if user_file.blob_id else f'{user_file.file.name}:{etag}'
+        key = hashlib.sha256(source.encode()).hexdigest()
+        image_format, extension, content_type = (
+            PNG_FORMAT if user_file.original_filename.lower().endswith('.png') else JPEG_FORMAT
+        )
+        name = os.path.join(PREVIEW_DIR, key[:2], f'{key}-{width}.{extension}')
+        return Preview(name, os.path.join(settings.MEDIA_ROOT, name), f'"{key}-{width}"', image_format, content_type)
+
+    def get(self, user_file, width):
+        """
+        Return the Preview of a file at the given width, or None if it is being
+        rendered. Raises PreviewUnavailable if the file cannot be rendered and
+        Http404 if it is missing from the storage.
+        """
+        stored = stat_download(user_file)
+        preview = self.preview_for(user_file, stored, width)
+        try:
+            preview_stat = os.stat(preview.path)
+        except FileNotFoundError:
+            self.submit(user_file, preview, width)
+            return None
+
+        if time.time() - preview_stat.st_mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(preview.path)  # Mark as recently used
+            except OSError:
+                pass
+        return preview
+
+    def pregenerate(self, user_file):
+        """
+        Queue the PREVIEW_SIZES previews of a file that are not rendered yet.
+        """
+        try:
+            stored = stat_download(user_file)
+        except Http404:
+            return
+        for width in settings.PREVIEW_SIZES.values():
+            preview = self.preview_for(user_file, stored, width)
+            if not os.path.exists(preview.path):
+                try:
+                    self.submit(user_file, preview, width)
+                except PreviewUnavailable:
+                    return
+
+    def submit(self, user_file, preview, width):
+        # Compressed sources are decompressed into a temporary file first
+        source_path = None if user_file.codec else user_file.file.storage.local_path(user_file.file.name)
+        with self._lock:
+            if preview.path in self._failed:
+                raise PreviewUnavailable("Preview is not available for this file.")
+            if preview.path in self._pending:
+                return
+            os.makedirs(os.path.dirname(preview.path), exist_ok=True)
+            if source_path is None:
+                future = self._get_stager().submit(self._render_staged, user_file, preview, width)
+            else:
+                future = self._render(source_path, preview, width)
+            self._pending[preview.path] = future
+        logger.debug("Rendering preview '%s'.", preview.name)
+        future.add_done_callback(partial(self._done, preview.path))
+
+    def _render(self, source_path, preview, width):
+        try:
+            return self._get_executor().submit(render_preview, source_path, preview.path, width, preview.format)
+        except BrokenProcessPool:
+            self._executor = None  # A worker died; start a fresh pool
+            return self._get_executor().submit(render_preview, source_path, preview.path, width, preview.format)
+
+    def _render_staged(self, user_file, preview, width):
+        """
+        Copy the content of a file held in a remote storage or compressed to a
+        temporary file and render it from there. Runs in a stager thread.
+        """
+        fd, source_path = tempfile.mkstemp(suffix='.preview-source')
+        try:
+            with os.fdopen(fd, 'wb') as target, open_content(user_file) as source:
+                shutil.copyfileobj(source, target, settings.DOWNLOAD_CHUNK_SIZE)
+            with self._lock:
+                future = self._render(source_path, preview, width)
+            return future.result()
+        finally:
+            os.remove(source_path)
+
+    def _get_stager(self):
+        if self._stager is None:
+            self._stager = ThreadPoolExecutor(max_workers=settings.PREVIEW_WORKERS, thread_name_prefix='preview-source')
+        return self._stager
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Spawned workers do not inherit the server's threads, locks or connections
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.PREVIEW_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _done(self, path, future):
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._pending.pop(path, None)
+            if isinstance(error, BrokenProcessPool):
+                self._executor = None
+            elif error is not None:
+                if len(self._failed) >= MAX_FAILED:
+                    self._failed.clear()
+                self._failed.add(path)
+        if error is not None:
+            logger.error("Error rendering preview '%s': %s", path, str(error))
+            return
+        if future.cancelled():
+            return
+
+        self._written += future.result()
+        if self._written >= settings.PREVIEW_CACHE_MAX_SIZE * (1 - EVICTION_TARGET) / 2:
+            self._written = 0
+            threading.Thread(target=self.evict, name='preview-eviction', daemon=True).start()
+
+    def evict(self):
+        """
+        Delete the least recently used previews until the cache is back under
+        EVICTION_TARGET of PREVIEW_CACHE_MAX_SIZE.
+        """
+        if not self._evicting.acquire(blocking=False):
+            return  # Another eviction is running
+        try:
+            entries = []
+            total = 0
+            root = os.path.join(settings.MEDIA_ROOT, PREVIEW_DIR)
+            for directory in os.scandir(root):
+                if not directory.is_dir():
+                    continue
+                for entry in os.scandir(directory.path):
+                    try:
+                        entry_stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+                    total += entry_stat.st_size
+            if total <= settings.PREVIEW_CACHE_MAX_SIZE:
+                return
+
+            target = settings.PREVIEW_CACHE_MAX_SIZE * EVICTION_TARGET
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            logger.info("Evicted %s previews from the preview cache.", removed)
+        except FileNotFoundError:
+            pass
+        finally:
+            self._evicting.release()
+
+
+preview_cache = PreviewCache()
+
+
+def preview_response(request, preview):
+    """
+    Serve a rendered preview inline, answering conditional requests with 304.
+    Raises FileNotFoundError if the preview was evicted since it was looked up.
+    """
+    response = get_conditional_response(request, etag=preview.etag)
+    if response is None:
+        if offload_enabled():
+            response = set_offload_headers(HttpResponse(content_type=preview.content_type), preview.name, preview.path)
+        else:
+            response = FileResponse(open(preview.path, 'rb'), content_type=preview.content_type)
+            response.block_size = settings.DOWNLOAD_CHUNK_SIZE
+    response['ETag'] = preview.etag
+    patch_cache_control(response, private=True, max_age=settings.PREVIEW_CACHE_MAX_AGE)
+    return response
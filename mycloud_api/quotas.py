@@ -0,0 +1,47 @@
+import logging
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Bytes of multipart framing and form fields allowed for when checking an upload's Content-Length
+MULTIPART_ALLOWANCE = 64 * 1024
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Storage quota exceeded.'
+    default_code = 'quota_exceeded'
+
+
+def check_quota(user, size, lock=False):
+    """
+    Raise QuotaExceeded if storing ``size`` more bytes would take the user over
+    their quota (or the default STORAGE_QUOTA). With ``lock`` the user's row is
+    locked until the end of the transaction, so that concurrent uploads are
+    checked one after the other.
+    """
+    users = UserProfile.objects.filter(pk=user.pk)
+    if lock:
+        users = users.select_for_update()
+    used, quota = users.values_list('storage_used', 'storage_quota').get()
+    if quota is None:
+        quota = settings.STORAGE_QUOTA
+    if quota is not None and used + size > quota:
+        logger.warning("Storage quota of user %s exceeded: %s + %s > %s bytes.", user.pk, used, size, quota)
+        raise QuotaExceeded(f"Storage quota exceeded: {used} of {quota} bytes used, {size} more requested.")
+
+
+def check_content_length(request):
+    """
+    Reject an upload whose Content-Length cannot fit in the user's quota,
+    before the request body is read.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return
+    if content_length > MULTIPART_ALLOWANCE:
+        check_quota(request.user, content_length - MULTIPART_ALLOWANCE)
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import heapq
+import logging
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Collate
+from django.utils import timezone
+from .cleanup import remove_files
+from .models import Blob, UploadSession, UserFile
+
+logger = logging.getLogger(__name__)
+
+# Directories under MEDIA_ROOT holding tracked content, in storage-name order; previews are a cache
+SCANNED_DIRECTORIES = ['blobs', 'uploads', 'user_files']
+
+# Rows fetched per round trip while streaming the database side
+ITERATOR_CHUNK_SIZE = 2000
+
+# Directory listings read ahead of the merge, per directory being walked
+READ_AHEAD = 32
+
+# Findings repaired at a time
+REPAIR_BATCH_SIZE = 500
+
+# Entries merged between two checkpoints
+CHECKPOINT_INTERVAL = 100000
+
+# Default cap on the files removed and on the rows deleted by one repairing run
+MAX_DELETIONS = 1000
+
+DiskEntry = namedtuple('DiskEntry', ['name', 'size', 'mtime'])
+StoredEntry = namedtuple('StoredEntry', ['name', 'kind', 'pk', 'size'])
+
+
+class ScanAborted(Exception):
+    """
+    The storage cannot be listed reliably (a failed listing or a missing
+    top-level directory); going on would take unreadable files for missing ones.
+    """
+
+
+def entry_key(name, is_dir):
+    # A directory sorts as its name plus '/', which makes a depth-first walk
+    # yield paths in the same order as sorting the full names
+    return name + '/' if is_dir else name
+
+
+def list_directory(path):
+    """
+    Return the sorted (key, name, size, mtime) entries of a directory; size
+    and mtime are None for subdirectories. A directory removed since its
+    parent was listed is empty; any other error raises ScanAborted.
+    """
+    entries = []
+    try:
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        entries.append((entry_key(entry.name, True), entry.name, None, None))
+                    elif entry.is_file(follow_symlinks=False):
+                        entry_stat = entry.stat(follow_symlinks=False)
+                        entries.append((entry.name, entry.name, entry_stat.st_size, entry_stat.st_mtime))
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        return []
+    except OSError as e:
+        logger.error("Cannot list '%s': %s", path, str(e))
+        raise ScanAborted(f"Cannot list '{path}': {e}") from e
+    entries.sort()
+    return entries
+
+
+class StorageWalker:
+    """
+    Depth-first walk of the storage tree yielding DiskEntry tuples in
+    storage-name order. Directories are listed by a thread pool, up to
+    READ_AHEAD siblings ahead of the one being walked, so only the listings
+    in flight are held in memory.
+    """
+    def __init__(self, root, executor, after=None):
+        self.root = root
+        self.executor = executor
+        self.after = after  # Storage name to resume after
+
+    def walk(self, directories):
+        for directory in sorted(directories, key=lambda name: entry_key(name, True)):
+            if self._skipped(directory):
+                continue
+            yield from self._walk(directory, list_directory(os.path.join(self.root, directory)))
+
+    def _skipped(self, directory):
+        # Everything in the directory sorts before the resume position
+        prefix = directory + '/'
+        return self.after is not None and prefix < self.after and not self.after.startswith(prefix)
+
+    def _walk(self, directory, entries):
+        subdirectories = iter(
+            f'{directory}/{name}' for _, name, size, _ in entries
+            if size is None and not self._skipped(f'{directory}/{name}')
+        )
+        pending = deque()
+
+        def read_ahead():
+            while len(pending) < READ_AHEAD:
+                path = next(subdirectories, None)
+                if path is None:
+                    return
+                pending.append((path, self.executor.submit(list_directory, os.path.join(self.root, path))))
+
+        for _, name, size, mtime in entries:
+            path = f'{directory}/{name}'
+            if size is not None:
+                if self.after is None or path > self.after:
+                    yield DiskEntry(path, size, mtime)
+            elif not self._skipped(path):
+                read_ahead()
+                subdirectory, listing = pending.popleft()
+                yield from self._walk(subdirectory, listing.result())
+
+
+def name_order(field):
+    """
+    Expression ordering storage names by code point, like the walk. PostgreSQL
+    would otherwise use the locale's collation; SQLite compares bytes already.
+    """
+    return Collate(F(field), 'C') if connection.vendor == 'postgresql' else F(field)
+
+
+def stored_entries(after=None):
+    """
+    Stream every storage name the database refers to, as StoredEntry tuples
+    in storage-name order, by merging the (already sorted) result sets of
+    plain files, blobs and upload sessions.
+    """
+    files = UserFile.all_objects.filter(blob__isnull=True).exclude(file='').annotate(name=name_order('file'))
+    blobs = Blob.objects.annotate(name=name_order('file'))
+    sessions = UploadSession.objects.order_by('id')
+    if after is not None:
+        files = files.filter(name__gt=after)
+        blobs = blobs.filter(name__gt=after)
+
+    def rows(queryset, kind):
+        # Compressed content takes stored_size bytes on disk
+        queryset = queryset.annotate(disk_size=Coalesce('stored_size', 'size')).order_by('name')
+        for pk, name, size in queryset.values_list('pk', 'name', 'disk_size').iterator(ITERATOR_CHUNK_SIZE):
+            yield StoredEntry(name, kind, pk, size)
+
+    def partial_uploads():
+        for pk, offset in sessions.values_list('pk', 'offset').iterator(ITERATOR_CHUNK_SIZE):
+            name = f'uploads/{pk.hex}.part'
+            if after is None or name > after:
+                yield StoredEntry(name, 'upload', pk, offset)
+
+    return heapq.merge(rows(files, 'file'), rows(blobs, 'blob'), partial_uploads(), key=lambda entry: entry.name)
+
+
+class StorageScan:
+    """
+    Reconciliation of the storage tree with the database. Both sides are
+    streamed in storage-name order and merge-joined, reporting files without
+    a row (orphans), rows without a file (missing, unless it was moved to the
+    cold root) and size mismatches.
+    With ``repair``, orphans are removed and files whose content is missing
+    are deleted; entries younger than ``min_age`` seconds are left alone, as
+    they may belong to an upload or deletion in progress. Repairs stop for
+    the rest of the run once they would remove more than ``max_deletions``
+    files or delete more than ``max_deletions`` rows: that many findings
+    point at a storage problem rather than at stray files.
+    Progress is saved to ``checkpoint`` so an interrupted or time-limited scan
+    resumes where it stopped.
+    """
+    def __init__(self, repair=False, min_age=60 * 60, checkpoint=None, workers=8, time_limit=None, report=None,
+                 max_deletions=MAX_DELETIONS):
+        self.repair = repair
+        self.min_age = min_age
+        self.max_deletions = max_deletions
+        self.repairs_halted = False
+        self._deletions = Counter()  # Made by this run; the counts also cover earlier runs of a resumed scan
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.deadline = time.monotonic() + time_limit if time_limit else None
+        self.report = report or (lambda finding, name: None)
+        self.position = None
+        self.counts = Counter()
+        self._merged = 0
+        self._orphans = []
+        self._missing = []
+
+    def run(self):
+        """
+        Scan from the checkpoint to the end, or until the time limit.
+        Returns True if the scan completed. Raises ScanAborted, without
+        repairing the findings still pending, if the storage cannot be listed.
+        """
+        self._load_checkpoint()
+        self._check_directories()
+        started = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='storage-scan') as executor:
+                disk = StorageWalker(settings.MEDIA_ROOT, executor, after=self.position).walk(SCANNED_DIRECTORIES)
+                stored = stored_entries(after=self.position)
+                completed = self._merge(disk, stored, started)
+        except ScanAborted:
+            self._orphans, self._missing = [], []
+            raise
+        self._apply()
+        self._save_checkpoint(None if completed else self.position)
+        return completed
+
+    def _check_directories(self):
+        """
+        Raise ScanAborted if a top-level directory holding tracked content is
+        missing, as when the volume is not mounted: every row would look lost.
+        """
+        for directory in SCANNED_DIRECTORIES:
+            if os.path.isdir(os.path.join(settings.MEDIA_ROOT, directory)):
+                continue
+            prefix = f'{directory}/'
+            if (UserFile.all_objects.filter(blob__isnull=True, file__startswith=prefix).exists()
+                    or Blob.objects.filter(file__startswith=prefix).exists()
+                    or (directory == 'uploads' and UploadSession.objects.filter(offset__gt=0).exists())):
+                raise ScanAborted(f"Directory '{directory}' is missing from MEDIA_ROOT but holds tracked files.")
+
+    def _merge(self, disk, stored, started):
+        file, row = next(disk, None), next(stored, None)
+        while file is not None or row is not None:
+            if row is None or (file is not None and file.name < row.name):
+                self._orphan(file, started)
+                self.position, file = file.name, next(disk, None)
+            elif file is None or row.name < file.name:
+                self._missing_file(row)
+                self.position, row = row.name, next(stored, None)
+            else:
+                self.counts['matched'] += 1
+                if row.kind != 'upload' and row.size != file.size:
+                    self.counts['size_mismatch'] += 1
+                    self.report('size_mismatch', f'{file.name} ({row.size} bytes recorded, {file.size} on disk)')
+                self.position, file, row = file.name, next(disk, None), next(stored, None)
+
+            self._merged += 1
+            if len(self._orphans) + len(self._missing) >= REPAIR_BATCH_SIZE or self._merged >= CHECKPOINT_INTERVAL:
+                self._merged = 0
+                self._apply()
+                self._save_checkpoint(self.position)
+                if self.deadline is not None and time.monotonic() > self.deadline:
+                    return False
+        return True
+
+    def _orphan(self, file, started):
+        self.counts['orphan'] += 1
+        self.report('orphan', file.name)
+        if started - file.mtime >= self.min_age:
+            self._orphans.append(file.name)
+
+    def _missing_file(self, row):
+        if row.kind == 'upload':
+            return  # Sessions create their partial file with the first chunk
+        if default_storage.exists(row.name):
+            self.counts['cold'] += 1  # Moved to the cold root by tier_files
+            return
+        self.counts['missing'] += 1
+        self.report('missing', row.name)
+        self._missing.append(row)
+
+    def _apply(self):
+        """
+        Repair the findings collected so far, re-checking each one first.
+        """
+        orphans, missing = self._orphans, self._missing
+        self._orphans, self._missing = [], []
+        if not self.repair or self.repairs_halted:
+            return
+
+        if orphans:
+            # A row may have been committed since the database side passed the name
+            referenced = set(UserFile.all_objects.filter(file__in=orphans).values_list('file', flat=True))
+            referenced.update(Blob.objects.filter(file__in=orphans).values_list('file', flat=True))
+            orphans = [name for name in orphans if name not in referenced]
+            if self._over_limit('orphans_removed', len(orphans)):
+                return
+            self.counts['orphans_removed'] += remove_files(orphans)
+
+        gone = [row for row in missing if not default_storage.exists(row.name)]
+        file_ids = [row.pk for row in gone if row.kind == 'file']
+        blob_ids = [row.pk for row in gone if row.kind == 'blob']  # Every file sharing a lost blob lost its content
+        if not file_ids and not blob_ids:
+            return
+        files = UserFile.all_objects.filter(upload_date__lt=timezone.now() - timedelta(seconds=self.min_age))
+        doomed = list(files.filter(Q(pk__in=file_ids) | Q(blob_id__in=blob_ids)).values_list('pk', flat=True))
+        if doomed and not self._over_limit('rows_deleted', len(doomed)):
+            self.counts['rows_deleted'] += UserFile.all_objects.delete_files(UserFile.all_objects.filter(pk__in=doomed))
+
+    def _over_limit(self, count, n):
+        """
+        Check whether ``n`` more deletions would take this run's ``count`` past
+        max_deletions, halting the repairs for the rest of the run if so.
+        """
+        if self._deletions[count] + n <= self.max_deletions:
+            self._deletions[count] += n
+            return False
+        self.repairs_halted = True
+        logger.error("Storage scan repairs halted: %s would exceed %s (%s done, %s more found).",
+                     count, self.max_deletions, self._deletions[count], n)
+        self.report('repairs_halted', f'{count} would exceed {self.max_deletions}')
+        return True
+
+    def _load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        self.position = state.get('position')
+        self.counts.update(state.get('counts', {}))
+        if self.position:
+            logger.info("Resuming the storage scan after '%s'.", self.position)
+
+    def _save_checkpoint(self, position):
+        if not self.checkpoint:
+            return
+        if position is None:
+            if os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)  # The next run starts over
+            return
+        temp_path = f'{self.checkpoint}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'position': position, 'counts': self.counts}, f)
+        os.replace(temp_path, self.checkpoint)
+
@@ -0,0 +1,143 @@
+import logging
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest
+from rest_framework.filters import BaseFilterBackend
+
+logger = logging.getLogger(__name__)
+
+# Annotation holding the relevance of each match; higher is better
+RANK = 'search_rank'
+
+# SQLite FTS5 index over UserFile names and comments, kept in sync by triggers (migration 0011)
+FTS_TABLE = 'mycloud_api_userfile_fts'
+
+# The trigram tokenizer and pg_trgm index only help with queries of at least three characters
+MIN_INDEXED_LENGTH = 3
+
+# Relevance of a comment match relative to a filename match
+COMMENT_WEIGHT = 0.5
+
+# Triggers keeping the FTS5 index in sync; SQLite drops them whenever a migration rebuilds the table
+FTS_TRIGGERS = {
+    f'{FTS_TABLE}_insert':
+        f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON mycloud_api_userfile BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, original_filename, comment) "
+        f"VALUES (new.id, new.original_filename, new.comment); END",
+    f'{FTS_TABLE}_delete':
+        f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON mycloud_api_userfile BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_filename, comment) "
+        f"VALUES ('delete', old.id, old.original_filename, old.comment); END",
+    f'{FTS_TABLE}_update':
+        f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF original_filename, comment ON mycloud_api_userfile BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_filename, comment) "
+        f"VALUES ('delete', old.id, old.original_filename, old.comment); "
+        f"INSERT INTO {FTS_TABLE}(rowid, original_filename, comment) "
+        f"VALUES (new.id, new.original_filename, new.comment); END",
+}
+
+# Whether the FTS5 index exists, by database alias
+_fts_available = {}
+
+
+class WordSimilarity(Func):
+    """
+    pg_trgm's word_similarity(): how well the query matches the closest part of the text.
+    """
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+def search_backend(connection):
+    """
+    Return how a database is searched: 'trigram' (PostgreSQL with pg_trgm
+    indexes), 'fts5' (SQLite with the FTS5 index) or 'basic' (unindexed scans).
+    """
+    if connection.vendor == 'postgresql':
+        return 'trigram'
+    if connection.vendor == 'sqlite':
+        if connection.alias not in _fts_available:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                    _fts_available[connection.alias] = cursor.fetchone() is not None
+            except DatabaseError:
+                return 'basic'
+            if not _fts_available[connection.alias]:
+                logger.warning("The full-text index '%s' is missing; searches scan the whole file table.", FTS_TABLE)
+        if _fts_available[connection.alias]:
+            return 'fts5'
+    return 'basic'
+
+
+def restore_fts_triggers(using='default', **kwargs):
+    """
+    post_migrate handler recreating the FTS5 triggers when a migration rebuilt
+    the UserFile table on SQLite, and reindexing the rows changed meanwhile.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, *FTS_TRIGGERS]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in FTS_TRIGGERS if name not in existing]
+        if FTS_TABLE not in existing or not missing:
+            return
+        for name in missing:
+            cursor.execute(FTS_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    logger.warning("Recreated %s search index triggers and rebuilt '%s'.", len(missing), FTS_TABLE)
+
+
+def fts_phrase(query):
+    # One quoted phrase: the trigram tokenizer then matches it as a substring, like ICONTAINS
+    return '"%s"' % query.replace('"', '""')
+
+
+def search_files(queryset, query):
+    """
+    Narrow a UserFile queryset to the files whose name or comment contains
+    ``query`` (case-insensitively) and annotate each with its RANK. Matches are
+    found through the database's text index, so the cost depends on the number
+    of matches rather than on the size of the table.
+    """
+    backend = search_backend(connections[queryset.db])
+    matches = Q(original_filename__icontains=query) | Q(comment__icontains=query)
+
+    if backend == 'trigram':
+        # The ICONTAINS conditions are answered by the GIN indexes on UPPER(column)
+        return queryset.filter(matches).annotate(**{RANK: Greatest(
+            WordSimilarity(Value(query), F('original_filename')),
+            WordSimilarity(Value(query), Coalesce(F('comment'), Value(''))) * COMMENT_WEIGHT,
+        )})
+
+    if backend == 'fts5' and len(query) >= MIN_INDEXED_LENGTH:
+        # Joined rather than a correlated subquery, so bm25() is computed once per match
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[fts_phrase(query)],
+        ).annotate(**{RANK: RawSQL(f'-bm25({FTS_TABLE}, 1.0, %s)', (COMMENT_WEIGHT,), output_field=FloatField())})
+
+    return queryset.filter(matches).annotate(**{RANK: Value(1.0, output_field=FloatField())})
+
+
+class FileSearchFilter(BaseFilterBackend):
+    """
+    Ranked search over file names and comments with the search query
+    parameter. Without an explicit ordering, results come most relevant first.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(settings.REST_FRAMEWORK.get('SEARCH_PARAM', 'search'), '')
+        query = query.replace('\x00', '').strip()
+        if not query:
+            return queryset
+        logger.debug("Searching files for '%s'.", query)
+        return search_files(queryset, query)
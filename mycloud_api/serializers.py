@@ -4,17 +4,63 @@ from django.conf import settings
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from rest_framework import serializers
-from .models import UserProfile, UserFile
+from .models import COMMENT_MAX_LENGTH, UserProfile, UserFile, UploadSession
 
 logger = logging.getLogger(__name__)
 
+ALLOWED_FILE_EXTENSIONS = ('.jpg', '.png', '.jpeg')  # Allowed upload formats
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # Max size 10MB for single-request uploads
+MAX_BATCH_OPERATIONS = 1000  # Max operations in one batch request
+MAX_ARCHIVE_FILES = 1000  # Max files in one archive download
+FILE_NAME_PATTERN = re.compile(r'^[a-zA-Z0-9._-]+$')  # Allowed characters for file names
+
+
+def validate_file_name(value, check_extension=True):
+    """
+    Validate the allowed characters and, unless ``check_extension`` is False,
+    the format of a file name.
+    """
+    if not FILE_NAME_PATTERN.match(value):
+        raise serializers.ValidationError("Invalid characters in file name. Only letters, numbers, '-', '_', and '.' are allowed.")
+    if check_extension and not value.endswith(ALLOWED_FILE_EXTENSIONS):
+        raise serializers.ValidationError("File format must be JPG, PNG, or JPEG.")
+    return value
+
+
+def validate_name_available(user, value, instance=None):
+    """
+    Validate that ``user`` has no other file named ``value``.
+    """
+    same_name = UserFile.objects.filter(owner=user, original_filename=value)
+    if instance is not None:
+        same_name = same_name.exclude(pk=instance.pk)
+    if same_name.exists():
+        raise serializers.ValidationError("A file with this name already exists.")
+    return value
+
+
+class CommentValidationMixin:
+    """
+    Validates the ``comment`` field of the file serializers.
+    """
+    def validate_comment(self, value):
+        """
+        Validate that the comment does not exceed COMMENT_MAX_LENGTH characters.
+        """
+        if value and len(value) > COMMENT_MAX_LENGTH:
+            raise serializers.ValidationError(f"Comment is too long. Max length is {COMMENT_MAX_LENGTH} characters.")
+        return value
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Serializer for the UserProfile model with basic fields and custom validation.
     """
     class Meta:
         model = UserProfile 
-        fields = ['username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser']  # Use existing fields
+        fields = ['username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser',
+                  'storage_used', 'file_count', 'storage_quota']  # Use existing fields
+        read_only_fields = ['storage_used', 'file_count', 'storage_quota']  # Maintained by the server
 
     def validate_username(self, value):
         """
@@ -36,14 +82,16 @@ class UserSerializer(serializers.ModelSerializer):
         return value
 
 
-class FileSerializer(serializers.ModelSerializer):
+class FileSerializer(CommentValidationMixin, serializers.ModelSerializer):
     """
     Serializer for the UserFile model with custom validation logic.
     """
     class Meta:
         model = UserFile
-        fields = ['id', 'original_filename', 'file', 'comment', 'size', 'upload_date', 'last_downloaded']
-        read_only_fields = ['owner', 'upload_date', 'last_downloaded']  # Read-only fields
+        fields = ['id', 'original_filename', 'file', 'comment', 'size', 'upload_date', 'last_downloaded',
+                  'download_count', 'bytes_served', 'deleted_at', 'codec', 'stored_size']
+        read_only_fields = ['owner', 'upload_date', 'last_downloaded', 'download_count', 'bytes_served',
+                            'deleted_at', 'codec', 'stored_size']  # Read-only fields
 
     def create(self, validated_data):
         """
@@ -53,32 +101,21 @@ class FileSerializer(serializers.ModelSerializer):
         validated_data['owner'] = user
         return super().create(validated_data)
 
-    def validate_comment(self, value):
-        """
-        Validate that the comment does not exceed 500 characters.
-        """
-        if value and len(value) > 500:
-            raise serializers.ValidationError("Comment is too long. Max length is 500 characters.")
-        return value
-
     def validate_original_filename(self, value):
         """
-        Validate the uniqueness and allowed characters of the file name.
+        Validate the uniqueness (per owner) and allowed characters of the file name.
         """
-        if UserFile.objects.filter(original_filename=value).exists():
-            raise serializers.ValidationError("A file with this name already exists.")
-        if not re.match(r'^[a-zA-Z0-9._-]+$', value):  # Allowed characters for file name
-            raise serializers.ValidationError("Invalid characters in file name. Only letters, numbers, '-', '_', and '.' are allowed.")
-        return value
+        validate_name_available(self.context['request'].user, value, self.instance)
+        return validate_file_name(value, check_extension=False)  # The format is checked on the file itself
 
     def validate_file(self, value):
         """
         Validate the file size and format.
         """
-        max_size = 10 * 1024 * 1024  # Max size 10MB
+        max_size = MAX_UPLOAD_SIZE
         if value.size > max_size:
             raise serializers.ValidationError(f"File size should not exceed {max_size / (1024 * 1024)} MB.")
-        if not value.name.endswith(('.jpg', '.png', '.jpeg')):  # Allowed formats
+        if not value.name.endswith(ALLOWED_FILE_EXTENSIONS):  # Allowed formats
             raise serializers.ValidationError("File format must be JPG, PNG, or JPEG.")
         return value
 
@@ -98,3 +135,87 @@ class FileSerializer(serializers.ModelSerializer):
         if 'last_downloaded' in validated_data:
             instance.last_downloaded = validated_data['last_downloaded']
         return super().update(instance, validated_data)
+
+
+class UploadSessionSerializer(CommentValidationMixin, serializers.ModelSerializer):
+    """
+    Serializer for resumable upload sessions.
+    """
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'original_filename', 'comment', 'length', 'offset', 'created', 'expires_at']
+        read_only_fields = ['id', 'offset', 'created', 'expires_at']
+
+    def validate_original_filename(self, value):
+        """
+        Validate the allowed characters and format of the file name, and that the
+        owner has no file with this name yet.
+        """
+        validate_file_name(value)
+        return validate_name_available(self.context['request'].user, value)
+
+    def validate_length(self, value):
+        """
+        Validate the declared upload size against UPLOAD_SESSION_MAX_SIZE.
+        """
+        max_size = settings.UPLOAD_SESSION_MAX_SIZE
+        if value <= 0:
+            raise serializers.ValidationError("Upload length must be positive.")
+        if value > max_size:
+            raise serializers.ValidationError(f"File size should not exceed {max_size / (1024 * 1024)} MB.")
+        return value
+
+
+class UploadPreflightSerializer(CommentValidationMixin, serializers.Serializer):
+    """
+    Serializer for the upload pre-flight check: describes a file the client is
+    about to upload, without its content.
+    """
+    original_filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=0)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', error_messages={'invalid': "Enter a hex SHA-256 digest."})
+    comment = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_original_filename(self, value):
+        """
+        Apply the same name rules as a regular upload.
+        """
+        validate_file_name(value)
+        return validate_name_available(self.context['request'].user, value)
+
+    def validate_size(self, value):
+        """
+        Validate the size against the single-request upload limit.
+        """
+        if value > MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(f"File size should not exceed {MAX_UPLOAD_SIZE / (1024 * 1024)} MB.")
+        return value
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+
+class BatchOperationSerializer(CommentValidationMixin, serializers.Serializer):
+    """
+    Serializer for one operation of a batch request: delete, rename or
+    comment a file. Name uniqueness is checked when the batch is applied.
+    """
+    OPERATIONS = ('delete', 'rename', 'comment')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    id = serializers.IntegerField()
+    new_name = serializers.CharField(max_length=255, required=False)
+    comment = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_new_name(self, value):
+        """
+        Apply the same name rules as a regular upload.
+        """
+        return validate_file_name(value)
+
+    def validate(self, data):
+        if data['op'] == 'rename' and 'new_name' not in data:
+            raise serializers.ValidationError({'new_name': "This field is required to rename a file."})
+        if data['op'] == 'comment' and 'comment' not in data:
+            raise serializers.ValidationError({'comment': "This field is required to update a comment."})
+        return data
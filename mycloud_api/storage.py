@@ -0,0 +1,543 @@
+import os
+import hmac
+import stat
+import queue
+import socket
+import tempfile
+import hashlib
+import logging
+import datetime
+import http.client
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urljoin, urlsplit
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils._os import safe_join
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+# Metadata of a stored file; mtime in seconds, mtime_ns for validators
+StoredObject = namedtuple('StoredObject', ['name', 'size', 'mtime', 'mtime_ns'])
+
+# SHA-256 of an empty payload, signed for requests without a body
+EMPTY_PAYLOAD_SHA256 = hashlib.sha256(b'').hexdigest()
+
+# Smallest part S3 accepts in a multipart upload, except for the last one
+MIN_PART_SIZE = 5 * 1024 ** 2
+
+# Bytes copied at a time between the fast volume and the cold root
+COPY_CHUNK_SIZE = 1024 ** 2
+
+# Errors on a pooled connection the server may have closed while it was idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           ConnectionResetError, BrokenPipeError)
+
+
+class FileRange:
+    """
+    File-like view over ``length`` bytes of an open file starting at ``offset``.
+    It keeps ``fileno()`` so servers can still send the range with ``os.sendfile``
+    from the current file position, bounded by the response Content-Length.
+    """
+    def __init__(self, fileobj, offset, length):
+        self.fileobj = fileobj
+        self.remaining = length
+        fileobj.seek(offset)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fileobj.fileno()
+
+    def close(self):
+        self.fileobj.close()
+
+
+class ObjectStorage:
+    """
+    Operations the API needs from a file storage besides Django's Storage
+    interface. Downloads, deletions and uploads only go through these and
+    the standard save()/open()/delete(), so the files can live on the local
+    disk or in an object store.
+    """
+    def stat(self, name):
+        """
+        Return the StoredObject describing a file. Raises FileNotFoundError if it does not exist.
+        """
+        raise NotImplementedError('subclasses of ObjectStorage must provide a stat() method')
+
+    def open_range(self, name, start, end):
+        """
+        Open the bytes ``start``..``end`` (inclusive) of a file for reading, as
+        a file-like object with read() and close().
+        """
+        raise NotImplementedError('subclasses of ObjectStorage must provide an open_range() method')
+
+    def remove(self, name):
+        """
+        Delete a file. Returns whether a file was deleted.
+        """
+        raise NotImplementedError('subclasses of ObjectStorage must provide a remove() method')
+
+    def local_path(self, name):
+        """
+        Path of the file on the local file system, or None if it is stored elsewhere.
+        """
+        return None
+
+
+class LocalStorage(ObjectStorage, FileSystemStorage):
+    """
+    Files under MEDIA_ROOT on the local disk. With a cold root
+    (COLD_STORAGE_ROOT), files can be moved to a second, cheaper volume under
+    the same names; reads fall back to the cold copy of a file that is not on
+    the fast volume.
+    """
+    def __init__(self, cold_location=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cold_location = settings.COLD_STORAGE_ROOT if cold_location is None else cold_location
+
+    def cold_path(self, name):
+        return safe_join(self.cold_location, name) if self.cold_location else None
+
+    def existing_path(self, name):
+        """
+        Path of the file on the fast volume, or of its cold copy if it is only there.
+        """
+        path = self.path(name)
+        if self.cold_location and not os.path.exists(path):
+            cold_path = self.cold_path(name)
+            if os.path.exists(cold_path):
+                return cold_path
+        return path
+
+    def stat(self, name):
+        file_stat = os.stat(self.existing_path(name))
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise FileNotFoundError(name)
+        return StoredObject(name, file_stat.st_size, file_stat.st_mtime, file_stat.st_mtime_ns)
+
+    def open_range(self, name, start, end):
+        return FileRange(open(self.existing_path(name), 'rb'), start, end - start + 1)
+
+    def _open(self, name, mode='rb'):
+        return File(open(self.existing_path(name), mode))
+
+    def exists(self, name):
+        return super().exists(name) or bool(self.cold_location and os.path.lexists(self.cold_path(name)))
+
+    def remove(self, name):
+        removed = False
+        for path in (self.path(name), self.cold_path(name)):
+            try:
+                if path is not None:
+                    os.remove(path)
+                    removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def local_path(self, name):
+        return self.path(name)
+
+    def copy_to_cold(self, name, limiter=None):
+        """
+        Copy a file from the fast volume to the cold root, pacing the reads with
+        ``limiter`` (one wait per COPY_CHUNK_SIZE bytes). The fast copy is kept
+        until drop_hot(). Returns the number of bytes copied.
+        """
+        cold_path = self.cold_path(name)
+        try:
+            return copy_file(self.path(name), cold_path, limiter)
+        except FileNotFoundError:
+            if os.path.exists(cold_path):
+                return 0  # Moved already
+            raise
+
+    def drop_hot(self, name):
+        """
+        Remove the fast copy of a file that has a cold copy.
+        """
+        if os.path.exists(self.cold_path(name)):
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    def drop_cold(self, name):
+        try:
+            os.remove(self.cold_path(name))
+        except FileNotFoundError:
+            pass
+
+    def promote(self, name):
+        """
+        Move a file from the cold root back to the fast volume.
+        Returns whether it was moved; False if it is on the fast volume already.
+        """
+        path = self.path(name)
+        if os.path.exists(path):
+            return False
+        try:
+            copy_file(self.cold_path(name), path)
+        except FileNotFoundError:
+            if os.path.exists(path):
+                return False  # Promoted concurrently
+            raise
+        self.drop_cold(name)
+        return True
+
+
+def copy_file(source, target, limiter=None):
+    """
+    Copy a file through a temporary file renamed into place, so the target is
+    never seen partially written, keeping its modification time (downloads use
+    it as a validator). Returns the number of bytes copied.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    copied = 0
+    with open(source, 'rb') as src:
+        source_stat = os.fstat(src.fileno())
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                while True:
+                    if limiter is not None:
+                        limiter.wait()
+                    chunk = src.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    copied += len(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.utime(temp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+            os.replace(temp_path, target)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    return copied
+
+
+class S3Error(OSError):
+    """
+    Error response from the object store.
+    """
+    def __init__(self, status, code, message):
+        super().__init__(f"{status} {code}: {message}")
+        self.status = status
+        self.code = code
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections to one host, reused across requests and
+    threads. At most ``size`` idle connections are kept.
+    """
+    def __init__(self, host, port, secure, size, timeout):
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def get(self):
+        """
+        Return an idle connection, or a new one. The flag tells whether it was reused.
+        """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.connect(), False
+
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def put(self, connection):
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+
+class ObjectReader:
+    """
+    Body of an object store response, read incrementally. The connection goes
+    back to the pool once the body has been read to the end.
+    """
+    def __init__(self, response, connection, pool):
+        self.response = response
+        self.connection = connection
+        self.pool = pool
+
+    def read(self, size=-1):
+        if self.response is None:
+            return b''
+        data = self.response.read(None if size is None or size < 0 else size)
+        if not data or self.response.isclosed():
+            self.close()
+        return data
+
+    def close(self):
+        if self.response is None:
+            return
+        complete = self.response.isclosed() or self.response.length == 0
+        self.response.close()
+        if complete:
+            self.pool.put(self.connection)  # Nothing left unread; the connection can be reused
+        else:
+            self.connection.close()
+        self.response = None
+
+
+class S3Storage(ObjectStorage, Storage):
+    """
+    Files in an S3-compatible object store (AWS S3, MinIO, Ceph RGW...),
+    spoken to directly over pooled keep-alive connections and signed with
+    AWS Signature Version 4. Large files are uploaded in parts, several at a
+    time; reads of file ranges are ranged GETs.
+    """
+    def __init__(self):
+        endpoint = urlsplit(settings.S3_ENDPOINT_URL)
+        self.secure = endpoint.scheme == 'https'
+        self.bucket = settings.S3_BUCKET
+        self.region = settings.S3_REGION
+        self.access_key = settings.S3_ACCESS_KEY_ID
+        self.secret_key = settings.S3_SECRET_ACCESS_KEY
+        self.part_size = max(settings.S3_MULTIPART_CHUNK_SIZE, MIN_PART_SIZE)
+        self.virtual_hosted = settings.S3_ADDRESSING_STYLE == 'virtual'
+        self.host = f'{self.bucket}.{endpoint.netloc}' if self.virtual_hosted else endpoint.netloc
+        hostname, _, port = self.host.partition(':')
+        self.pool = ConnectionPool(
+            hostname, int(port) if port else None, self.secure, settings.S3_POOL_SIZE, settings.S3_TIMEOUT
+        )
+        self._signing_keys = {}
+
+    # Signing
+
+    def object_path(self, name):
+        key = quote(name.replace(os.sep, '/'), safe='/-_.~')
+        return f'/{key}' if self.virtual_hosted else f'/{self.bucket}/{key}'
+
+    def signing_key(self, date):
+        key = self._signing_keys.get(date)
+        if key is None:
+            key = f'AWS4{self.secret_key}'.encode()
+            for part in (date, self.region, 's3', 'aws4_request'):
+                key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+            self._signing_keys = {date: key}
+        return key
+
+    def sign(self, method, path, query, headers, payload_sha256, now=None):
+        """
+        Add the AWS Signature Version 4 headers to ``headers`` for a request.
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = amz_date[:8]
+        headers.update({'host': self.host, 'x-amz-date': amz_date, 'x-amz-content-sha256': payload_sha256})
+
+        signed_headers = sorted(name.lower() for name in headers)
+        lowered = {name.lower(): str(value) for name, value in headers.items()}
+        canonical_request = '\n'.join([
+            method,
+            path,
+            '&'.join(f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}" for key, value in sorted(query)),
+            ''.join(f"{name}:{' '.join(lowered[name].split())}\n" for name in signed_headers),
+            ';'.join(signed_headers),
+            payload_sha256,
+        ])
+        scope = f'{date}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signature = hmac.new(self.signing_key(date), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(signed_headers)}, Signature={signature}"
+        )
+        return headers
+
+    # Requests
+
+    def request(self, method, name, query=(), headers=None, body=b'', stream=False):
+        """
+        Send a signed request for an object and return the response, or an
+        ObjectReader over its body with ``stream``. A pooled connection the
+        server closed meanwhile is replaced once. Raises FileNotFoundError on
+        404 and S3Error on other error statuses.
+        """
+        path = self.object_path(name)
+        url = path + ('?' + '&'.join(f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}" if value else quote(key)
+                                     for key, value in query) if query else '')
+        headers = self.sign(method, path, query, dict(headers or {}), hashlib.sha256(body).hexdigest()
+                            if body else EMPTY_PAYLOAD_SHA256)
+
+        connection, reused = self.pool.get()
+        while True:
+            try:
+                connection.request(method, url, body=body or None, headers=headers)
+                response = connection.getresponse()
+                break
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused:
+                    raise
+                connection, reused = self.pool.connect(), False
+            except (OSError, socket.timeout):
+                connection.close()
+                raise
+
+        if response.status >= 300:
+            data = response.read()
+            self.pool.put(connection)
+            if response.status == 404:
+                raise FileNotFoundError(name)
+            raise self.error(response.status, data)
+        if stream:
+            return ObjectReader(response, connection, self.pool)
+        data = response.read()
+        self.pool.put(connection)
+        response.data = data
+        return response
+
+    @staticmethod
+    def error(status, body):
+        code, message = 'Error', body[:200].decode(errors='replace')
+        try:
+            root = ElementTree.fromstring(body)
+            code = root.findtext('{*}Code') or root.findtext('Code') or code
+            message = root.findtext('{*}Message') or root.findtext('Message') or message
+        except ElementTree.ParseError:
+            pass
+        return S3Error(status, code, message)
+
+    # ObjectStorage
+
+    def stat(self, name):
+        response = self.request('HEAD', name)
+        mtime = parse_http_date_safe(response.getheader('Last-Modified', '')) or 0
+        return StoredObject(name, int(response.getheader('Content-Length', 0)), mtime, mtime * 10 ** 9)
+
+    def open_range(self, name, start, end):
+        return self.request('GET', name, headers={'Range': f'bytes={start}-{end}'}, stream=True)
+
+    def remove(self, name):
+        # S3 answers a DELETE with 204 whether or not the object existed, so look first
+        if not self.exists(name):
+            return False
+        try:
+            self.request('DELETE', name)
+        except FileNotFoundError:
+            return False  # Removed concurrently, on stores answering 404 for missing objects
+        return True
+
+    # Storage
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError("Objects can only be opened for reading.")
+        return File(self.request('GET', name, stream=True), name=name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        first = read_exactly(content, self.part_size)
+        if len(first) < self.part_size:
+            self.request('PUT', name, headers={'Content-Type': 'application/octet-stream'}, body=first)
+        else:
+            self.multipart_upload(name, first, content)
+        return name
+
+    def multipart_upload(self, name, first, content):
+        """
+        Upload a file in S3_MULTIPART_CHUNK_SIZE parts, S3_UPLOAD_CONCURRENCY at a
+        time; at most that many parts are held in memory. The upload is aborted
+        on error so no parts are left behind.
+        """
+        response = self.request('POST', name, query=[('uploads', '')],
+                                headers={'Content-Type': 'application/octet-stream'})
+        upload_id = ElementTree.fromstring(response.data).findtext('{*}UploadId')
+        etags = {}
+        try:
+            with ThreadPoolExecutor(max_workers=settings.S3_UPLOAD_CONCURRENCY,
+                                    thread_name_prefix='s3-upload') as executor:
+                in_flight = []
+                number, part = 1, first
+                while part:
+                    in_flight.append((number, executor.submit(self.upload_part, name, upload_id, number, part)))
+                    if len(in_flight) >= settings.S3_UPLOAD_CONCURRENCY:
+                        done_number, future = in_flight.pop(0)
+                        etags[done_number] = future.result()
+                    number, part = number + 1, read_exactly(content, self.part_size)
+                for done_number, future in in_flight:
+                    etags[done_number] = future.result()
+
+            body = '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                for number, etag in sorted(etags.items())
+            )
+            response = self.request('POST', name, query=[('uploadId', upload_id)], body=body.encode())
+            if b'<Error>' in response.data:  # Completion can fail after a 200 status
+                raise self.error(response.status, response.data)
+        except BaseException:
+            try:
+                self.request('DELETE', name, query=[('uploadId', upload_id)])
+            except OSError as e:
+                logger.error("Error aborting the upload of '%s': %s", name, str(e))
+            raise
+        logger.debug("Uploaded '%s' in %s parts.", name, len(etags))
+
+    def upload_part(self, name, upload_id, number, data):
+        response = self.request('PUT', name, query=[('partNumber', str(number)), ('uploadId', upload_id)], body=data)
+        return response.getheader('ETag')
+
+    def delete(self, name):
+        try:
+            self.request('DELETE', name)
+        except FileNotFoundError:
+            pass
+
+    def exists(self, name):
+        try:
+            self.request('HEAD', name)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def size(self, name):
+        return self.stat(name).size
+
+    def get_modified_time(self, name):
+        return datetime.datetime.fromtimestamp(self.stat(name).mtime, tz=datetime.timezone.utc)
+
+    def url(self, name):
+        return urljoin(settings.MEDIA_URL, filepath_to_uri(name))
+
+
+def read_exactly(content, size):
+    """
+    Read ``size`` bytes from a file, fewer only at its end.
+    """
+    chunks, remaining = [], size
+    while remaining > 0:
+        data = content.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b''.join(chunks)
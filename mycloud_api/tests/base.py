@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from mycloud_api.models import UserFile, UserProfile
+from mycloud_api.throttling import forget_buckets
+
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+def png_bytes(size, fill=b'x'):
+    """
+    Content with a PNG signature, ``size`` bytes long.
+    """
+    return (PNG + fill * size)[:size]
+
+
+class APITestCase(TestCase):
+    """
+    Test case with a temporary MEDIA_ROOT, an empty cache and helpers to
+    create users with an authenticated client and to upload files.
+    """
+    def setUp(self):
+        media_root = tempfile.mkdtemp(prefix='mycloud-test-')
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            COLD_STORAGE_ROOT='',
+            PREVIEW_ON_UPLOAD=False,
+            DOWNLOAD_STATS_FLUSH_INTERVAL=0,
+            ALLOWED_HOSTS=['testserver'],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.media_root = media_root
+        cache.clear()
+        forget_buckets()
+        self.addCleanup(cache.clear)
+        self.addCleanup(forget_buckets)
+
+    def make_user(self, name='alice', **fields):
+        user = UserProfile.objects.create_user(name, f'{name}@example.com', 'password-123', **fields)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return user, client
+
+    def upload(self, client, name='a.png', data=None, **fields):
+        data = png_bytes(1000) if data is None else data
+        return client.post('/api/files/', {
+            'file': SimpleUploadedFile(name, data),
+            'original_filename': name,
+            'size': len(data),
+            **fields,
+        }, format='multipart')
+
+    def upload_file(self, client, owner, name='a.png', data=None):
+        response = self.upload(client, name, data)
+        self.assertEqual(response.status_code, 201, response.content)
+        return UserFile.objects.get(owner=owner, original_filename=name)
+
+    @staticmethod
+    def body(response):
+        try:
+            return b''.join(response.streaming_content) if response.streaming else response.content
+        finally:
+            response.close()
@@ -0,0 +1,39 @@
+import io
+import os
+import zipfile
+from unittest import mock
+from .base import APITestCase, png_bytes
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.a = self.upload_file(self.client, self.user, 'a.png', png_bytes(3000, b'a'))
+        self.b = self.upload_file(self.client, self.user, 'b.png', png_bytes(2000, b'b'))
+
+    def archive(self, *files):
+        return self.client.get('/api/files/archive/', {'ids': ','.join(str(file.pk) for file in files)})
+
+    def test_archive_holds_the_files(self):
+        response = self.archive(self.a, self.b)
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(self.body(response))) as archive:
+            self.assertEqual(archive.namelist(), ['a.png', 'b.png'])
+            self.assertEqual(archive.read('b.png'), png_bytes(2000, b'b'))
+
+    def test_missing_file_is_left_out(self):
+        os.remove(self.a.file.path)
+        with zipfile.ZipFile(io.BytesIO(self.body(self.archive(self.a, self.b)))) as archive:
+            self.assertEqual(archive.namelist(), ['b.png'])
+
+    def test_files_are_promoted_as_they_are_reached(self):
+        with mock.patch('mycloud_api.archives.promote') as promote:
+            response = self.archive(self.a, self.b)
+            self.assertEqual(promote.call_count, 0)
+            chunks = iter(response.streaming_content)
+            next(chunks)
+            self.assertEqual([call.args[0].pk for call in promote.call_args_list], [self.a.pk])
+            b''.join(chunks)
+            response.close()
+        self.assertEqual([call.args[0].pk for call in promote.call_args_list], [self.a.pk, self.b.pk])
@@ -0,0 +1,82 @@
+from mycloud_api.models import UserFile
+from .base import APITestCase
+
+
+class BatchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.a = self.upload_file(self.client, self.user, 'a.png')
+        self.b = self.upload_file(self.client, self.user, 'b.png')
+
+    def batch(self, *operations):
+        response = self.client.post('/api/files/batch/', {'operations': list(operations)}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [result['status'] for result in response.json()['results']]
+
+    def names(self):
+        return dict(UserFile.objects.filter(owner=self.user).values_list('pk', 'original_filename'))
+
+    def test_mixed_operations(self):
+        statuses = self.batch(
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'c.png'},
+            {'op': 'comment', 'id': self.a.pk, 'comment': 'note'},
+            {'op': 'delete', 'id': self.b.pk},
+        )
+        self.assertEqual(statuses, [200, 200, 204])
+        self.assertEqual(self.names(), {self.a.pk: 'c.png'})
+        self.assertEqual(UserFile.objects.get(pk=self.a.pk).comment, 'note')
+        self.assertIsNotNone(UserFile.all_objects.get(pk=self.b.pk).deleted_at)
+
+    def test_chained_renames(self):
+        statuses = self.batch(
+            {'op': 'rename', 'id': self.b.pk, 'new_name': 'x.png'},
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'b.png'},
+        )
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(self.names(), {self.a.pk: 'b.png', self.b.pk: 'x.png'})
+
+    def test_swapped_names(self):
+        statuses = self.batch(
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'tmp.png'},
+            {'op': 'rename', 'id': self.b.pk, 'new_name': 'a.png'},
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'b.png'},
+        )
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(self.names(), {self.a.pk: 'b.png', self.b.pk: 'a.png'})
+
+    def test_rename_into_a_name_in_use(self):
+        statuses = self.batch(
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'b.png'},
+            {'op': 'comment', 'id': self.b.pk, 'comment': 'kept'},
+        )
+        self.assertEqual(statuses, [400, 200])
+        self.assertEqual(self.names(), {self.a.pk: 'a.png', self.b.pk: 'b.png'})
+
+    def test_rename_into_a_deleted_files_name(self):
+        statuses = self.batch(
+            {'op': 'delete', 'id': self.b.pk},
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'b.png'},
+        )
+        self.assertEqual(statuses, [204, 200])
+        self.assertEqual(self.names(), {self.a.pk: 'b.png'})
+
+    def test_renamed_then_deleted_file_keeps_its_name_in_the_trash(self):
+        statuses = self.batch(
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'c.png'},
+            {'op': 'delete', 'id': self.a.pk},
+        )
+        self.assertEqual(statuses, [200, 204])
+        self.assertEqual(UserFile.all_objects.get(pk=self.a.pk).original_filename, 'a.png')
+
+    def test_invalid_missing_and_foreign_files(self):
+        bob, other = self.make_user('bob')
+        foreign = self.upload_file(other, bob, 'f.png')
+        statuses = self.batch(
+            {'op': 'rename', 'id': self.a.pk, 'new_name': 'bad name.png'},
+            {'op': 'delete', 'id': 9999},
+            {'op': 'delete', 'id': foreign.pk},
+            {'op': 'explode', 'id': self.a.pk},
+        )
+        self.assertEqual(statuses, [400, 404, 404, 400])
+        self.assertTrue(UserFile.objects.filter(pk=foreign.pk).exists())
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+from mycloud_api.benchmarks import Benchmark, compare
+
+
+def run(**results):
+    return {'meta': {'requests': 100}, 'results': results}
+
+
+class CompareTests(SimpleTestCase):
+    baseline = run(
+        download_file={'throughput_rps': 200.0, 'p50_ms': 4.0, 'p99_ms': 10.0, 'peak_rss_bytes': 1000},
+        my_files={'throughput_rps': 100.0, 'p50_ms': 8.0, 'p99_ms': 20.0},
+    )
+
+    def rows(self, current, threshold=0.1):
+        return {(name, metric): (change, regressed)
+                for name, metric, _, _, change, regressed in compare(self.baseline, current, threshold)}
+
+    def test_regression_past_the_threshold(self):
+        rows = self.rows(run(download_file={'throughput_rps': 150.0, 'p50_ms': 4.3, 'p99_ms': 12.0,
+                                            'peak_rss_bytes': 1000}))
+        self.assertEqual(rows[('download_file', 'throughput_rps')], (-0.25, True))
+        self.assertEqual(rows[('download_file', 'p99_ms')], (0.2, True))
+        self.assertFalse(rows[('download_file', 'p50_ms')][1])  # 7.5% slower, within the threshold
+        self.assertFalse(rows[('download_file', 'peak_rss_bytes')][1])
+
+    def test_improvements_do_not_regress(self):
+        rows = self.rows(run(my_files={'throughput_rps': 300.0, 'p50_ms': 2.0, 'p99_ms': 5.0}))
+        self.assertEqual(rows[('my_files', 'throughput_rps')], (2.0, False))
+        self.assertEqual(rows[('my_files', 'p99_ms')], (-0.75, False))
+
+    def test_scenarios_and_metrics_missing_from_the_baseline_are_skipped(self):
+        rows = self.rows(run(login_user={'throughput_rps': 1.0, 'p50_ms': 900.0},
+                             my_files={'throughput_rps': 100.0, 'bytes_per_second': 5}))
+        self.assertEqual(list(rows), [('my_files', 'throughput_rps')])
+
+    def test_baseline_survives_a_json_round_trip(self):
+        baseline = json.loads(json.dumps(self.baseline))
+        rows = compare(baseline, self.baseline, 0.1)
+        self.assertEqual(len(rows), 7)
+        self.assertFalse(any(regressed for *_, regressed in rows))
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+        with open(self.baseline, 'w') as f:
+            json.dump(run(my_files={'throughput_rps': 100.0, 'p50_ms': 8.0, 'p99_ms': 20.0}), f)
+
+    def benchmark(self, result, *args):
+        with mock.patch.object(Benchmark, 'run', return_value=run(my_files={**result, 'errors': 0})):
+            out = StringIO()
+            call_command('benchmark', '--scenario', 'my_files', *args, stdout=out)
+            return out.getvalue()
+
+    def test_regression_fails_the_comparison(self):
+        with self.assertRaisesMessage(CommandError, "1 metrics regressed by more than 10%"):
+            self.benchmark({'throughput_rps': 50.0, 'p50_ms': 8.0, 'p99_ms': 20.0}, '--compare', self.baseline)
+
+    def test_threshold_is_a_percentage(self):
+        out = self.benchmark({'throughput_rps': 70.0, 'p50_ms': 8.0, 'p99_ms': 20.0},
+                             '--compare', self.baseline, '--threshold', '40')
+        self.assertIn("No metric regressed by more than 40.0%", out)
+
+    def test_unreadable_baseline(self):
+        with self.assertRaises(CommandError):
+            self.benchmark({}, '--compare', self.baseline + '.missing')
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from mycloud_api.models import Blob, UserFile
+from .base import APITestCase, png_bytes
+
+
+class BlobDeduplicationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(2000, b'blob')
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload_file(self.client, self.user, 'a.png', self.data)
+        second = self.upload_file(self.client, self.user, 'b.png', self.data)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_blob_survives_until_last_reference_is_gone(self):
+        first = self.upload_file(self.client, self.user, 'a.png', self.data)
+        second = self.upload_file(self.client, self.user, 'b.png', self.data)
+        path = first.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.body(self.client.get(f'/api/files/{second.pk}/download_file/')), self.data)
+        with mock.patch('mycloud_api.models.background_remover') as remover:
+            with self.captureOnCommitCallbacks(execute=True):
+                second.delete()
+        self.assertFalse(Blob.objects.exists())
+        remover.remove_later.assert_called_once_with([second.file.name])
+
+
+class BackfillBlobsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(2000, b'legacy')
+        with override_settings(BLOB_DEDUPLICATION=False):
+            self.first = self.upload_file(self.client, self.user, 'a.png', self.data)
+            self.second = self.upload_file(self.client, self.user, 'b.png', self.data)
+        self.assertIsNone(self.first.blob_id)
+
+    def backfill(self):
+        out = StringIO()
+        call_command('backfill_blobs', stdout=out)
+        return out.getvalue()
+
+    def test_moves_legacy_files_into_one_blob(self):
+        legacy = [self.first.file.path, self.second.file.path]
+        self.assertIn("Stored 1 new blobs, deduplicated 1 files", self.backfill())
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(set(UserFile.objects.values_list('blob', flat=True)), {blob.pk})
+        self.assertFalse(any(os.path.exists(path) for path in legacy))
+        self.assertEqual(self.body(self.client.get(f'/api/files/{self.first.pk}/download_file/')), self.data)
+
+    def test_reads_files_in_cold_storage(self):
+        cold_root = tempfile.mkdtemp(prefix='mycloud-cold-')
+        self.addCleanup(shutil.rmtree, cold_root, ignore_errors=True)
+        with mock.patch.object(default_storage, 'cold_location', cold_root):
+            default_storage.copy_to_cold(self.first.file.name)
+            default_storage.drop_hot(self.first.file.name)
+            UserFile.objects.filter(pk=self.first.pk).update(cold=True)
+            cold_path = default_storage.cold_path(self.first.file.name)
+
+            self.assertIn("skipped 0 missing files", self.backfill())
+        self.assertFalse(os.path.exists(cold_path))
+        user_file = UserFile.objects.get(pk=self.first.pk)
+        self.assertFalse(user_file.cold)
+        self.assertEqual(user_file.blob.ref_count, 2)
+        self.assertEqual(self.body(self.client.get(f'/api/files/{self.first.pk}/download_file/')), self.data)
+
+    def test_skips_missing_files(self):
+        os.remove(self.first.file.path)
+        self.assertIn("skipped 1 missing files", self.backfill())
+        self.assertIsNone(UserFile.objects.get(pk=self.first.pk).blob_id)
+
+    def test_refuses_remote_storage(self):
+        with mock.patch.object(default_storage, 'local_path', return_value=None):
+            with self.assertRaises(CommandError):
+                self.backfill()
+
+    def test_file_trashed_during_the_backfill_keeps_its_content(self):
+        acquire = Blob.objects.acquire
+
+        def acquire_then_trash(*args):
+            blob = acquire(*args)
+            UserFile.objects.trash(UserFile.objects.filter(pk=self.first.pk))
+            return blob
+
+        with mock.patch.object(Blob.objects, 'acquire', side_effect=acquire_then_trash):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertIn("and 1 files changed meanwhile", self.backfill())
+        self.assertTrue(os.path.exists(self.first.file.path))
+        self.assertIsNone(UserFile.all_objects.get(pk=self.first.pk).blob_id)
+        self.assertEqual(Blob.objects.get().ref_count, 1)
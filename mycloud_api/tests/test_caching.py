@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from mycloud_api.caching import bump_versions
+from mycloud_api.models import ListingVersion
+from .base import APITestCase
+
+
+class ListingCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.upload_file(self.client, self.user, 'a.png')
+
+    def etag(self):
+        response = self.client.get('/api/files/')
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_listing_is_not_modified(self):
+        etag = self.etag()
+        response = self.client.get('/api/files/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_invalidate_the_listing(self):
+        etag = self.etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload_file(self.client, self.user, 'b.png')
+        response = self.client.get('/api/files/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_versions_are_shared_between_workers(self):
+        etag = self.etag()
+        cache.clear()  # Another worker has its own cache, but reads the same versions
+        self.assertEqual(self.etag(), etag)
+
+        # A change made by another worker reaches this one at once
+        bump_versions([self.user.pk])
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_other_owners_keep_their_version(self):
+        bob, other = self.make_user('bob')
+        etag = other.get('/api/files/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload_file(self.client, self.user, 'b.png')
+        self.assertEqual(other.get('/api/files/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertTrue(ListingVersion.objects.filter(scope=str(bob.pk)).exists())
+
+
+class FileDetailCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.file = self.upload_file(self.client, self.user, 'a.png')
+        self.url = f'/api/files/{self.file.pk}/'
+
+    def test_unchanged_file_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['original_filename'], 'a.png')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_files_have_their_own_etags(self):
+        other = self.upload_file(self.client, self.user, 'b.png')
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(f'/api/files/{other.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['original_filename'], 'b.png')
+
+    def test_missing_file_is_not_found_even_with_a_current_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get('/api/files/9999/', HTTP_IF_NONE_MATCH=etag).status_code, 404)
+        self.file.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_other_users_file_is_not_found(self):
+        _, other = self.make_user('bob')
+        etag = other.get('/api/files/')['ETag']
+        self.assertEqual(other.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
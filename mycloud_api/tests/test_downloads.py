@@ -0,0 +1,202 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.test import AsyncClient, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from mycloud_api.accounting import DownloadAccounting
+from mycloud_api.models import UserFile
+from .base import APITestCase, png_bytes
+
+
+class DownloadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(5000, b'0123456789')
+        self.file = self.upload_file(self.client, self.user, 'a.png', self.data)
+        self.url = f'/api/files/{self.file.pk}/download_file/'
+
+    def test_streams_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(self.body(response), self.data)
+
+    def test_special_link_needs_no_credentials(self):
+        response = APIClient().get(f'/api/download/{self.file.special_link}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_unknown_special_link(self):
+        response = APIClient().get('/api/download/unknown/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_users_cannot_download(self):
+        _, other = self.make_user('bob')
+        response = other.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+class RangeDownloadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(5000, b'0123456789')
+        self.file = self.upload_file(self.client, self.user, 'a.png', self.data)
+        self.url = f'/api/files/{self.file.pk}/download_file/'
+
+    def test_single_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(self.body(response), self.data[100:200])
+
+    def test_suffix_and_open_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.body(response), self.data[-10:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4990-')
+        self.assertEqual(response['Content-Range'], f'bytes 4990-4999/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[4990:])
+
+    def test_range_past_the_end_is_clamped(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4995-9999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[4995:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=6000-7000')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_malformed_range_is_ignored(self):
+        response = self.client.get(self.url, HTTP_RANGE='items=0-10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9,20-29')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = self.body(response)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 0-9/5000\r\n\r\n' + self.data[0:10], body)
+        self.assertIn(b'Content-Range: bytes 20-29/5000\r\n\r\n' + self.data[20:30], body)
+
+    def test_if_range_with_current_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[:10])
+
+    def test_if_range_with_stale_etag_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_range_on_special_link(self):
+        response = APIClient().get(f'/api/download/{self.file.special_link}/', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[10:20])
+
+
+class DownloadStatsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(5000)
+        self.file = self.upload_file(self.client, self.user, 'a.png', self.data)
+        self.url = f'/api/files/{self.file.pk}/download_file/'
+
+    def stats(self):
+        user_file = UserFile.objects.get(pk=self.file.pk)
+        return user_file.download_count, user_file.bytes_served
+
+    def test_downloads_are_counted(self):
+        self.body(self.client.get(self.url))
+        self.body(self.client.get(self.url, HTTP_RANGE='bytes=0-99'))
+        self.body(APIClient().get(f'/api/download/{self.file.special_link}/'))
+        self.assertEqual(self.stats(), (3, 2 * len(self.data) + 100))
+        self.assertIsNotNone(UserFile.objects.get(pk=self.file.pk).last_downloaded)
+
+    def test_head_requests_are_not_counted(self):
+        response = self.client.head(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(self.stats(), (0, 0))
+
+    async def test_async_head_requests_are_not_counted(self):
+        response = await AsyncClient().head(f'/api/async/download/{self.file.special_link}/')
+        self.assertEqual(response.status_code, 200)
+        await sync_to_async(response.close)()
+        self.assertEqual(await sync_to_async(self.stats)(), (0, 0))
+
+    def test_last_downloaded_never_moves_backwards(self):
+        later = timezone.now() + timedelta(hours=1)  # Written by a later flush from another process
+        UserFile.objects.filter(pk=self.file.pk).update(last_downloaded=later)
+        self.body(self.client.get(self.url))
+        user_file = UserFile.objects.get(pk=self.file.pk)
+        self.assertEqual(user_file.last_downloaded, later)
+        self.assertEqual(user_file.download_count, 1)
+
+    @override_settings(DOWNLOAD_STATS_FLUSH_INTERVAL=60)
+    def test_shutdown_flush_is_registered_once(self):
+        accounting = DownloadAccounting()
+        with mock.patch('mycloud_api.accounting.atexit.register') as register:
+            for _ in range(2):
+                accounting.record(self.file.pk, self.user.pk, 10)
+                accounting._wakeup.set()  # Stops the flusher, which the next record restarts
+                accounting._thread.join()
+                accounting._wakeup.clear()
+        register.assert_called_once_with(accounting.shutdown)
+        accounting.flush()
+        self.assertEqual(self.stats(), (2, 20))
+
+    def test_not_modified_is_not_counted(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.stats(), (1, len(self.data)))
+
+
+class AsyncDownloadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, client = self.make_user()
+        self.token = client._credentials['HTTP_AUTHORIZATION']
+        self.data = png_bytes(5000, b'async')
+        self.file = self.upload_file(client, self.user, 'a.png', self.data)
+        self.url = f'/api/async/files/{self.file.pk}/download_file/'
+
+    async def get(self, url, **headers):
+        response = await AsyncClient().get(url, headers={'Authorization': self.token, **headers})
+        body = b''.join([chunk async for chunk in response.streaming_content]) if response.streaming else b''
+        return response, body
+
+    async def test_download_and_range(self):
+        response, body = await self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        response, body = await self.get(self.url, Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[10:20])
+
+    async def test_cold_file_is_promoted(self):
+        cold_root = tempfile.mkdtemp(prefix='mycloud-cold-')
+        self.addCleanup(shutil.rmtree, cold_root, ignore_errors=True)
+        name = self.file.file.name
+        with mock.patch.object(default_storage, 'cold_location', cold_root):
+            await sync_to_async(default_storage.copy_to_cold)(name)
+            await sync_to_async(default_storage.drop_hot)(name)
+            await UserFile.objects.filter(pk=self.file.pk).aupdate(cold=True)
+
+            response, body = await self.get(self.url)
+        self.assertEqual(body, self.data)
+        self.assertFalse((await UserFile.objects.aget(pk=self.file.pk)).cold)
+        self.assertTrue(default_storage.exists(name))
@@ -0,0 +1,60 @@
+from django.db import IntegrityError, transaction
+from django.test import AsyncClient
+from mycloud_api.models import COMMENT_MAX_LENGTH, UserFile
+from .base import APITestCase
+
+
+class CommentTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.file = self.upload_file(self.client, self.user)
+        self.url = f'/api/files/{self.file.pk}/update_comment/'
+
+    def test_update_comment(self):
+        response = self.client.patch(self.url, {'comment': 'holiday'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comment'], 'holiday')
+        self.assertEqual(UserFile.objects.get(pk=self.file.pk).comment, 'holiday')
+
+    def test_comment_length_is_capped(self):
+        response = self.client.patch(self.url, {'comment': 'x' * (COMMENT_MAX_LENGTH + 1)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('comment', response.json())
+        self.assertEqual(self.client.patch(self.url, {'comment': 'x' * COMMENT_MAX_LENGTH},
+                                           format='json').status_code, 200)
+
+    def test_database_refuses_longer_comments(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserFile.objects.filter(pk=self.file.pk).update(comment='x' * (COMMENT_MAX_LENGTH + 1))
+
+
+class ListingFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.token = self.client._credentials['HTTP_AUTHORIZATION']
+        for name, comment in (('beach.png', 'sunny beach'), ('city.png', 'night lights'), ('dog.png', '')):
+            self.assertEqual(self.upload(self.client, name, comment=comment).status_code, 201)
+
+    def names(self, response):
+        return sorted(file['original_filename'] for file in response.json()['results'])
+
+    async def alist(self, **params):
+        return await AsyncClient().get('/api/async/files/', params, headers={'Authorization': self.token})
+
+    def test_search_and_filters(self):
+        self.assertEqual(self.names(self.client.get('/api/files/', {'q': 'beach'})), ['beach.png'])
+        self.assertEqual(self.names(self.client.get('/api/files/', {'original_filename': 'city.png'})), ['city.png'])
+
+    async def test_async_listing_searches(self):
+        self.assertEqual(self.names(await self.alist(q='beach')), ['beach.png'])
+        self.assertEqual(self.names(await self.alist(q='lights')), ['city.png'])
+        self.assertEqual(self.names(await self.alist()), ['beach.png', 'city.png', 'dog.png'])
+
+    async def test_async_listing_filters_and_orders(self):
+        self.assertEqual(self.names(await self.alist(original_filename='city.png')), ['city.png'])
+        response = await self.alist(o='original_filename')
+        self.assertEqual([file['original_filename'] for file in response.json()['results']],
+                         ['beach.png', 'city.png', 'dog.png'])
+        self.assertEqual((await self.alist(upload_date='not-a-date')).status_code, 400)
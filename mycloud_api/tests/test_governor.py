@@ -0,0 +1,60 @@
+import time
+from django.test import RequestFactory, override_settings
+from mycloud_api.downloads import build_download_response
+from mycloud_api.governor import governed_download, lease_keeper
+from .base import APITestCase, png_bytes
+
+
+@override_settings(DOWNLOAD_MAX_STREAMS_PER_USER=1, DOWNLOAD_QUEUE_TIMEOUT=0, DOWNLOAD_CHUNK_SIZE=1000,
+                   DOWNLOAD_STREAM_RATE=0, DOWNLOAD_WORKER_RATE=0)
+class GovernorTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(5000, b'governed')
+        self.file = self.upload_file(self.client, self.user, 'a.png', self.data)
+        self.url = f'/api/files/{self.file.pk}/download_file/'
+
+    def test_busy_download_is_refused_with_retry_after(self):
+        streaming = self.client.get(self.url)
+        self.assertEqual(streaming.status_code, 200)
+        refused = self.client.get(self.url)
+        self.assertEqual(refused.status_code, 503)
+        self.assertGreaterEqual(int(refused['Retry-After']), 1)
+
+        self.assertEqual(self.body(streaming), self.data)
+        self.assertEqual(self.body(self.client.get(self.url)), self.data)
+
+    def test_other_users_have_their_own_slots(self):
+        streaming = self.client.get(self.url)
+        _, other = self.make_user('bob')
+        response = other.get(f'/api/download/{self.file.special_link}/')
+        self.assertEqual(response.status_code, 200)
+        self.body(response)
+        self.body(streaming)
+
+    def test_unshaped_capped_download_keeps_the_file_wrapper(self):
+        # Called directly: the test client wraps the streaming content of every response
+        kept = set(lease_keeper.slots)  # Left by other tests' responses that were never closed
+        response = governed_download(build_download_response, RequestFactory().get(self.url), self.file,
+                                     user=self.user)
+        self.assertIsNotNone(response.file_to_stream)
+        self.assertEqual([slots.owner for slots in lease_keeper.slots - kept], [f'user:{self.user.pk}'])
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(lease_keeper.slots - kept, set())
+
+    @override_settings(DOWNLOAD_SLOT_LEASE=0.6)
+    def test_leases_are_refreshed_while_the_stream_is_open(self):
+        streaming = self.client.get(self.url)
+        time.sleep(1.2)  # Twice the lease: the slot is only still taken if it was refreshed
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        self.body(streaming)
+        self.assertEqual(self.body(self.client.get(self.url)), self.data)
+
+    def test_archive_takes_a_slot(self):
+        streaming = self.client.get(self.url)
+        self.assertEqual(self.client.get('/api/files/archive/', {'ids': self.file.pk}).status_code, 503)
+        self.body(streaming)
+        response = self.client.get('/api/files/archive/', {'ids': self.file.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response)[:2], b'PK')
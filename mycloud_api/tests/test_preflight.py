@@ -0,0 +1,61 @@
+import hashlib
+from mycloud_api.models import Blob, UserFile
+from .base import APITestCase, png_bytes
+
+
+class PreflightTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(2000, b'pre')
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+
+    def preflight(self, client, name, sha256=None, size=None):
+        return client.post('/api/files/preflight/', {
+            'original_filename': name,
+            'size': len(self.data) if size is None else size,
+            'sha256': sha256 or self.sha256,
+        }, format='json')
+
+    def test_unknown_content_needs_an_upload(self):
+        response = self.preflight(self.client, 'a.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'upload_required': True})
+        self.assertFalse(UserFile.objects.exists())
+
+    def test_own_content_is_created_without_upload(self):
+        self.upload_file(self.client, self.user, 'a.png', self.data)
+        response = self.preflight(self.client, 'copy.png')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.json()['upload_required'])
+        copy = UserFile.objects.get(owner=self.user, original_filename='copy.png')
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(self.body(self.client.get(f'/api/files/{copy.pk}/download_file/')), self.data)
+
+    def test_other_users_content_is_not_handed_out(self):
+        self.upload_file(self.client, self.user, 'a.png', self.data)
+        bob, other = self.make_user('bob')
+        response = self.preflight(other, 'stolen.png')
+        self.assertEqual(response.json(), {'upload_required': True})
+        self.assertFalse(UserFile.objects.filter(owner=bob).exists())
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        # Uploading the content for real still deduplicates it
+        self.upload_file(other, bob, 'mine.png', self.data)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_size_must_match(self):
+        self.upload_file(self.client, self.user, 'a.png', self.data)
+        response = self.preflight(self.client, 'copy.png', size=len(self.data) + 1)
+        self.assertEqual(response.json(), {'upload_required': True})
+
+    def test_existing_name_is_rejected(self):
+        self.upload_file(self.client, self.user, 'a.png', self.data)
+        self.assertEqual(self.preflight(self.client, 'a.png').status_code, 400)
+
+    def test_name_rules_match_regular_uploads(self):
+        response = self.preflight(self.client, 'bad name.png')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid characters', response.json()['original_filename'][0])
+        response = self.preflight(self.client, 'a.gif')
+        self.assertEqual(response.json()['original_filename'], ["File format must be JPG, PNG, or JPEG."])
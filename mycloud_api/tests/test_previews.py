@@ -0,0 +1,55 @@
+import os
+from unittest import mock
+from django.conf import settings
+from mycloud_api.downloads import stat_download
+from mycloud_api.previews import preview_cache
+from .base import APITestCase
+
+
+class PreviewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.file = self.upload_file(self.client, self.user, 'a.png')
+        self.url = f'/api/files/{self.file.pk}/preview/?size=small'
+        width = settings.PREVIEW_SIZES['small']
+        self.preview = preview_cache.preview_for(self.file, stat_download(self.file), width)
+        submit = mock.patch.object(preview_cache, 'submit')  # Rendering runs in a process pool
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+    def store_preview(self):
+        os.makedirs(os.path.dirname(self.preview.path), exist_ok=True)
+        with open(self.preview.path, 'wb') as f:
+            f.write(b'rendered preview')
+
+    def test_missing_preview_is_rendered(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('Retry-After', response)
+        self.submit.assert_called_once()
+
+    def test_rendered_preview_is_served(self):
+        self.store_preview()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b'rendered preview')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.submit.assert_not_called()
+
+    def test_preview_evicted_while_served_is_rendered_again(self):
+        self.store_preview()
+        get = preview_cache.get
+
+        def get_then_evict(user_file, width):
+            preview = get(user_file, width)
+            os.remove(preview.path)
+            return preview
+
+        with mock.patch.object(preview_cache, 'get', side_effect=get_then_evict):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.submit.assert_called_once()
+
+    def test_invalid_width(self):
+        self.assertEqual(self.client.get(f'/api/files/{self.file.pk}/preview/?width=abc').status_code, 400)
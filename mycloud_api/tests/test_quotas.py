@@ -0,0 +1,44 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import override_settings
+from mycloud_api.models import UserFile, UserProfile
+from .base import APITestCase, png_bytes
+
+
+class QuotaTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user(storage_quota=1500)
+
+    def usage(self):
+        user = UserProfile.objects.get(pk=self.user.pk)
+        return user.storage_used, user.file_count
+
+    def test_usage_follows_uploads(self):
+        self.upload_file(self.client, self.user, 'a.png', png_bytes(1000))
+        self.upload_file(self.client, self.user, 'b.png', png_bytes(400, b'b'))
+        self.assertEqual(self.usage(), (1400, 2))
+
+    def test_upload_over_quota_is_refused(self):
+        self.upload_file(self.client, self.user, 'a.png', png_bytes(1000))
+        response = self.upload(self.client, 'b.png', png_bytes(1000, b'b'))
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UserFile.objects.filter(original_filename='b.png').exists())
+        self.assertEqual(self.usage(), (1000, 1))
+
+    def test_resumable_upload_over_quota_is_refused_upfront(self):
+        response = self.client.post('/api/files/uploads/', {'original_filename': 'big.png'}, format='json',
+                                    HTTP_UPLOAD_LENGTH='2000')
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(STORAGE_QUOTA=500)
+    def test_default_quota_applies_without_a_user_quota(self):
+        _, client = self.make_user('bob')
+        self.assertEqual(self.upload(client, 'a.png', png_bytes(1000)).status_code, 413)
+        self.assertEqual(self.upload(self.client, 'a.png', png_bytes(1000)).status_code, 201)
+
+    def test_reconcile_fixes_drifted_counters(self):
+        self.upload_file(self.client, self.user, 'a.png', png_bytes(1000))
+        UserProfile.objects.filter(pk=self.user.pk).update(storage_used=7, file_count=3)
+        call_command('reconcile_storage_usage', stdout=StringIO())
+        self.assertEqual(self.usage(), (1000, 1))
@@ -0,0 +1,69 @@
+import os
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from mycloud_api.models import UserFile
+from .base import APITestCase, png_bytes
+
+
+@override_settings(BLOB_DEDUPLICATION=False)
+class ScanStorageTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.a = self.upload_file(self.client, self.user, 'a.png', png_bytes(100, b'a'))
+        self.b = self.upload_file(self.client, self.user, 'b.png', png_bytes(100, b'b'))
+        self.orphan = os.path.join(os.path.dirname(self.a.file.path), 'stray.png')
+        with open(self.orphan, 'wb') as f:
+            f.write(b'stray')
+
+    def scan(self, *args):
+        out = StringIO()
+        call_command('scan_storage', '--min-age=0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_findings_without_repairing(self):
+        os.remove(self.a.file.path)
+        output = self.scan()
+        self.assertIn("1 files matched, 1 orphaned files, 1 missing files", output)
+        self.assertIn(f"missing: {self.a.file.name}", output)
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertEqual(UserFile.all_objects.count(), 2)
+
+    def test_repair(self):
+        os.remove(self.a.file.path)
+        output = self.scan('--repair')
+        self.assertIn("removed 1 orphans, deleted 1 files", output)
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertEqual(list(UserFile.all_objects.values_list('pk', flat=True)), [self.b.pk])
+
+    def test_failed_listing_aborts_the_scan(self):
+        scandir = os.scandir
+        broken = os.path.dirname(self.a.file.path)
+
+        def failing_scandir(path):
+            if path == broken:
+                raise PermissionError(13, "Permission denied", path)
+            return scandir(path)
+
+        with mock.patch('mycloud_api.scanner.os.scandir', side_effect=failing_scandir):
+            with self.assertRaises(CommandError):
+                self.scan('--repair')
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertEqual(UserFile.all_objects.count(), 2)
+
+    def test_missing_top_level_directory_aborts_the_scan(self):
+        root = os.path.join(self.media_root, 'user_files')
+        os.rename(root, root + '.unmounted')
+        with self.assertRaises(CommandError):
+            self.scan('--repair')
+        self.assertEqual(UserFile.all_objects.count(), 2)
+
+    def test_deletions_are_capped(self):
+        os.remove(self.a.file.path)
+        os.remove(self.b.file.path)
+        output = self.scan('--repair', '--max-deletions=1')
+        self.assertIn("repairs halted at the limit of 1 deletions", output)
+        self.assertEqual(UserFile.all_objects.count(), 2)
@@ -0,0 +1,61 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import SimpleTestCase, override_settings
+from mycloud_api.storage import S3Storage
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """
+    Keeps objects in a dict and, like S3, answers DELETE with 204 whether or not the object exists.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_PUT(self):
+        self.server.objects[self.path] = self.rfile.read(int(self.headers['Content-Length']))
+        self._reply(200)
+
+    def do_HEAD(self):
+        if self.path not in self.server.objects:
+            return self._reply(404)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.objects[self.path])))
+        self.end_headers()
+
+    def do_DELETE(self):
+        self.server.objects.pop(self.path, None)
+        self._reply(204)
+
+    def log_message(self, *args):
+        pass
+
+
+class S3StorageTests(SimpleTestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeS3Handler)
+        server.objects = {}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        overrides = override_settings(S3_ENDPOINT_URL=f'http://127.0.0.1:{server.server_port}', S3_BUCKET='bucket',
+                                      S3_ADDRESSING_STYLE='path', S3_ACCESS_KEY_ID='key', S3_SECRET_ACCESS_KEY='secret')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.objects = server.objects
+        self.storage = S3Storage()
+
+    def test_remove_reports_whether_the_object_existed(self):
+        self.storage.request('PUT', 'a/b.png', body=b'content')
+        self.assertTrue(self.storage.exists('a/b.png'))
+        self.assertTrue(self.storage.remove('a/b.png'))
+        self.assertEqual(self.objects, {})
+        self.assertFalse(self.storage.remove('a/b.png'))
+
+    def test_delete_ignores_missing_objects(self):
+        self.storage.delete('missing.png')
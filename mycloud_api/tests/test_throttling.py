@@ -0,0 +1,67 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import AsyncClient, override_settings
+from rest_framework.test import APIClient
+from mycloud_api.checks import check_shared_cache
+from .base import APITestCase
+
+
+def rates(**overrides):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **overrides},
+    })
+
+
+class ThrottlingTests(APITestCase):
+    def login(self, client):
+        return client.post('/api/auth/login/', {'username': 'alice', 'password': 'password-123'}, format='json')
+
+    def test_login_is_refused_with_retry_after(self):
+        self.make_user()
+        client = APIClient()
+        with rates(login='2/minute'):
+            first = self.login(client)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first['RateLimit-Limit'], '2')
+            self.assertEqual(first['RateLimit-Remaining'], '1')
+            self.assertEqual(self.login(client).status_code, 200)
+            refused = self.login(client)
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['RateLimit-Remaining'], '0')
+        self.assertGreaterEqual(int(refused['Retry-After']), 1)
+
+    def test_users_have_their_own_buckets(self):
+        _, alice = self.make_user()
+        _, bob = self.make_user('bob')
+        with rates(listing='1/minute'):
+            self.assertEqual(alice.get('/api/files/').status_code, 200)
+            self.assertEqual(alice.get('/api/files/').status_code, 429)
+            self.assertEqual(bob.get('/api/files/').status_code, 200)
+
+    async def test_async_views_are_throttled(self):
+        _, client = await sync_to_async(self.make_user)()
+        token = client._credentials['HTTP_AUTHORIZATION']
+        with rates(listing='1/minute'):
+            self.assertEqual((await AsyncClient().get('/api/async/files/', headers={'Authorization': token}))
+                             .status_code, 200)
+            refused = await AsyncClient().get('/api/async/files/', headers={'Authorization': token})
+        self.assertEqual(refused.status_code, 429)
+        self.assertIn('Retry-After', refused)
+
+
+class SharedCacheCheckTests(APITestCase):
+    def test_per_process_cache_is_reported(self):
+        ids = {warning.id for warning in check_shared_cache()}
+        self.assertEqual(ids, {'mycloud_api.W001', 'mycloud_api.W002'})
+
+    def test_limits_turned_off_need_no_shared_cache(self):
+        with rates(**{scope: None for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']}), \
+                override_settings(DOWNLOAD_MAX_STREAMS_PER_USER=0, DOWNLOAD_MAX_STREAMS_PER_LINK=0):
+            self.assertEqual(check_shared_cache(), [])
+
+    def test_shared_cache_is_not_reported(self):
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': f'{self.media_root}/cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(), [])
@@ -0,0 +1,77 @@
+import time
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from mycloud_api.tokens import ACCESS, revocation_list
+from .base import APITestCase
+
+
+class SignedTokenTests(APITestCase):
+    # Failed authentication is answered with 403: the authentication class sends no WWW-Authenticate
+    def setUp(self):
+        super().setUp()
+        self.user, _ = self.make_user()
+        self.client = APIClient()
+        response = self.client.post('/api/auth/login/', {'username': 'alice', 'password': 'password-123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.tokens = response.json()
+
+    def bearer(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        return client
+
+    def refresh(self, token):
+        return self.client.post('/api/auth/refresh/', {'refresh': token}, format='json')
+
+    def test_access_token_authenticates(self):
+        self.assertEqual(self.bearer(self.tokens['access']).get('/api/files/').status_code, 200)
+
+    def test_refresh_rotates_the_pair(self):
+        response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['refresh'], self.tokens['refresh'])
+        self.assertEqual(self.bearer(response.json()['access']).get('/api/files/').status_code, 200)
+
+    def test_refresh_token_reuse_is_refused(self):
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 200)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+
+    def test_refresh_token_claimed_by_another_worker(self):
+        claims = jwt.decode(self.tokens['refresh'], options={'verify_signature': False})
+        # Another worker rotated the token: only the shared cache knows
+        cache.add(f"revoked_token:{claims['jti']}", True, timeout=60)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+
+    def test_access_token_revoked_by_another_worker(self):
+        claims = jwt.decode(self.tokens['access'], options={'verify_signature': False})
+        cache.set(f"revoked_token:{claims['jti']}", True, timeout=60)
+        self.assertNotIn(claims['jti'], revocation_list._revoked)
+        self.assertEqual(self.bearer(self.tokens['access']).get('/api/files/').status_code, 403)
+
+    def test_access_token_cannot_refresh(self):
+        self.assertEqual(self.refresh(self.tokens['access']).status_code, 401)
+
+    def test_token_without_user_claims_is_refused(self):
+        now = int(time.time())
+        token = jwt.encode({'user_id': self.user.pk, 'token_type': ACCESS, 'iat': now, 'exp': now + 60,
+                            'jti': 'x' * 32}, settings.SECRET_KEY, algorithm=settings.SIGNED_TOKEN_ALGORITHM)
+        self.assertEqual(self.bearer(token).get('/api/files/').status_code, 403)
+
+    def test_logout_revokes_both_tokens(self):
+        client = self.bearer(self.tokens['access'])
+        self.assertEqual(client.post('/api/auth/logout/', {'refresh': self.tokens['refresh']},
+                                     format='json').status_code, 204)
+        self.assertEqual(client.get('/api/files/').status_code, 403)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+
+    def test_logout_with_only_the_refresh_token(self):
+        expired = self.bearer('expired.access.token')
+        response = expired.post('/api/auth/logout/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+
+    def test_logout_without_valid_tokens(self):
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh': 'a.b.c'}, format='json').status_code, 401)
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.utils import timezone
+from mycloud_api.models import Blob, UserFile, UserProfile
+from .base import APITestCase, png_bytes
+
+
+class TrashTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(1000, b'trash')
+        self.file = self.upload_file(self.client, self.user, 'a.png', self.data)
+
+    def names(self, url):
+        return [file['original_filename'] for file in self.client.get(url).json()['results']]
+
+    def usage(self):
+        user = UserProfile.objects.get(pk=self.user.pk)
+        return user.storage_used, user.file_count
+
+    def test_deleted_file_moves_to_the_trash(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/files/{self.file.pk}/').status_code, 204)
+        self.assertEqual(self.names('/api/files/'), [])
+        self.assertEqual(self.names('/api/files/trash/'), ['a.png'])
+        self.assertEqual(self.client.get(f'/api/files/{self.file.pk}/download_file/').status_code, 404)
+        self.assertEqual(self.usage(), (len(self.data), 1))  # Kept until purged
+
+    def test_restore(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/files/{self.file.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/files/{self.file.pk}/restore/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['deleted_at'])
+        self.assertEqual(self.names('/api/files/'), ['a.png'])
+        self.assertEqual(self.names('/api/files/trash/'), [])
+
+    def test_restore_into_a_name_in_use(self):
+        self.client.delete(f'/api/files/{self.file.pk}/')
+        self.upload_file(self.client, self.user, 'a.png', png_bytes(500))
+        self.assertEqual(self.client.post(f'/api/files/{self.file.pk}/restore/').status_code, 400)
+        self.assertIsNotNone(UserFile.all_objects.get(pk=self.file.pk).deleted_at)
+
+    def test_other_users_cannot_restore(self):
+        self.client.delete(f'/api/files/{self.file.pk}/')
+        _, other = self.make_user('bob')
+        self.assertEqual(other.post(f'/api/files/{self.file.pk}/restore/').status_code, 404)
+        self.assertEqual(other.get('/api/files/trash/').json()['results'], [])
+
+    def test_emptying_the_trash_frees_the_storage(self):
+        self.client.delete(f'/api/files/{self.file.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete('/api/files/trash/').status_code, 204)
+        self.assertFalse(UserFile.all_objects.exists())
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_purge_trash_removes_expired_files_only(self):
+        recent = self.upload_file(self.client, self.user, 'b.png', png_bytes(500, b'recent'))
+        UserFile.objects.trash(UserFile.objects.all())
+        UserFile.all_objects.filter(pk=self.file.pk).update(deleted_at=timezone.now() - timedelta(days=31))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_trash', days=30, workers=1, stdout=StringIO())
+        self.assertEqual(list(UserFile.all_objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(self.usage(), (500, 1))
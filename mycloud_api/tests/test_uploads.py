@@ -0,0 +1,118 @@
+import io
+import os
+from unittest import mock, skipIf
+from django.db import connection
+from mycloud_api.models import Blob, UploadSession, UserFile
+from mycloud_api.uploads import UploadConflict, append_chunk, fcntl
+from .base import APITestCase, png_bytes
+
+OCTET_STREAM = 'application/offset+octet-stream'
+
+
+class ResumableUploadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.client = self.make_user()
+        self.data = png_bytes(3000, b'abc')
+
+    def start(self, name='big.png'):
+        response = self.client.post('/api/files/uploads/', {'original_filename': name, 'comment': 'hi'},
+                                    format='json', HTTP_UPLOAD_LENGTH=str(len(self.data)))
+        self.assertEqual(response.status_code, 201, response.content)
+        return response['Location'], UploadSession.objects.get(original_filename=name)
+
+    def patch(self, location, data, offset):
+        return self.client.patch(location, data, content_type=OCTET_STREAM, HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_then_finalize(self):
+        location, session = self.start()
+        self.assertEqual(self.patch(location, self.data[:1000], 0)['Upload-Offset'], '1000')
+        self.assertEqual(self.client.get(location)['Upload-Offset'], '1000')
+        self.assertEqual(self.patch(location, self.data[1000:], 1000)['Upload-Offset'], '3000')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{location}finalize/')
+        self.assertEqual(response.status_code, 201, response.content)
+        user_file = UserFile.objects.get(owner=self.user, original_filename='big.png')
+        self.assertEqual(user_file.comment, 'hi')
+        self.assertEqual(self.body(self.client.get(f'/api/files/{user_file.pk}/download_file/')), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(session.partial_path))
+
+    def test_stale_offset_conflicts(self):
+        location, session = self.start()
+        self.patch(location, self.data[:1000], 0)
+        response = self.patch(location, self.data[:1000], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '1000')
+        with open(session.partial_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data[:1000])
+
+    def test_concurrent_chunk_rereads_offset_under_lock(self):
+        location, session = self.start()
+        stale = UploadSession.objects.get(pk=session.pk)  # Loaded before the other chunk landed
+        self.patch(location, self.data[:1000], 0)
+        with self.assertRaises(UploadConflict):
+            append_chunk(stale, None, 0)
+        with open(session.partial_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data[:1000])
+
+    @skipIf(fcntl is None, "Partial files are only locked where fcntl is available.")
+    def test_chunk_being_written_conflicts(self):
+        location, session = self.start()
+        self.patch(location, b'', 0)  # Creates the partial file
+        with open(session.partial_path, 'ab') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            with self.assertRaises(UploadConflict):
+                append_chunk(session, io.BytesIO(self.data[:1000]), 0)
+        self.assertEqual(self.client.get(location)['Upload-Offset'], '0')
+
+    def test_body_is_received_outside_a_transaction(self):
+        _, session = self.start()
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        class Body(io.BytesIO):
+            def read(self, size=-1):
+                depths.append(len(connection.atomic_blocks))
+                return super().read(size)
+
+        self.assertEqual(append_chunk(session, Body(self.data[:1000]), 0), 1000)
+        self.assertEqual(set(depths), {depth})
+
+    def test_chunk_past_declared_length(self):
+        location, _ = self.start()
+        response = self.patch(location, self.data + b'extra', 0)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.client.get(location)['Upload-Offset'], '0')
+
+    def test_finalize_incomplete_upload(self):
+        location, _ = self.start()
+        self.patch(location, self.data[:10], 0)
+        self.assertEqual(self.client.post(f'{location}finalize/').status_code, 409)
+
+    def test_failed_finalize_keeps_partial_and_can_be_retried(self):
+        location, session = self.start()
+        self.patch(location, self.data, 0)
+        with mock.patch.object(UploadSession, 'delete', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.client.post(f'{location}finalize/')
+        self.assertTrue(os.path.exists(session.partial_path))
+        self.assertFalse(UserFile.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')), [os.path.basename(session.partial_path)])
+        blobs = os.path.join(self.media_root, 'blobs')
+        self.assertEqual([files for _, _, files in os.walk(blobs) if files], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{location}finalize/')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(os.path.exists(session.partial_path))
+
+    def test_cancel(self):
+        location, session = self.start()
+        self.patch(location, self.data[:10], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(location).status_code, 204)
+        self.assertFalse(os.path.exists(session.partial_path))
+        self.assertEqual(self.client.get(location).status_code, 404)
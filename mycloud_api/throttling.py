@@ -0,0 +1,249 @@
+import math
+import time
+import logging
+from types import SimpleNamespace
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import ScopedRateThrottle, SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# Keys each worker remembers locally (refused buckets, expiry refreshes) before pruning
+LOCAL_MAX_KEYS = 10000
+
+# Per-process memory of the shared buckets: key -> ms until which it is empty,
+# key -> ms of the last refresh of its expiry in the cache
+_refused_until = {}
+_touched_at = {}
+
+
+def now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def forget_buckets():
+    """
+    Drop this worker's memory of the shared buckets, as when the cache is cleared.
+    """
+    _refused_until.clear()
+    _touched_at.clear()
+
+
+def _remember(entries, key, value, now):
+    if len(entries) >= LOCAL_MAX_KEYS:
+        for stale in [k for k, v in entries.items() if v <= now]:
+            del entries[stale]
+        if len(entries) >= LOCAL_MAX_KEYS:
+            entries.clear()
+    entries[key] = value
+
+
+class TokenBucket:
+    """
+    Token bucket holding ``capacity`` tokens and refilled with ``capacity``
+    tokens per ``period`` seconds, shared by every worker through the cache.
+
+    The cache keeps one integer per bucket: the time (in ms) at which the
+    bucket will be full again (the generic cell rate algorithm). Taking a token
+    is then a single atomic increment of that time by the refill interval; a
+    token is available while it stays within one full bucket of now. Workers
+    remember the buckets they found empty and refuse further requests locally
+    until a token is due, without asking the cache.
+    """
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.interval = max(1, round(period * 1000 / capacity))  # ms to refill one token
+        self.window = self.interval * capacity  # ms to refill the whole bucket
+        # Keys outlive the time the bucket takes to fill up, refreshed every half window
+        self.timeout = math.ceil(self.window * 2 / 1000)
+
+    def take(self, key):
+        """
+        Take a token from the bucket ``key``. Returns the bucket's state:
+        ``allowed``, ``remaining`` tokens, seconds until it is ``full`` again
+        and, when refused, seconds to ``wait`` for the next token.
+        """
+        now = now_ms()
+        refused_until = _refused_until.get(key)
+        if refused_until is not None and refused_until > now:
+            return self.state(False, refused_until + self.window - self.interval, now)
+
+        full_at = self.increment(key, now)
+        if full_at - now > self.window:
+            # Empty: give the token back so refused requests do not push the refill further
+            try:
+                cache.decr(key, self.interval)
+            except ValueError:
+                pass  # Expired meanwhile: the bucket is full again anyway
+            full_at -= self.interval
+            _remember(_refused_until, key, full_at - self.window + self.interval, now)
+            self.refresh(key, now)
+            return self.state(False, full_at, now)
+
+        if now - _touched_at.get(key, 0) > self.window // 2:
+            self.refresh(key, now)
+        return self.state(True, full_at, now)
+
+    def increment(self, key, now):
+        """
+        Add one token's interval to the time the bucket is full again; returns the new time.
+        """
+        if cache.add(key, now + self.interval, self.timeout):
+            _remember(_touched_at, key, now, now)
+            return now + self.interval
+        try:
+            full_at = cache.incr(key, self.interval)
+        except ValueError:  # Expired since add()
+            cache.set(key, now + self.interval, self.timeout)
+            _remember(_touched_at, key, now, now)
+            return now + self.interval
+        if full_at - self.interval < now:
+            # The bucket filled up in the meantime: restart it from now. Concurrent
+            # requests doing the same may each get a token (at most one per worker).
+            full_at = now + self.interval
+            cache.set(key, full_at, self.timeout)
+            _remember(_touched_at, key, now, now)
+        return full_at
+
+    def refresh(self, key, now):
+        cache.touch(key, self.timeout)
+        _remember(_touched_at, key, now, now)
+
+    def state(self, allowed, full_at, now):
+        ahead = max(0, full_at - now)
+        return SimpleNamespace(
+            allowed=allowed,
+            limit=self.capacity,
+            remaining=max(0, (self.window - ahead) // self.interval),
+            full=math.ceil(ahead / 1000),
+            wait=(ahead - self.window + self.interval) / 1000 if not allowed else None,
+        )
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Throttle with the DRF rate syntax ('100/minute'), enforced as a token
+    bucket: bursts of up to 100 requests, refilled at 100 per minute. The
+    bucket state of the most limiting throttle is kept on the request for the
+    rate-limit headers.
+    """
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    @property
+    def THROTTLE_RATES(self):
+        # Looked up per request rather than at import, so overridden settings apply
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.bucket = TokenBucket(self.num_requests, self.duration)
+        self.state = self.bucket.take(self.key)
+        record_state(request, self.state)
+        if not self.state.allowed:
+            logger.warning("Request throttled (%s), retry in %.1f seconds.", self.key, self.state.wait)
+        return self.state.allowed
+
+    def wait(self):
+        return self.state.wait
+
+
+class UserThrottle(TokenBucketThrottle):
+    """
+    Limits the requests of each authenticated user.
+    """
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+class AnonThrottle(TokenBucketThrottle):
+    """
+    Limits the unauthenticated requests of each client IP.
+    """
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class ScopedThrottle(ScopedRateThrottle, TokenBucketThrottle):
+    """
+    Limits the requests to the views with a ``throttle_scope``, per user (or
+    per client IP when unauthenticated), with the rate of that scope.
+    """
+
+
+def throttle_scope(scope):
+    """
+    Set the throttle scope of a function-based view; apply it above @api_view.
+    """
+    def decorator(view):
+        view.cls.throttle_scope = scope
+        return view
+    return decorator
+
+
+def record_state(request, state):
+    request = getattr(request, '_request', request)
+    current = getattr(request, 'rate_limit', None)
+    if current is None or not state.allowed or (current.allowed and state.remaining < current.remaining):
+        request.rate_limit = state
+
+
+def check_throttles(request, scope=None):
+    """
+    Apply the default throttles (and the rate of ``scope``) to a request
+    handled outside DRF views, request.user being set. Returns the seconds to
+    wait before retrying, None when the request is allowed.
+    """
+    view = SimpleNamespace(throttle_scope=scope)
+    waits = [throttle.wait() or 0 for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+             if not throttle.allow_request(request, view)]
+    return max(waits) if waits else None
+
+
+def set_rate_limit_headers(response, state):
+    if state is None or response.status_code >= 500:
+        return response
+    response['RateLimit-Limit'] = state.limit
+    response['RateLimit-Remaining'] = state.remaining
+    response['RateLimit-Reset'] = state.full
+    if not state.allowed and 'Retry-After' not in response:
+        response['Retry-After'] = math.ceil(state.wait)
+    return response
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Add the state of the most limiting token bucket a request went through to
+    its response: RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset
+    (seconds until the bucket is full again).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return set_rate_limit_headers(response, getattr(request, 'rate_limit', None))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return set_rate_limit_headers(response, getattr(request, 'rate_limit', None))
@@ -0,0 +1,135 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cleanup import RateLimiter
+from .models import UserFile
+from .storage import COPY_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def tiering_enabled(storage):
+    """
+    Whether files of ``storage`` can be moved to a cold root.
+    """
+    return bool(getattr(storage, 'cold_location', None))
+
+
+def idle_since(cutoff):
+    """
+    Condition matching the files not accessed since ``cutoff``: downloaded
+    before it, or never downloaded and uploaded before it.
+    """
+    return Q(last_downloaded__lt=cutoff) | Q(last_downloaded__isnull=True, upload_date__lt=cutoff)
+
+
+def promote(user_file):
+    """
+    Move a file in cold storage back to the fast volume before it is read.
+    Files sharing its content (a blob) are marked as promoted with it.
+    """
+    if not user_file.cold:
+        return
+    storage, name = user_file.file.storage, user_file.file.name
+    try:
+        if storage.promote(name):
+            logger.info("Promoted '%s' from cold storage.", name)
+    except FileNotFoundError:
+        return  # Reads fall back to wherever the content is; the scan reports it if it is gone
+    UserFile.all_objects.filter(file=name, cold=True).update(cold=False)
+    user_file.cold = False
+
+
+class ColdTiering:
+    """
+    Moves the files not accessed for ``days`` days from the fast volume to the
+    storage's cold root. Candidates come from the partial indexes on
+    (last_downloaded, id) and (upload_date, id) of the files still on the fast
+    volume, walked in keyset order and handled ``batch_size`` at a time; copies
+    are paced to ``rate`` bytes per second. Content shared by several files
+    (a blob) only moves once none of them has been accessed recently.
+    """
+    def __init__(self, storage, days=None, batch_size=None, rate=None, limit=None, dry_run=False):
+        self.storage = storage
+        self.cutoff = timezone.now() - timedelta(days=settings.COLD_TIER_AFTER if days is None else days)
+        self.batch_size = batch_size or settings.COLD_TIER_BATCH_SIZE
+        rate = settings.COLD_TIER_IO_RATE if rate is None else rate
+        self.limiter = RateLimiter(rate / COPY_CHUNK_SIZE if rate else 0)
+        self.limit = limit
+        self.dry_run = dry_run
+        self.moved = self.skipped = self.bytes_moved = 0
+
+    def run(self):
+        """
+        Move every idle file, or ``limit`` of them. Returns the number of stored files moved.
+        """
+        hot = UserFile.all_objects.filter(cold=False)
+        passes = [
+            (hot.filter(last_downloaded__lt=self.cutoff), 'last_downloaded'),
+            (hot.filter(last_downloaded__isnull=True, upload_date__lt=self.cutoff), 'upload_date'),
+        ]
+        for queryset, field in passes:
+            for batch in self.batches(queryset, field):
+                self.move_batch(batch)
+                if self.limit is not None and self.moved >= self.limit:
+                    return self.moved
+        return self.moved
+
+    def batches(self, queryset, field):
+        """
+        Yield the candidates as lists of (pk, storage name, blob id) rows, in
+        (``field``, id) keyset order so each batch is one index range scan.
+        """
+        position = None
+        while True:
+            rows = queryset
+            if position is not None:
+                value, pk = position
+                rows = rows.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            rows = list(rows.exclude(file='').order_by(field, 'pk').values_list(field, 'pk', 'file', 'blob_id')
+                        [:self.batch_size])
+            if not rows:
+                return
+            position = rows[-1][:2]
+            yield [(pk, name, blob_id) for _, pk, name, blob_id in rows]
+
+    def move_batch(self, rows):
+        names = {name for _, name, _ in rows}
+        shared = {name for _, name, blob_id in rows if blob_id}
+        if shared:
+            # Content is only as idle as the most recently used file sharing it
+            names -= set(UserFile.all_objects.filter(file__in=shared).exclude(idle_since(self.cutoff))
+                         .values_list('file', flat=True))
+        if self.limit is not None:
+            names = set(sorted(names)[:self.limit - self.moved])
+        if self.dry_run:
+            self.moved += len(names)
+            return
+
+        copied = []
+        for name in sorted(names):
+            try:
+                self.bytes_moved += self.storage.copy_to_cold(name, self.limiter)
+                copied.append(name)
+            except FileNotFoundError:
+                logger.warning("File '%s' is missing on disk; left in place.", name)
+                self.skipped += 1
+
+        with transaction.atomic():
+            # Files downloaded while their content was being copied stay on the fast volume
+            rows = list(UserFile.all_objects.select_for_update().filter(file__in=copied)
+                        .values_list('file', 'last_downloaded', 'upload_date'))
+            accessed = {name for name, downloaded, uploaded in rows if (downloaded or uploaded) >= self.cutoff}
+            moved = [name for name in copied if name not in accessed]
+            UserFile.all_objects.filter(file__in=moved).update(cold=True)
+
+        for name in moved:
+            self.storage.drop_hot(name)
+        for name in accessed:
+            self.storage.drop_cold(name)
+        self.moved += len(moved)
+        self.skipped += len(accessed)
+        logger.info("Moved %s files to cold storage.", len(moved))
@@ -0,0 +1,139 @@
+import time
+import uuid
+import logging
+import threading
+import jwt
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+# User fields carried in access tokens, enough to serve most requests without the DB
+USER_CLAIMS = ('username', 'is_active', 'is_staff', 'is_superuser', 'file_storage_path')
+
+
+class RevocationList:
+    """
+    Compact in-memory list of revoked token ids (jti), kept only until the
+    tokens would have expired anyway. Revocations are also written to the
+    cache so that other workers see them.
+    """
+    def __init__(self):
+        self._revoked = {}  # jti -> expiry timestamp
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        ttl = int(expires_at - time.time())
+        if ttl <= 0:
+            return
+        self._remember(jti, expires_at)
+        cache.set(f'revoked_token:{jti}', True, timeout=ttl)
+
+    def claim(self, jti, expires_at):
+        """
+        Revoke a token unless it was revoked already, atomically across
+        workers. Returns whether this call revoked it, which lets exactly one
+        of several concurrent requests use a single-use token.
+        """
+        ttl = int(expires_at - time.time())
+        if ttl <= 0 or jti in self._revoked:
+            return False
+        if not cache.add(f'revoked_token:{jti}', True, timeout=ttl):
+            return False
+        self._remember(jti, expires_at)
+        return True
+
+    def is_revoked(self, jti):
+        """
+        Check the local list, then revocations made by other workers through the cache.
+        """
+        if jti in self._revoked:
+            return True
+        return cache.get(f'revoked_token:{jti}', False)
+
+    def _remember(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._prune()
+
+    def _prune(self):
+        now = time.time()
+        for jti in [jti for jti, expires_at in self._revoked.items() if expires_at <= now]:
+            del self._revoked[jti]
+
+
+revocation_list = RevocationList()
+
+
+def _encode(claims, token_type, ttl):
+    now = int(time.time())
+    payload = {
+        **claims,
+        'token_type': token_type,
+        'iat': now,
+        'exp': now + ttl,
+        'jti': uuid.uuid4().hex,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.SIGNED_TOKEN_ALGORITHM)
+
+
+def issue_token_pair(user):
+    """
+    Issue a short-lived access token and a refresh token for the user.
+    """
+    claims = {'user_id': user.pk, **{name: getattr(user, name) for name in USER_CLAIMS}}
+    return {
+        'access': _encode(claims, ACCESS, settings.SIGNED_TOKEN_ACCESS_TTL),
+        'refresh': _encode({'user_id': user.pk}, REFRESH, settings.SIGNED_TOKEN_REFRESH_TTL),
+    }
+
+
+def decode_token(token, token_type):
+    """
+    Verify a signed token and return its claims.
+    Raises jwt.InvalidTokenError if it is invalid, expired, revoked or of another type.
+    """
+    claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.SIGNED_TOKEN_ALGORITHM],
+                        options={'require': ['exp', 'jti']})
+    if claims.get('token_type') != token_type:
+        raise jwt.InvalidTokenError(f"Expected a {token_type} token.")
+    if revocation_list.is_revoked(claims['jti']):
+        raise jwt.InvalidTokenError("Token has been revoked.")
+    return claims
+
+
+def revoke_token(claims):
+    revocation_list.revoke(claims['jti'], claims['exp'])
+
+
+def claim_token(claims):
+    """
+    Revoke a single-use token, returning False if it was already used.
+    """
+    return revocation_list.claim(claims['jti'], claims['exp'])
+
+
+def user_from_claims(claims):
+    """
+    Build the user from access token claims without a database query. Fields
+    not carried in the token are deferred and loaded on first access.
+    Raises AuthenticationFailed if the token lacks the user claims.
+    """
+    User = get_user_model()
+    try:
+        known = {'id': claims['user_id'], **{name: claims[name] for name in USER_CLAIMS}}
+    except KeyError as e:
+        logger.error("Signed token without the %s claim.", e)
+        raise AuthenticationFailed('Invalid token.')
+    # from_db() expects the values in the model's field order
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in known]
+    return User.from_db('default', field_names, [known[name] for name in field_names])
+
+
+def looks_like_signed_token(token):
+    return token.count('.') == 2
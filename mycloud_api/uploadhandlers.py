@@ -0,0 +1,60 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class Sha256Mixin:
+    """
+    Upload handler mixin computing the SHA-256 digest of each file while its
+    chunks stream in. The digest is attached to the uploaded file as ``sha256``.
+    """
+    def new_file(self, *args, **kwargs):
+        # Set up before super(), which may raise StopFutureHandlers
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class Sha256MemoryFileUploadHandler(Sha256Mixin, MemoryFileUploadHandler):
+    """
+    MemoryFileUploadHandler that hashes small uploads held in memory.
+    """
+
+
+class Sha256TemporaryFileUploadHandler(Sha256Mixin, TemporaryFileUploadHandler):
+    """
+    TemporaryFileUploadHandler that hashes large uploads streamed to disk.
+    """
+
+
+def content_sha256(content):
+    """
+    Return the SHA-256 digest of an uploaded file, reusing the one computed by
+    the upload handlers when available.
+    """
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    Return the SHA-256 digest of a file on disk, read sequentially in chunks.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
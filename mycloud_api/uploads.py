@@ -0,0 +1,190 @@
+import os
+import uuid
+import shutil
+import logging
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.http.request import UnreadablePostError
+from django.utils import timezone
+from .models import Blob, UploadSession, UserFile
+from .quotas import check_quota
+from .uploadhandlers import file_sha256
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunks for one session are then only ordered by the offset update
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class UploadConflict(Exception):
+    """
+    Raised when a chunk does not start at the offset the server has stored.
+    """
+
+
+class UploadTooLarge(Exception):
+    """
+    Raised when a chunk would take the upload past its declared length.
+    """
+
+
+class PartialUploadFile(File):
+    """
+    Completed partial upload handed to the storage. Exposing
+    ``temporary_file_path`` lets FileSystemStorage move the file into place
+    instead of copying its content.
+    """
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def lock_partial(f):
+    """
+    Take an exclusive lock on an open partial file without waiting.
+    Returns False if another request holds it.
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def append_chunk(session, stream, offset):
+    """
+    Append the request body to the session's partial file, starting at ``offset``.
+    Only the bytes actually received are acknowledged, so an interrupted chunk
+    can be resumed from the stored offset. ``stream`` is None for an empty body.
+    No transaction is held while the body is received: writers are serialised
+    by a lock on the partial file, so a concurrent chunk gets a conflict, and
+    the offset only moves forward from the one this chunk claimed.
+    Returns the new offset.
+    """
+    os.makedirs(os.path.dirname(session.partial_path), exist_ok=True)
+    with open(session.partial_path, 'ab') as f:
+        if not lock_partial(f):
+            raise UploadConflict("Another chunk of this upload is being written.")
+        # Read under the file lock, so no other chunk can move the offset until this one is done
+        try:
+            session.offset, session.length = UploadSession.objects.values_list('offset', 'length').get(pk=session.pk)
+        except UploadSession.DoesNotExist:
+            os.remove(session.partial_path)  # Recreated by open() after the session went away
+            raise
+        if offset != session.offset:
+            raise UploadConflict(f"Upload offset is {session.offset}, got {offset}.")
+
+        # Drop bytes past the acknowledged offset left by an interrupted request
+        if f.tell() != session.offset:
+            f.truncate(session.offset)
+            f.seek(session.offset)
+        received = 0
+        chunk_size = settings.UPLOAD_CHUNK_SIZE
+        try:
+            while stream is not None:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if session.offset + received + len(chunk) > session.length:
+                    f.truncate(session.offset)
+                    raise UploadTooLarge("Chunk exceeds the declared upload length.")
+                f.write(chunk)
+                received += len(chunk)
+        except UnreadablePostError:
+            logger.warning("Upload session %s interrupted after %s bytes.", session.id, received)
+        f.flush()
+        os.fsync(f.fileno())
+
+        session.touch()
+        advanced = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+            offset=offset + received, expires_at=session.expires_at
+        )
+        if not advanced:
+            # Finalized, cancelled or expired while the chunk was received
+            session.offset = UploadSession.objects.values_list('offset', flat=True).get(pk=session.pk)
+            raise UploadConflict(f"Upload offset is {session.offset}, got {offset}.")
+        session.offset = offset + received
+    return session.offset
+
+
+def stage_partial(path):
+    """
+    Return a second name for the partial file for the storage to move into
+    place, so that the partial file itself survives until the transaction
+    creating the file commits. A hard link costs no copy; file systems
+    without hard links get a copy.
+    """
+    staged = f'{path}.{uuid.uuid4().hex}.staged'
+    try:
+        os.link(path, staged)
+    except OSError:
+        shutil.copyfile(path, staged)
+    return staged
+
+
+def discard_unreferenced(storage, name):
+    """
+    Remove a stored file written by a transaction that rolled back, unless a
+    committed file or blob uses it.
+    """
+    if UserFile.all_objects.filter(file=name).exists() or Blob.objects.filter(file=name).exists():
+        return
+    try:
+        storage.remove(name)
+        logger.info("Removed '%s' written by a failed upload finalization.", name)
+    except Exception as e:
+        logger.error("Error removing '%s' after a failed upload finalization: %s", name, str(e))
+
+
+def finalize_session(session):
+    """
+    Turn a complete upload session into a UserFile. A hard link to the partial
+    file is moved into storage, not copied, unless its content is already
+    stored as a blob. The partial file is only removed once the transaction
+    commits, so a failed finalization can be retried.
+    Raises QuotaExceeded if the file no longer fits in the owner's quota, and
+    UploadSession.DoesNotExist if the session was finalized concurrently.
+    """
+    staged_path = stage_partial(session.partial_path)
+    sha256 = file_sha256(staged_path) if settings.BLOB_DEDUPLICATION else None
+    stored = None
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().select_related('owner').get(pk=session.pk)
+            check_quota(session.owner, session.length, lock=True)
+            file_instance = UserFile(
+                owner=session.owner,
+                original_filename=session.original_filename,
+                size=session.length,
+                comment=session.comment or ''
+            )
+            with PartialUploadFile(open(staged_path, 'rb'), name=session.original_filename) as partial:
+                file_instance.set_content(partial, sha256)
+            stored = file_instance.file
+            file_instance.save()
+            session.delete()
+    except BaseException:
+        if stored:
+            discard_unreferenced(stored.storage, stored.name)
+        raise
+    finally:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+    logger.info("Upload session %s finalized into file '%s'.", session.id, file_instance.original_filename)
+    return file_instance
+
+
+def purge_expired_sessions(owner=None):
+    """
+    Delete expired upload sessions (and, through post_delete, their partial files).
+    Returns the number of sessions removed.
+    """
+    sessions = UploadSession.objects.filter(expires_at__lt=timezone.now())
+    if owner is not None:
+        sessions = sessions.filter(owner=owner)
+    deleted, _ = sessions.delete()
+    return deleted
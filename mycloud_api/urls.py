@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, FileViewSet, login_user, register_user, download_file_by_special_link
+from . import async_views
+from .views import (
+    UserViewSet, FileViewSet, login_user, register_user, refresh_token, logout_user, download_file_by_special_link
+)
 
 # Initialize the router and register the ViewSets for User and File
 router = DefaultRouter()
@@ -12,10 +15,17 @@ urlpatterns = [
     # Auth-related paths
     path('auth/login/', login_user, name='login_user'),  # User login path
     path('auth/register/', register_user, name='register_user'),  # User registration path
+    path('auth/refresh/', refresh_token, name='refresh_token'),  # Signed token refresh path
+    path('auth/logout/', logout_user, name='logout_user'),  # Signed token revocation path
 
     # Download file by special link
     path('download/<str:special_link>/', download_file_by_special_link, name='download_file'),  # File download path using special link
 
+    # Async (ASGI) variants of the file listing and download endpoints
+    path('async/files/', async_views.list_files, name='async_list_files'),
+    path('async/files/<int:pk>/download_file/', async_views.download_file, name='async_download_file'),
+    path('async/download/<str:special_link>/', async_views.download_file_by_special_link, name='async_download_by_link'),
+
     # Include the router URLs for the 'users' and 'files' endpoints
     path('', include(router.urls)),  # This will automatically include routes like /users/ and /files/
 ]
@@ -1,8 +1,16 @@
-import os
+import jwt
 import logging
+from datetime import timedelta
+from django.conf import settings
 from django.utils import timezone
-from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import http_date
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, permissions, status
+from rest_framework.filters import OrderingFilter
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view
@@ -10,9 +18,28 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
-from .models import UserFile, UserProfile
+from .models import Blob, UserFile, UserProfile, UploadSession
+from .pagination import KeysetPagination
 from .permissions import IsOwnerOrReadOnly
-from .serializers import UserSerializer, FileSerializer
+from .authentication import NoExpirationTokenAuthentication
+from .accounting import record_download
+from .caching import cached_data, get_version, listing_etag, listing_scope, not_modified, set_listing_headers
+from .downloads import build_download_response, set_cache_control
+from .archives import archive_response
+from .governor import DownloadsBusy, governed_download
+from .batch import apply_batch
+from .search import FileSearchFilter
+from .quotas import QuotaExceeded, check_content_length, check_quota
+from .previews import RETRY_AFTER, PreviewUnavailable, preview_cache, preview_response, preview_width
+from .uploadhandlers import content_sha256
+from .uploads import UploadConflict, UploadTooLarge, append_chunk, finalize_session, purge_expired_sessions
+from .throttling import throttle_scope
+from .tokens import (
+    ACCESS, REFRESH, claim_token, decode_token, issue_token_pair, looks_like_signed_token, revoke_token
+)
+from .serializers import (
+    MAX_ARCHIVE_FILES, MAX_BATCH_OPERATIONS, UserSerializer, FileSerializer, UploadPreflightSerializer, UploadSessionSerializer
+)
 
 logger = logging.getLogger(__name__)
 
@@ -29,13 +56,8 @@ class CustomAuthentication(permissions.BasePermission):
         if token_key is None:
             return False
 
-        # Extract token from "Authorization" header
-        try:
-            token = Token.objects.get(key=token_key.split(" ")[1])
-            request.user = token.user  # Assign user from the token
-        except Token.DoesNotExist:
-            request.user = None
-        return True
+        # The user was already resolved from the token by the authentication class
+        return bool(request.user and request.user.is_authenticated)
 
 # User ViewSet with token check
 class UserViewSet(viewsets.ModelViewSet):
@@ -66,23 +88,53 @@ class UserViewSet(viewsets.ModelViewSet):
     def list(self, request, *args, **kwargs):
         raise PermissionDenied("Access denied. You cannot view the user list.")
 
+def files_for_user(user, query_params, trashed=False):
+    """
+    Files visible to a user: their own, or for a superuser all files,
+    optionally narrowed to one owner with the 'user_id' query parameter.
+    With ``trashed``, the files in the trash instead.
+    """
+    files = UserFile.all_objects.filter(deleted_at__isnull=False) if trashed else UserFile.objects.all()
+    if user.is_superuser:
+        user_id = query_params.get('user_id', None)
+        if user_id:
+            return files.filter(owner_id=user_id)
+        return files
+    return files.filter(owner=user)
+
 # File management with token check
 class FileViewSet(viewsets.ModelViewSet):
     serializer_class = FileSerializer
     permission_classes = [CustomAuthentication, IsOwnerOrReadOnly]  # Prevent unauthorized access
+    pagination_class = KeysetPagination  # Cursor pages keyed on (ordering field, id)
 
+    filter_backends = [DjangoFilterBackend, FileSearchFilter, OrderingFilter]  # Indexed, ranked search on names and comments with ?q=
     filterset_fields = ['owner', 'original_filename', 'upload_date', 'last_downloaded', 'comment']
-    search_fields = ['owner', 'original_filename', 'upload_date', 'last_downloaded', 'comment']
     ordering_fields = ['id', 'owner', 'original_filename', 'size', 'upload_date', 'last_downloaded', 'comment']
+    listing_actions = ('list', 'my_files', 'trash')  # Throttled with the 'listing' rate
+
+    @property
+    def throttle_scope(self):
+        return 'listing' if self.action in self.listing_actions else None
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser:
-            user_id = self.request.query_params.get('user_id', None)
-            if user_id:
-                return UserFile.objects.filter(owner_id=user_id)
-            return UserFile.objects.all()
-        return UserFile.objects.filter(owner=user)
+        return files_for_user(self.request.user, self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        scope = listing_scope(request.user, request.query_params)
+        view = super().list
+        return self._cached_response(request, 'list', scope, lambda: view(request, *args, **kwargs).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Look the file up first: a missing or foreign file is a 404, never a 304
+        instance = self.get_object()
+        scope = listing_scope(request.user, request.query_params)
+        return self._cached_response(request, 'detail', scope, lambda: self.get_serializer(instance).data,
+                                     key=instance.pk)
+
+    def create(self, request, *args, **kwargs):
+        check_content_length(request)  # Before the body is parsed and written to disk
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         try:
@@ -92,31 +144,70 @@ class FileViewSet(viewsets.ModelViewSet):
             size = file_obj.size
             user = self.request.user
 
-            file_instance = UserFile(
-                owner=user,
-                original_filename=original_name,
-                size=size,
-                comment=self.request.data.get('comment', '')
-            )
-            file_instance.file = file_obj  # Store file in the FileField
-            file_instance.save()
+            with transaction.atomic():
+                check_quota(user, size, lock=True)
+                file_instance = UserFile(
+                    owner=user,
+                    original_filename=original_name,
+                    size=size,
+                    comment=self.request.data.get('comment', '')
+                )
+                file_instance.set_content(file_obj, content_sha256(file_obj))  # Store file in the FileField
+                file_instance.save()
             logger.info("File '%s' successfully uploaded by user %s.", original_name, user.username)
             return Response(FileSerializer(file_instance).data, status=status.HTTP_201_CREATED)
         except KeyError:
             logger.warning("File not found in the request.")
             return Response({"detail": "File not found."}, status=status.HTTP_400_BAD_REQUEST)
+        except QuotaExceeded:
+            raise
         except Exception as e:
             logger.error("Error during file upload: %s", str(e))
             return Response({"detail": "Error during file upload."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def perform_destroy(self, instance):
+        # Deleting moves the file to the trash; purge_trash removes it for good later
+        UserFile.objects.trash(UserFile.objects.filter(pk=instance.pk))
+        logger.info("File with ID %s moved to the trash.", instance.pk)
+
+    @action(detail=False, methods=['get', 'delete'], permission_classes=[CustomAuthentication])
+    def trash(self, request):
+        """
+        GET lists the files in the trash; DELETE empties it for good.
+        """
+        files = files_for_user(request.user, request.query_params, trashed=True)
+        if request.method == 'DELETE':
+            deleted = UserFile.all_objects.delete_files(files)
+            logger.info("Trash of user %s emptied: %s files deleted.", request.user.username, deleted)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        page = self.paginate_queryset(files)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=True, methods=['post'], permission_classes=[CustomAuthentication])
+    def restore(self, request, pk=None):
+        logger.debug("Request to restore file with ID %s.", pk)
+        file = get_object_or_404(files_for_user(request.user, request.query_params, trashed=True), pk=pk)
+        try:
+            UserFile.all_objects.restore(UserFile.all_objects.filter(pk=file.pk))
+        except IntegrityError:
+            return Response({"detail": "A file with this name already exists."}, status=status.HTTP_400_BAD_REQUEST)
+        file.deleted_at = None
+        logger.info("File with ID %s restored from the trash.", pk)
+        return Response(self.get_serializer(file).data)
+
     @action(detail=False, methods=['get'], permission_classes=[CustomAuthentication])
     def my_files(self, request):
         logger.debug("Requesting files of user: %s", request.user.username)
         try:
-            files = UserFile.objects.filter(owner=request.user)
-            serializer = self.get_serializer(files, many=True)
+            def build():
+                files = self.paginate_queryset(UserFile.objects.filter(owner=request.user))
+                serializer = self.get_serializer(files, many=True)
+                return self.get_paginated_response(serializer.data).data
+
+            response = self._cached_response(request, 'my_files', request.user.pk, build)
             logger.info("User %s files successfully retrieved.", request.user.username)
-            return Response(serializer.data)
+            return response
         except ValidationError as e:
             logger.error(f"Error retrieving files: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -142,11 +233,14 @@ class FileViewSet(viewsets.ModelViewSet):
         logger.debug("Request to update comment for file with ID %s.", pk)
         try:
             file = self.get_object()
-            comment = request.data.get('comment', None)
+            serializer = self.get_serializer(file, data={'comment': request.data.get('comment', None)}, partial=True)
+            if not serializer.is_valid():
+                logger.warning("Invalid comment for file with ID %s: %s", pk, serializer.errors)
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            comment = serializer.validated_data['comment']
 
             file.comment = comment
             file.save(update_fields=['comment'])
-            serializer = self.get_serializer(file)
             logger.info("File with ID %s comment updated to '%s'.", pk, comment)
             return Response(serializer.data)
         except ValidationError as e:
@@ -158,43 +252,279 @@ class FileViewSet(viewsets.ModelViewSet):
         logger.debug("Request to download file with ID %s.", pk)
         try:
             file = self.get_object()
-            response = FileResponse(open(file.file.path, 'rb'), as_attachment=True, filename=file.original_filename)
-            file.last_downloaded = timezone.now()
-            file.save()
+            response = governed_download(build_download_response, request, file, user=request.user)
+            response = set_cache_control(response, public=False)
+            record_download(request, file, response)
             logger.info("File with ID %s successfully downloaded.", pk)
             return response
         except ValidationError as e:
             logger.error("Error downloading file with ID %s: %s", pk, str(e))
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'], permission_classes=[CustomAuthentication])
+    def archive(self, request):
+        """
+        Stream a ZIP archive of the files given as ?ids=1,2,3.
+        """
+        try:
+            ids = {int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()}
+        except ValueError:
+            return Response({"detail": "'ids' must be a comma-separated list of file IDs."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({"detail": "No files selected."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_ARCHIVE_FILES:
+            return Response({"detail": f"At most {MAX_ARCHIVE_FILES} files can be archived at once."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        files = files_for_user(request.user, request.query_params).filter(pk__in=ids).select_related('owner')
+        files = list(files.order_by('owner__username', 'original_filename'))
+        if not files:
+            raise Http404("File not found.")
+        logger.debug("Archive of %s files requested by user %s.", len(files), request.user.username)
+        by_owner = len({file.owner_id for file in files}) > 1
+        # Archives take a stream slot like any other download
+        return governed_download(lambda request, _: archive_response(files, by_owner=by_owner), request, None,
+                                 user=request.user)
+
+    @action(detail=False, methods=['post'], permission_classes=[CustomAuthentication])
+    def batch(self, request):
+        """
+        Apply many operations on the user's files in one transaction:
+        {"operations": [{"op": "delete", "id": 1}, {"op": "rename", "id": 2, "new_name": "b.png"},
+                        {"op": "comment", "id": 3, "comment": "text"}]}
+        Answers with one result (status and file or error) per operation, in order.
+        """
+        operations = request.data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return Response({"detail": "A non-empty 'operations' list is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return Response({"detail": f"At most {MAX_BATCH_OPERATIONS} operations are allowed per batch."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        logger.debug("Batch of %s operations by user %s.", len(operations), request.user.username)
+        try:
+            results = apply_batch(request.user, operations, self.get_serializer_context())
+        except IntegrityError as e:
+            logger.warning("Batch by user %s conflicted with a concurrent change: %s", request.user.username, str(e))
+            return Response({"detail": "The batch conflicts with a concurrent change; nothing was applied."},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'results': results})
+
+    @action(detail=True, methods=['get'], permission_classes=[IsOwnerOrReadOnly])
+    def preview(self, request, pk=None):
+        """
+        Serve an image preview: ?size=small|medium|large or ?width=<pixels>.
+        Answers 202 while the preview is being rendered.
+        """
+        logger.debug("Request for a preview of file with ID %s.", pk)
+        file = self.get_object()
+        try:
+            width = preview_width(request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            preview = preview_cache.get(file, width)
+            if preview is not None:
+                try:
+                    return preview_response(request, preview)
+                except FileNotFoundError:
+                    # Evicted between the lookup and the read: render it again
+                    logger.debug("Preview '%s' evicted while being served.", preview.name)
+                    preview_cache.submit(file, preview, width)
+        except PreviewUnavailable as e:
+            logger.warning("No preview for file with ID %s: %s", pk, str(e))
+            return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Preview is being generated."}, status=status.HTTP_202_ACCEPTED,
+                        headers={'Retry-After': str(RETRY_AFTER), 'Cache-Control': 'no-store'})
+
+    @action(detail=False, methods=['post'], permission_classes=[CustomAuthentication])
+    def preflight(self, request):
+        """
+        Check an upload before sending its body. If the user already stores
+        the same content, the file is created right away and no upload is
+        needed. Content stored only by other users is never matched, so a
+        digest alone cannot be used to obtain someone else's file.
+        """
+        logger.debug("Upload pre-flight check by user %s.", request.user.username)
+        serializer = UploadPreflightSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            logger.warning("Upload pre-flight rejected: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        if settings.BLOB_DEDUPLICATION:
+            try:
+                with transaction.atomic():
+                    check_quota(request.user, data['size'], lock=True)
+                    blob = Blob.objects.reference(data['sha256'], data['size'], owner=request.user)
+                    if blob is not None:
+                        file_instance = UserFile(
+                            owner=request.user,
+                            original_filename=data['original_filename'],
+                            size=blob.size,
+                            comment=data.get('comment') or ''
+                        )
+                        file_instance.use_blob(blob)
+                        file_instance.save()
+            except IntegrityError:
+                logger.warning("Name conflict during pre-flight of '%s'.", data['original_filename'])
+                return Response({"detail": "A file with this name already exists."}, status=status.HTTP_400_BAD_REQUEST)
+            if blob is not None:
+                logger.info("File '%s' created from stored content for user %s.",
+                            file_instance.original_filename, request.user.username)
+                return Response({'upload_required': False, 'file': FileSerializer(file_instance).data},
+                                status=status.HTTP_201_CREATED)
+
+        check_quota(request.user, data['size'])
+        return Response({'upload_required': True})
+
+    @action(detail=False, methods=['post'], url_path='uploads', permission_classes=[CustomAuthentication])
+    def create_upload(self, request):
+        """
+        Start a resumable upload. The total size comes from the 'length' field
+        or the Upload-Length header.
+        """
+        logger.debug("Request to start a resumable upload by user %s.", request.user.username)
+        purge_expired_sessions(owner=request.user)
+
+        data = request.data.copy()
+        if 'length' not in data and 'Upload-Length' in request.headers:
+            data['length'] = request.headers['Upload-Length']
+        serializer = UploadSessionSerializer(data=data, context={'request': request})
+        if not serializer.is_valid():
+            logger.warning("Invalid upload session request: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        check_quota(request.user, serializer.validated_data['length'])
+
+        session = serializer.save(
+            owner=request.user,
+            expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+        )
+        logger.info("Upload session %s started for file '%s'.", session.id, session.original_filename)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(
+            reverse('files-upload-session', kwargs={'session_id': session.id.hex})
+        )
+        return self._upload_headers(response, session)
+
+    @action(detail=False, methods=['get', 'patch', 'delete'], url_path=r'uploads/(?P<session_id>[0-9a-f]{32})',
+            permission_classes=[CustomAuthentication])
+    def upload_session(self, request, session_id=None):
+        """
+        GET/HEAD reports the current offset, PATCH appends a chunk
+        (Content-Type: application/offset+octet-stream, Upload-Offset header),
+        DELETE cancels the upload.
+        """
+        session = self._get_upload_session(request, session_id)
+
+        if request.method == 'DELETE':
+            session.delete()
+            logger.info("Upload session %s cancelled.", session_id)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.method == 'PATCH':
+            if request.content_type.split(';')[0].strip() != 'application/offset+octet-stream':
+                return Response({"detail": "Content-Type must be application/offset+octet-stream."},
+                                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+            try:
+                offset = int(request.headers['Upload-Offset'])
+            except (KeyError, ValueError):
+                return Response({"detail": "A valid Upload-Offset header is required."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                append_chunk(session, request.stream, offset)
+            except UploadSession.DoesNotExist:
+                raise Http404("Upload session not found.")
+            except UploadConflict as e:
+                logger.warning("Upload session %s offset conflict: %s", session_id, str(e))
+                return self._upload_headers(Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT), session)
+            except UploadTooLarge as e:
+                logger.warning("Upload session %s overflow: %s", session_id, str(e))
+                return Response({"detail": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            logger.debug("Upload session %s at offset %s of %s.", session_id, session.offset, session.length)
+
+        return self._upload_headers(Response(UploadSessionSerializer(session).data), session)
+
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<session_id>[0-9a-f]{32})/finalize',
+            permission_classes=[CustomAuthentication])
+    def finalize_upload(self, request, session_id=None):
+        """
+        Turn a fully received upload session into a file.
+        """
+        session = self._get_upload_session(request, session_id)
+        if not session.is_complete:
+            return self._upload_headers(
+                Response({"detail": "Upload is not complete."}, status=status.HTTP_409_CONFLICT), session
+            )
+        if UserFile.objects.filter(owner=request.user, original_filename=session.original_filename).exists():
+            return Response({"detail": "A file with this name already exists."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            file_instance = finalize_session(session)
+        except UploadSession.DoesNotExist:
+            raise Http404("Upload session not found.")
+        except IntegrityError:
+            logger.warning("Name conflict while finalizing upload session %s.", session_id)
+            return Response({"detail": "A file with this name already exists."}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info("File '%s' successfully uploaded by user %s.", file_instance.original_filename, request.user.username)
+        return Response(FileSerializer(file_instance).data, status=status.HTTP_201_CREATED)
+
+    def _get_upload_session(self, request, session_id):
+        session = get_object_or_404(UploadSession, pk=session_id, owner=request.user)
+        if session.expires_at < timezone.now():
+            session.delete()
+            raise Http404("Upload session expired.")
+        return session
+
+    def _cached_response(self, request, kind, scope, build, key=None):
+        """
+        Serve the data of a read-only view from the per-user cache, or a 304
+        without building it when the client's ETag is current. ``key`` tells
+        apart the ETags of single files in the scope.
+        """
+        version = get_version(scope)
+        etag = listing_etag(scope, version, key)
+        response = not_modified(request, etag)
+        if response is None:
+            response = Response(cached_data(request, kind, scope, version, build))
+        return set_listing_headers(response, etag)
+
+    def _upload_headers(self, response, session):
+        response['Upload-Offset'] = session.offset
+        response['Upload-Length'] = session.length
+        response['Upload-Expires'] = http_date(session.expires_at.timestamp())
+        response['Cache-Control'] = 'no-store'
+        return response
+
 # API for downloading a file by a special link
 @api_view(['get'])
 def download_file_by_special_link(request, special_link):
     logger.debug("Request to download file by special link: %s", special_link)
     try:
         file_instance = UserFile.objects.get(special_link=special_link)
-        file_path = file_instance.file.path
-
-        if not os.path.exists(file_path):
-            logger.warning("File not found by special link: %s", special_link)
-            raise Http404("File not found.")
+        response = governed_download(build_download_response, request, file_instance, special_link=special_link)
+        response = set_cache_control(response, public=True)
+        record_download(request, file_instance, response)
 
-        file_instance.last_downloaded = timezone.now()
-        file_instance.save()
-
-        with open(file_path, 'rb') as f:
-            logger.info("File with special link '%s' successfully downloaded.", special_link)
-            response = HttpResponse(f.read(), content_type="application/octet-stream")
-            response['Content-Disposition'] = f'attachment; filename="{file_instance.original_filename}"'
-            return response
+        logger.info("File with special link '%s' successfully downloaded.", special_link)
+        return response
     except UserFile.DoesNotExist:
         logger.error("File with special link '%s' not found.", special_link)
         raise Http404("File not found.")
+    except Http404:
+        logger.warning("File not found by special link: %s", special_link)
+        raise
+    except DownloadsBusy:
+        logger.warning("Too many downloads in progress for special link: %s", special_link)
+        raise
     except Exception as e:
         logger.error("Error downloading file with special link '%s': %s", special_link, str(e))
         return Response({"detail": "Error downloading file."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # API for user login with token
+@throttle_scope('login')
 @api_view(['POST'])
 def login_user(request):
     logger.debug("Attempting user login: %s", request.data.get('username'))
@@ -205,11 +535,54 @@ def login_user(request):
     if user is not None:
         token, created = Token.objects.get_or_create(user=user)
         logger.info("User '%s' logged in successfully.", username)
-        return Response({'token': token.key, 'username': user.username, 'email': user.email}, status=status.HTTP_200_OK)
+        return Response({'token': token.key, **issue_token_pair(user), 'username': user.username, 'email': user.email},
+                        status=status.HTTP_200_OK)
     logger.error("Invalid credentials")
     return Response({'detail': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
+# API for exchanging a refresh token for a new token pair
+@api_view(['POST'])
+def refresh_token(request):
+    logger.debug("Refreshing signed tokens.")
+    try:
+        claims = decode_token(request.data.get('refresh', ''), REFRESH)
+    except jwt.InvalidTokenError as e:
+        logger.warning("Invalid refresh token: %s", str(e))
+        return Response({'detail': 'Invalid or expired refresh token.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    user = User.objects.filter(pk=claims['user_id'], is_active=True).first()
+    if user is None:
+        logger.warning("Refresh token for inactive or deleted user %s.", claims['user_id'])
+        return Response({'detail': 'User inactive or deleted.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    # Refresh tokens are single-use: rotate on every refresh. The token is
+    # claimed atomically, so concurrent requests with it get one new pair
+    if not claim_token(claims):
+        logger.warning("Refresh token reused for user '%s'.", user.username)
+        return Response({'detail': 'Invalid or expired refresh token.'}, status=status.HTTP_401_UNAUTHORIZED)
+    logger.info("Signed tokens refreshed for user '%s'.", user.username)
+    return Response(issue_token_pair(user), status=status.HTTP_200_OK)
+
+# API for revoking signed tokens on logout; the refresh token itself
+# authenticates the request, so it works once the access token has expired
+@api_view(['POST'])
+def logout_user(request):
+    logger.debug("Revoking signed tokens.")
+    access = NoExpirationTokenAuthentication().get_header_token(request)
+    revoked = 0
+    for token, token_type in ((request.data.get('refresh'), REFRESH), (access, ACCESS)):
+        if isinstance(token, str) and looks_like_signed_token(token):
+            try:
+                revoke_token(decode_token(token, token_type))
+                revoked += 1
+            except jwt.InvalidTokenError:
+                pass  # Already expired or revoked
+    if not revoked:
+        return Response({'detail': 'Invalid or expired token.'}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
 # API for user registration with token
+@throttle_scope('register')
 @api_view(['POST'])
 def register_user(request):
     logger.debug("Registering new user: %s", request.data.get('username'))
@@ -231,7 +604,7 @@ def register_user(request):
         # Create a token for the new user
         token, created = Token.objects.get_or_create(user=user)
         logger.info("Token for user created successfully")
-        return Response({'token': token.key, **serializer.data}, status=status.HTTP_201_CREATED)
+        return Response({'token': token.key, **issue_token_pair(user), **serializer.data}, status=status.HTTP_201_CREATED)
 
     # Return validation error
     logger.error("Validation error: %s", serializer.errors)